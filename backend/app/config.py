@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import os
+
+@dataclass(frozen=True)
+class Settings:
+    """应用配置"""
+    
+    database_url: str = "sqlite:///./phd_application.db"
+    # 启动时是否创建缺失的表和全文检索索引
+    create_schema: bool = True
+    cors_origins: Tuple[str, ...] = ("*",)
+    deepseek_api_key: Optional[str] = None
+    smtp_server: str = "smtp.gmail.com"
+    smtp_port: int = 587
+    smtp_user: Optional[str] = None
+    smtp_password: Optional[str] = None
+    # 加密保存发信账户密码的Fernet密钥，所有工作进程需要使用相同的值
+    credential_key: Optional[str] = None
+    # 访问令牌的签名密钥，所有工作进程需要使用相同的值；为空时每个进程生成随机密钥
+    jwt_secret: Optional[str] = None
+    access_token_minutes: int = 60 * 24
+    # 令牌校验结果在进程内的缓存时间（秒），为0时每个请求都解码令牌并查询用户
+    auth_cache_seconds: float = 60.0
+    # 不小于此大小（字节）的响应按Accept-Encoding压缩（gzip，安装brotli后优先br），为0时不压缩
+    compression_min_size: int = 1024
+    # 学校/导师缓存的容量（条），为0时不缓存；其他工作进程的修改最多延迟entity_cache_sync_seconds秒可见
+    entity_cache_size: int = 4096
+    entity_cache_sync_seconds: float = 1.0
+    # 提取上传文档文本的工作进程数
+    extraction_workers: int = 2
+    # 后台同步收件箱的轮询间隔（秒），服务器支持IDLE时为一次IDLE的最长时间；为0时不在后台同步。
+    # 多个工作进程时只应在一个进程中开启
+    imap_sync_interval: float = 0.0
+    imap_mailbox: str = "INBOX"
+    # 是否启用限流；令牌桶保存在进程内存（memory）或数据库（database，多进程共享）中
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "memory"
+    # 对默认限流规则的修改（JSON），见services/rate_limiter.py
+    rate_limit_rules: Optional[str] = None
+    # 请求头X-Query-Profile携带此令牌时记录该请求的SQL查询，为空则不允许开启
+    query_profiler_token: Optional[str] = None
+    # 慢查询阈值（毫秒）及慢查询日志文件，文件为空时只输出到日志系统
+    slow_query_ms: Optional[float] = 200.0
+    slow_query_log: Optional[str] = None
+    # 查询分析报告的日志文件，为空时输出到标准错误
+    query_profile_log: Optional[str] = None
+    
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """从环境变量读取配置，未设置的项使用默认值"""
+        return cls(
+            database_url=os.getenv("DATABASE_URL", cls.database_url),
+            create_schema=os.getenv("CREATE_SCHEMA", "1").lower() not in ("0", "false", "no"),
+            cors_origins=tuple(
+                origin.strip() for origin in os.getenv("CORS_ORIGINS", "*").split(",") if origin.strip()
+            ),
+            deepseek_api_key=os.getenv("DEEPSEEK_API_KEY"),
+            smtp_server=os.getenv("SMTP_SERVER", cls.smtp_server),
+            smtp_port=int(os.getenv("SMTP_PORT", cls.smtp_port)),
+            smtp_user=os.getenv("SMTP_USER"),
+            smtp_password=os.getenv("SMTP_PASSWORD"),
+            credential_key=os.getenv("CREDENTIAL_KEY") or None,
+            jwt_secret=os.getenv("JWT_SECRET") or None,
+            access_token_minutes=int(os.getenv("ACCESS_TOKEN_MINUTES", cls.access_token_minutes)),
+            auth_cache_seconds=float(os.getenv("AUTH_CACHE_SECONDS", cls.auth_cache_seconds)),
+            compression_min_size=int(os.getenv("COMPRESSION_MIN_SIZE", cls.compression_min_size)),
+            entity_cache_size=int(os.getenv("ENTITY_CACHE_SIZE", cls.entity_cache_size)),
+            entity_cache_sync_seconds=float(os.getenv("ENTITY_CACHE_SYNC_SECONDS", cls.entity_cache_sync_seconds)),
+            extraction_workers=int(os.getenv("EXTRACTION_WORKERS", cls.extraction_workers)),
+            imap_sync_interval=float(os.getenv("IMAP_SYNC_INTERVAL", cls.imap_sync_interval)),
+            imap_mailbox=os.getenv("IMAP_MAILBOX", cls.imap_mailbox),
+            rate_limit_enabled=os.getenv("RATE_LIMIT_ENABLED", "1").lower() not in ("0", "false", "no"),
+            rate_limit_backend=os.getenv("RATE_LIMIT_BACKEND", cls.rate_limit_backend),
+            rate_limit_rules=os.getenv("RATE_LIMIT_RULES") or None,
+            query_profiler_token=os.getenv("QUERY_PROFILER_TOKEN") or None,
+            slow_query_ms=float(os.getenv("SLOW_QUERY_MS", cls.slow_query_ms)),
+            slow_query_log=os.getenv("SLOW_QUERY_LOG") or None,
+            query_profile_log=os.getenv("QUERY_PROFILE_LOG") or None,
+        )
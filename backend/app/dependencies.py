@@ -0,0 +1,141 @@
+from typing import Any, Callable, Iterator
+import threading
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.orm import Session
+
+from .config import Settings
+from ..models import schemas
+from ..services import crud
+from ..services.email_service import EmailService
+from ..services.notification_service import MobileNotificationService, NotificationService
+
+# 服务实例在第一次被请求使用时创建并保存在app.state上，
+# 较重的依赖（requests、numpy/scipy）因此不会拖慢进程启动
+
+_service_lock = threading.Lock()
+
+def _get_service(request: Request, name: str, factory: Callable[[Settings], Any]) -> Any:
+    return _get_state_service(request.app.state, name, factory)
+
+def _get_state_service(state: Any, name: str, factory: Callable[[Settings], Any]) -> Any:
+    service = getattr(state, name, None)
+    if service is None:
+        with _service_lock:
+            service = getattr(state, name, None)
+            if service is None:
+                service = factory(state.settings)
+                setattr(state, name, service)
+    return service
+
+def get_settings(request: Request) -> Settings:
+    return request.app.state.settings
+
+def get_db(request: Request) -> Iterator[Session]:
+    db = request.app.state.session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+
+def get_auth_service(request: Request):
+    return auth_service_for(request.app.state)
+
+def auth_service_for(state: Any):
+    """应用的认证服务，供没有Request对象的中间件使用"""
+    from ..services.auth_service import AuthService
+    return _get_state_service(
+        state, "auth_service",
+        lambda settings: AuthService(
+            secret_key=settings.jwt_secret,
+            token_minutes=settings.access_token_minutes,
+            cache_ttl=settings.auth_cache_seconds
+        )
+    )
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+    auth=Depends(get_auth_service)
+) -> schemas.User:
+    # 会话在第一次查询时才取得连接，令牌校验命中缓存时不会访问数据库
+    def load_user(user_id: int):
+        db_user = crud.get_user(db, user_id)
+        return schemas.User.model_validate(db_user) if db_user else None
+
+    user = auth.verify_token(token, load_user)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+def get_info_service(request: Request):
+    from ..services.information_retrieval import InformationRetrievalService
+    return _get_service(
+        request, "info_service",
+        lambda settings: InformationRetrievalService(api_key=settings.deepseek_api_key)
+    )
+
+def get_email_service(request: Request) -> EmailService:
+    return _get_service(
+        request, "email_service",
+        lambda settings: EmailService(
+            smtp_server=settings.smtp_server,
+            smtp_port=settings.smtp_port,
+            username=settings.smtp_user,
+            password=settings.smtp_password
+        )
+    )
+
+def get_credential_store(request: Request):
+    from ..services.credential_store import CredentialStore
+    return _get_service(request, "credential_store", lambda settings: CredentialStore(settings.credential_key))
+
+def get_notification_service(request: Request) -> NotificationService:
+    return _get_service(request, "notification_service", lambda settings: NotificationService())
+
+def get_mobile_notification_service(request: Request) -> MobileNotificationService:
+    return _get_service(request, "mobile_notification_service", lambda settings: MobileNotificationService())
+
+def get_ingest_service(request: Request):
+    from ..services.ingest_service import IngestService
+    session_factory = request.app.state.session_factory
+    return _get_service(request, "ingest_service", lambda settings: IngestService(session_factory))
+
+def get_extraction_service(request: Request):
+    return extraction_service_for(request.app.state)
+
+def extraction_service_for(state: Any):
+    """应用的文本提取服务，应用启动时重新提交未完成的提取也使用此函数"""
+    from ..services.extraction_service import DocumentExtractionService
+    session_factory = state.session_factory
+    return _get_state_service(
+        state, "extraction_service",
+        lambda settings: DocumentExtractionService(session_factory, max_workers=settings.extraction_workers)
+    )
+
+def create_imap_sync_service(state: Any):
+    """创建收件箱同步服务，应用启动时开启后台同步也使用此函数"""
+    from ..services.credential_store import CredentialStore
+    from ..services.imap_sync import ImapSyncService
+    settings = state.settings
+    return ImapSyncService(
+        state.session_factory,
+        CredentialStore(settings.credential_key),
+        mailbox=settings.imap_mailbox,
+        interval=settings.imap_sync_interval
+    )
+
+def get_imap_sync_service(request: Request):
+    return _get_service(request, "imap_sync_service", lambda settings: create_imap_sync_service(request.app.state))
+
+def get_professor_matcher(request: Request):
+    # 索引中的变更游标属于应用所用的数据库，每个应用各有一个匹配引擎
+    from ..services.matching_service import ProfessorMatcher
+    return _get_service(request, "professor_matcher", lambda settings: ProfessorMatcher())
@@ -1,159 +1,501 @@
-from fastapi import Depends, FastAPI, HTTPException, status, File, UploadFile, Form, Query, Body
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, status, File, UploadFile, Form, Query, Body, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Callable, List, Optional, Tuple
+import hashlib
+import imaplib
 import os
-from datetime import datetime
-import sys
-
-# 修改导入方式
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from database.database import engine, Base, get_db
-from models import models, schemas
-from services import crud, information_retrieval, email_service, notification_service
-
-# 创建数据库表
-models.Base.metadata.create_all(bind=engine)
-
-# 创建FastAPI应用
-app = FastAPI(
-    title="PhD Application Manager",
-    description="博士申请管理系统API",
-    version="1.0.0"
+import tempfile
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from .config import Settings
+from .middleware import CompressionMiddleware, MetricsMiddleware, QueryProfilerMiddleware, RateLimitMiddleware
+from .dependencies import (
+    get_db, get_info_service, get_email_service, get_notification_service,
+    get_mobile_notification_service, get_professor_matcher, get_ingest_service,
+    get_credential_store, get_auth_service, get_current_user, get_extraction_service,
+    get_imap_sync_service, create_imap_sync_service, auth_service_for, extraction_service_for
 )
-
-# 添加CORS中间件
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 在生产环境中应该设置为特定的源
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from ..database.database import create_db_engine
+from ..database.schema import create_schema
+from ..models import models, schemas
+from ..services import (
+    archive_service, calendar_service, change_feed, crud, dashboard_service, dedupe_service, export_service, search_service
 )
-
-# 创建服务实例
-info_service = information_retrieval.InformationRetrievalService()
-email_svc = email_service.EmailService()
-notification_svc = notification_service.NotificationService()
+from ..services.email_service import EmailService
+from ..services.notification_service import MobileNotificationService, NotificationService
+from ..services.entity_cache import SESSION_INFO_KEY, EntityCache
+from ..services.response_cache import ResponseCache, make_etag, etag_matches
+from ..services.compression import compress, negotiate_encoding
+from ..services.serialization import dump_rows, pick_columns
+from ..services.text_extraction import is_supported
+from ..services.metrics import REGISTRY, instrument_engine
+from ..services.query_profiler import configure_logging, install_query_profiler
+from ..services.rate_limiter import DatabaseRateLimitBackend, MemoryRateLimitBackend, RateLimiter, load_rules
+
+router = APIRouter()
+
+def json_response(body: bytes, headers: Optional[dict] = None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def sparse_fields(columns) -> Callable[..., Optional[Tuple[str, ...]]]:
+    """
+    生成解析fields查询参数的依赖，例如?fields=id,title只返回这两个字段，其余的列不会被查询
+
+    Args:
+        columns: 列表接口可以返回的列
+
+    Returns:
+        依赖函数，返回请求的字段名，未指定时为None
+    """
+    def dependency(
+        fields: Optional[str] = Query(None, description="只返回这些字段，逗号分隔，id总是返回")
+    ) -> Optional[Tuple[str, ...]]:
+        if not fields:
+            return None
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        try:
+            return tuple(column.name for column in pick_columns(columns, names))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return dependency
+
+def cached_list_response(request: Request, db: Session, user_id: int, entity: str, load: Callable[[], bytes]) -> Response:
+    """
+    返回支持条件请求的列表响应
+    ETag由用户、数据版本和查询参数决定，客户端携带相同的If-None-Match时直接返回304，
+    否则优先使用缓存的响应体，只有该用户的数据发生写入后才重新查询和序列化。
+    压缩后的响应体同样缓存，命中时不需要重新压缩。
+    版本号来自数据库中的变更日志，多个工作进程生成的ETag一致。
+    响应体是否压缩取决于Accept-Encoding，所以总是带Vary: Accept-Encoding；
+    客户端接受压缩时使用弱ETag（与CompressionMiddleware一致），304与200的ETag形式相同
+    """
+    version = change_feed.entity_version(db, user_id, entity)
+    key = (user_id, request.url.path, tuple(sorted(request.query_params.multi_items())))
+    min_size = request.app.state.settings.compression_min_size
+    encoding = negotiate_encoding(request.headers.get("accept-encoding")) if min_size > 0 else None
+    etag = make_etag(entity, version, key)
+    headers = {"ETag": "W/" + etag if encoding else etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response_cache = request.app.state.response_cache
+    body = response_cache.get((key, encoding), version) if encoding else None
+    if body is None:
+        body = response_cache.get((key, None), version)
+        if body is None:
+            body = load()
+            response_cache.set((key, None), version, body)
+        if encoding and len(body) >= min_size:
+            body = compress(body, encoding)
+            response_cache.set((key, encoding), version, body)
+        else:
+            encoding = None
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return json_response(body, headers=headers)
 
 # 根路由
-@app.get("/", tags=["Root"])
+@router.get("/", tags=["Root"])
 def read_root():
     return {"message": "欢迎使用博士申请管理系统API"}
 
+# 认证相关路由
+@router.post("/auth/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED, tags=["Auth"])
+def register_user(user: schemas.UserCreate, db: Session = Depends(get_db), auth=Depends(get_auth_service)):
+    try:
+        db_user = crud.create_user(db, email=user.email, hashed_password=auth.hash_password(user.password))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 第一位注册的用户接管按用户分区之前创建的数据
+    if crud.count_users(db) == 1:
+        crud.assign_unowned_rows(db, db_user.id)
+    return db_user
+
+@router.post("/auth/token", response_model=schemas.Token, tags=["Auth"])
+def login(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db), auth=Depends(get_auth_service)):
+    db_user = crud.get_user_by_email(db, form.username)
+    if db_user is None or not db_user.is_active or not auth.verify_password(form.password, db_user.hashed_password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect email or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    token, expires_in = auth.create_access_token(db_user.id)
+    return {"access_token": token, "token_type": "bearer", "expires_in": expires_in}
+
+@router.get("/auth/me", response_model=schemas.User, tags=["Auth"])
+def read_current_user(user: schemas.User = Depends(get_current_user)):
+    return user
+
 # 学校相关路由
-@app.post("/schools/", response_model=schemas.School, tags=["Schools"])
-def create_school(school: schemas.SchoolCreate, db: Session = Depends(get_db)):
-    return crud.create_school(db=db, school=school)
-
-@app.get("/schools/", response_model=List[schemas.School], tags=["Schools"])
-def read_schools(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    schools = crud.get_schools(db, skip=skip, limit=limit)
-    return schools
-
-@app.get("/schools/{school_id}", response_model=schemas.School, tags=["Schools"])
-def read_school(school_id: int, db: Session = Depends(get_db)):
-    db_school = crud.get_school(db, school_id=school_id)
+@router.post("/schools/", response_model=schemas.School, tags=["Schools"])
+def create_school(school: schemas.SchoolCreate, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    return crud.create_school(db=db, user_id=user.id, school=school)
+
+@router.get("/schools/", response_model=List[schemas.School], tags=["Schools"])
+def read_schools(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields(crud.SCHOOL_COLUMNS)),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return cached_list_response(
+        request, db, user.id, "school",
+        lambda: dump_rows(crud.get_school_rows(db, user.id, skip=skip, limit=limit, fields=fields))
+    )
+
+def _find_duplicates(db: Session, user_id: int, entity: str, threshold: float, limit: int):
+    return [candidate._asdict() for candidate in dedupe_service.find_duplicates(db, user_id, entity, threshold=threshold, limit=limit)]
+
+def _merge_duplicates(db: Session, user_id: int, entity: str, merge: schemas.MergeRequest):
+    try:
+        return crud.merge_duplicates(db, user_id, entity, target_id=merge.target_id, source_ids=merge.source_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+# 重复检测的路由需要在/schools/{school_id}之前声明
+@router.get("/schools/duplicates", response_model=List[schemas.DuplicateCandidate], tags=["Schools"])
+def read_duplicate_schools(
+    threshold: float = Query(dedupe_service.DEFAULT_THRESHOLD, ge=dedupe_service.MIN_SIMILARITY, le=1.0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return _find_duplicates(db, user.id, "school", threshold, limit)
+
+@router.post("/schools/merge", response_model=schemas.MergeResult, tags=["Schools"])
+def merge_schools(merge: schemas.MergeRequest, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    return _merge_duplicates(db, user.id, "school", merge)
+
+@router.get("/schools/{school_id}", response_model=schemas.School, tags=["Schools"])
+def read_school(school_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    db_school = crud.get_school(db, user.id, school_id=school_id)
     if db_school is None:
         raise HTTPException(status_code=404, detail="School not found")
     return db_school
 
-@app.put("/schools/{school_id}", response_model=schemas.School, tags=["Schools"])
-def update_school(school_id: int, school_data: dict, db: Session = Depends(get_db)):
-    db_school = crud.update_school(db, school_id=school_id, school_data=school_data)
+@router.put("/schools/{school_id}", response_model=schemas.School, tags=["Schools"])
+def update_school(school_id: int, school_data: dict, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    db_school = crud.update_school(db, user.id, school_id=school_id, school_data=school_data)
     if db_school is None:
         raise HTTPException(status_code=404, detail="School not found")
     return db_school
 
-@app.delete("/schools/{school_id}", tags=["Schools"])
-def delete_school(school_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_school(db, school_id=school_id)
+@router.delete("/schools/{school_id}", tags=["Schools"])
+def delete_school(school_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    success = crud.delete_school(db, user.id, school_id=school_id)
     if not success:
         raise HTTPException(status_code=404, detail="School not found")
     return {"detail": "School deleted successfully"}
 
 # 导师相关路由
-@app.post("/professors/", response_model=schemas.Professor, tags=["Professors"])
-def create_professor(professor: schemas.ProfessorCreate, db: Session = Depends(get_db)):
-    return crud.create_professor(db=db, professor=professor)
-
-@app.get("/professors/", response_model=List[schemas.Professor], tags=["Professors"])
-def read_professors(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    professors = crud.get_professors(db, skip=skip, limit=limit)
-    return professors
-
-@app.get("/professors/{professor_id}", response_model=schemas.Professor, tags=["Professors"])
-def read_professor(professor_id: int, db: Session = Depends(get_db)):
-    db_professor = crud.get_professor(db, professor_id=professor_id)
+@router.post("/professors/", response_model=schemas.Professor, tags=["Professors"])
+def create_professor(professor: schemas.ProfessorCreate, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    return crud.create_professor(db=db, user_id=user.id, professor=professor)
+
+@router.get("/professors/", response_model=List[schemas.Professor], tags=["Professors"])
+def read_professors(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields(crud.PROFESSOR_COLUMNS)),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return cached_list_response(
+        request, db, user.id, "professor",
+        lambda: dump_rows(crud.get_professor_rows(db, user.id, skip=skip, limit=limit, fields=fields))
+    )
+
+@router.post("/professors/match", response_model=List[schemas.ProfessorMatch], tags=["Professors"])
+def match_professors(
+    query: schemas.ProfessorMatchQuery,
+    db: Session = Depends(get_db),
+    professor_matcher=Depends(get_professor_matcher),
+    user: schemas.User = Depends(get_current_user)
+):
+    matches = professor_matcher.top_k(db, user.id, profile=query.profile, k=query.top_k)
+    professors = {p.id: p for p in crud.get_professors_by_ids(db, user.id, [professor_id for professor_id, _ in matches])}
+    return [
+        {"professor": professors[professor_id], "score": score}
+        for professor_id, score in matches
+        if professor_id in professors
+    ]
+
+@router.get("/professors/duplicates", response_model=List[schemas.DuplicateCandidate], tags=["Professors"])
+def read_duplicate_professors(
+    threshold: float = Query(dedupe_service.DEFAULT_THRESHOLD, ge=dedupe_service.MIN_SIMILARITY, le=1.0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return _find_duplicates(db, user.id, "professor", threshold, limit)
+
+@router.post("/professors/merge", response_model=schemas.MergeResult, tags=["Professors"])
+def merge_professors(merge: schemas.MergeRequest, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    return _merge_duplicates(db, user.id, "professor", merge)
+
+@router.get("/professors/{professor_id}", response_model=schemas.Professor, tags=["Professors"])
+def read_professor(professor_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    db_professor = crud.get_professor(db, user.id, professor_id=professor_id)
     if db_professor is None:
         raise HTTPException(status_code=404, detail="Professor not found")
     return db_professor
 
-@app.put("/professors/{professor_id}", response_model=schemas.Professor, tags=["Professors"])
-def update_professor(professor_id: int, professor_data: dict, db: Session = Depends(get_db)):
-    db_professor = crud.update_professor(db, professor_id=professor_id, professor_data=professor_data)
+@router.put("/professors/{professor_id}", response_model=schemas.Professor, tags=["Professors"])
+def update_professor(professor_id: int, professor_data: dict, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    db_professor = crud.update_professor(db, user.id, professor_id=professor_id, professor_data=professor_data)
     if db_professor is None:
         raise HTTPException(status_code=404, detail="Professor not found")
     return db_professor
 
-@app.delete("/professors/{professor_id}", tags=["Professors"])
-def delete_professor(professor_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_professor(db, professor_id=professor_id)
+@router.delete("/professors/{professor_id}", tags=["Professors"])
+def delete_professor(professor_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    success = crud.delete_professor(db, user.id, professor_id=professor_id)
     if not success:
         raise HTTPException(status_code=404, detail="Professor not found")
     return {"detail": "Professor deleted successfully"}
 
 # 申请记录相关路由
-@app.post("/applications/", response_model=schemas.Application, tags=["Applications"])
-def create_application(application: schemas.ApplicationCreate, db: Session = Depends(get_db)):
-    return crud.create_application(db=db, application=application)
-
-@app.get("/applications/", response_model=List[schemas.Application], tags=["Applications"])
-def read_applications(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    applications = crud.get_applications(db, skip=skip, limit=limit)
-    return applications
-
-@app.get("/applications/{application_id}", response_model=schemas.ApplicationWithRelations, tags=["Applications"])
-def read_application(application_id: int, db: Session = Depends(get_db)):
-    db_application = crud.get_application(db, application_id=application_id)
-    if db_application is None:
+@router.post("/applications/", response_model=schemas.Application, tags=["Applications"])
+def create_application(application: schemas.ApplicationCreate, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    try:
+        return crud.create_application(db=db, user_id=user.id, application=application)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/applications/", response_model=List[schemas.Application], tags=["Applications"])
+def read_applications(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields(crud.APPLICATION_COLUMNS)),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return cached_list_response(
+        request, db, user.id, "application",
+        lambda: dump_rows(crud.get_application_rows(db, user.id, skip=skip, limit=limit, fields=fields))
+    )
+
+def _documents_zip_response(db: Session, user_id: int, application_ids: List[int], filename: str) -> StreamingResponse:
+    found = crud.count_applications(db, user_id, application_ids)
+    if found != len(set(application_ids)):
         raise HTTPException(status_code=404, detail="Application not found")
-    return db_application
+    # 文件列表在返回前确定，之后由StreamingResponse边压缩边发送
+    entries = archive_service.bundle_entries(db, user_id, sorted(set(application_ids)))
+    return StreamingResponse(
+        archive_service.stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/applications/documents.zip", tags=["Applications"])
+def download_applications_documents(
+    application_id: List[int] = Query(..., max_length=100),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    """把多个申请的文档打包下载，每个申请一个目录"""
+    return _documents_zip_response(db, user.id, application_id, f"documents-{datetime.utcnow():%Y%m%d}.zip")
+
+@router.get("/applications/{application_id}/documents.zip", tags=["Applications"])
+def download_application_documents(
+    application_id: int,
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return _documents_zip_response(db, user.id, [application_id], f"application-{application_id}-documents.zip")
 
-@app.put("/applications/{application_id}", response_model=schemas.Application, tags=["Applications"])
-def update_application(application_id: int, application_data: schemas.ApplicationUpdate, db: Session = Depends(get_db)):
-    db_application = crud.update_application(db, application_id=application_id, application_data=application_data.model_dump(exclude_unset=True))
+@router.get("/applications/{application_id}", response_model=schemas.ApplicationWithRelations, tags=["Applications"])
+def read_application(application_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    db_application = crud.get_application(db, user.id, application_id=application_id)
     if db_application is None:
         raise HTTPException(status_code=404, detail="Application not found")
-    
-    # 检查状态变更，并创建通知
-    if application_data.status and db_application.status != application_data.status:
-        school = crud.get_school(db, school_id=db_application.school_id)
-        notification_svc.create_status_change_notification(
-            school_name=school.name,
-            old_status=db_application.status,
-            new_status=application_data.status,
-            db=db
-        )
+    return db_application
+
+@router.put("/applications/{application_id}", response_model=schemas.Application, tags=["Applications"])
+def update_application(
+    application_id: int,
+    application_data: schemas.ApplicationUpdate,
+    db: Session = Depends(get_db),
+    notification_svc: NotificationService = Depends(get_notification_service),
+    user: schemas.User = Depends(get_current_user)
+):
+    # 申请的更新和状态变更通知在同一个事务内提交
+    with crud.unit_of_work(db):
+        db_application = crud.get_application(db, user.id, application_id)
+        if db_application is None:
+            raise HTTPException(status_code=404, detail="Application not found")
+        old_status = db_application.status
+        db_application = crud.update_application(db, user.id, application_id=application_id, application_data=application_data.model_dump(exclude_unset=True))
+
+        # 检查状态变更，并创建通知
+        if application_data.status and old_status != application_data.status:
+            school = crud.get_school(db, user.id, school_id=db_application.school_id)
+            notification_svc.create_status_change_notification(
+                school_name=school.name if school else "未知学校",
+                old_status=old_status,
+                new_status=application_data.status,
+                user_id=user.id,
+                db=db
+            )
     
     return db_application
 
-@app.delete("/applications/{application_id}", tags=["Applications"])
-def delete_application(application_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_application(db, application_id=application_id)
+@router.delete("/applications/{application_id}", tags=["Applications"])
+def delete_application(application_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    success = crud.delete_application(db, user.id, application_id=application_id)
     if not success:
         raise HTTPException(status_code=404, detail="Application not found")
     return {"detail": "Application deleted successfully"}
 
+# 仪表盘路由
+@router.get("/dashboard/summary", response_model=schemas.DashboardSummary, tags=["Dashboard"])
+def read_dashboard_summary(
+    days: int = Query(30, ge=1, le=365),
+    school_limit: int = Query(10, ge=1, le=100),
+    deadline_limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return dashboard_service.get_dashboard_summary(
+        db, user.id, days=days, school_limit=school_limit, deadline_limit=deadline_limit
+    )
+
+# 批量导入路由
+@router.post("/ingest/{kind}", response_model=schemas.IngestJob, status_code=status.HTTP_202_ACCEPTED, tags=["Ingest"])
+async def ingest_file(
+    kind: str,
+    file: UploadFile = File(...),
+    ingest_svc=Depends(get_ingest_service),
+    user: schemas.User = Depends(get_current_user)
+):
+    from ..services.ingest_service import FORMATS, KINDS
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail="Unknown ingest kind")
+    filename = file.filename or ""
+    if not filename.lower().endswith(FORMATS):
+        raise HTTPException(status_code=400, detail="Only CSV and XLSX files are supported")
+
+    # 分块写入临时文件，上传文件不会整个读入内存；导入任务结束后删除
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1].lower())
+    with os.fdopen(fd, "wb") as buffer:
+        while True:
+            chunk = await file.read(1 << 20)
+            if not chunk:
+                break
+            buffer.write(chunk)
+    return ingest_svc.submit(user.id, kind, filename, path).snapshot()
+
+@router.get("/ingest/jobs/{job_id}", response_model=schemas.IngestJob, tags=["Ingest"])
+def read_ingest_job(job_id: str, ingest_svc=Depends(get_ingest_service), user: schemas.User = Depends(get_current_user)):
+    job = ingest_svc.get(user.id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job
+
+# 导出路由
+@router.get("/export/{dataset}", tags=["Export"])
+def export_data(
+    request: Request,
+    dataset: str,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    user: schemas.User = Depends(get_current_user)
+):
+    if dataset not in export_service.EXPORTS:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    filename = f"{dataset}-{datetime.utcnow():%Y%m%d}.{format}"
+    return StreamingResponse(
+        export_service.stream_export(request.app.state.session_factory, user.id, dataset, format),
+        media_type=export_service.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# 日历订阅路由
+@router.get("/calendar/feed", tags=["Calendar"])
+def read_calendar_feed_url(request: Request, auth=Depends(get_auth_service), user: schemas.User = Depends(get_current_user)):
+    """返回日历订阅地址，地址中的令牌只能用于读取日历，可以添加到日历应用中"""
+    token = auth.create_feed_token(user.id, "calendar")
+    return {"url": str(request.url_for("read_calendar").include_query_params(token=token))}
+
+def _not_modified_since(request: Request, last_modified: datetime) -> bool:
+    value = request.headers.get("if-modified-since")
+    if not value or request.headers.get("if-none-match"):
+        return False
+    try:
+        since = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return False
+    return since.tzinfo is not None and last_modified.replace(microsecond=0) <= since
+
+@router.get("/calendar.ics", name="read_calendar", tags=["Calendar"])
+def read_calendar(request: Request, token: str = Query(...), db: Session = Depends(get_db), auth=Depends(get_auth_service)):
+    user_id = auth.verify_feed_token(token, "calendar")
+    db_user = crud.get_user(db, user_id) if user_id is not None else None
+    if db_user is None or not db_user.is_active:
+        raise HTTPException(status_code=401, detail="Invalid calendar token")
+
+    # 学校或申请发生变更后版本号变化，日历客户端频繁轮询时大多只需要返回304
+    version, changed_at = change_feed.entities_version(db, user_id, calendar_service.ENTITIES)
+    last_modified = (changed_at or db_user.created_at).replace(tzinfo=timezone.utc)
+    etag = make_etag("calendar", user_id, version)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag) or _not_modified_since(request, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    key = (user_id, "calendar.ics")
+    response_cache = request.app.state.response_cache
+    body = response_cache.get(key, version)
+    if body is None:
+        body = calendar_service.build_calendar(db, user_id, stamp=last_modified.replace(tzinfo=None))
+        response_cache.set(key, version, body)
+    return Response(content=body, media_type="text/calendar; charset=utf-8", headers=headers)
+
+# 增量同步路由
+@router.get("/changes", tags=["Sync"])
+def read_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    """
+    返回游标since之后的变更，响应中的cursor作为下次请求的since；
+    has_more为true时应立即继续请求
+    """
+    return json_response(change_feed.dump_changes(change_feed.get_changes(db, user.id, since=since, limit=limit)))
+
+@router.get("/changes/cursor", tags=["Sync"])
+def read_change_cursor(db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    """返回当前最新的游标，客户端应在完整下载数据之前获取，之后从该游标开始增量同步"""
+    return {"cursor": change_feed.latest_version(db, user.id)}
+
 # 文档相关路由
-@app.post("/documents/", response_model=schemas.Document, tags=["Documents"])
+@router.post("/documents/", response_model=schemas.Document, tags=["Documents"])
 async def create_document(
     application_id: int = Form(...),
     name: str = Form(...),
     document_type: str = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    extraction_svc=Depends(get_extraction_service),
+    user: schemas.User = Depends(get_current_user)
 ):
+    if crud.get_application(db, user.id, application_id=application_id) is None:
+        raise HTTPException(status_code=404, detail="Application not found")
+    
     # 创建文件存储目录
     upload_dir = os.path.join("uploads", "documents", str(application_id))
     os.makedirs(upload_dir, exist_ok=True)
@@ -163,6 +505,7 @@ async def create_document(
     with open(file_path, "wb") as f:
         content = await file.read()
         f.write(content)
+    content_hash = hashlib.sha256(content).hexdigest()
     
     # 创建文档记录
     document = schemas.DocumentCreate(
@@ -172,16 +515,70 @@ async def create_document(
         path=file_path
     )
     
-    return crud.create_document(db=db, document=document)
-
-@app.get("/documents/", response_model=List[schemas.Document], tags=["Documents"])
-def read_documents(application_id: Optional[int] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    documents = crud.get_documents(db, application_id=application_id, skip=skip, limit=limit)
-    return documents
+    db_document = crud.create_document(
+        db=db, user_id=user.id, document=document, content_hash=content_hash,
+        extraction_status="pending" if is_supported(file_path) else "unsupported"
+    )
+    # 文本在后台提取，完成后文档的extraction_status变为completed
+    if db_document.extraction_status == "pending":
+        extraction_svc.submit(content_hash, file_path)
+    return db_document
+
+@router.get("/documents/", response_model=List[schemas.Document], tags=["Documents"])
+def read_documents(
+    application_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields(crud.DOCUMENT_COLUMNS)),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return json_response(dump_rows(crud.get_document_rows(db, user.id, application_id=application_id, skip=skip, limit=limit, fields=fields)))
 
-@app.delete("/documents/{document_id}", tags=["Documents"])
-def delete_document(document_id: int, db: Session = Depends(get_db)):
-    document = crud.get_document(db, document_id=document_id)
+@router.get("/documents/{document_id}/text", response_model=schemas.DocumentTextContent, tags=["Documents"])
+def read_document_text(document_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    document = crud.get_document(db, user.id, document_id=document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    extracted = None
+    if document.extraction_status == "completed" and document.content_hash:
+        extracted = crud.get_document_text(db, document.content_hash)
+    return {
+        "document_id": document.id,
+        "extraction_status": document.extraction_status,
+        "page_count": document.page_count,
+        "text": extracted.text if extracted else None,
+    }
+
+@router.post("/documents/{document_id}/extract", response_model=schemas.Document, tags=["Documents"])
+def extract_document_text(
+    document_id: int,
+    db: Session = Depends(get_db),
+    extraction_svc=Depends(get_extraction_service),
+    user: schemas.User = Depends(get_current_user)
+):
+    """重新提取文档文本，用于提取失败或工作进程重启后仍在等待的文档"""
+    document = crud.get_document(db, user.id, document_id=document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not os.path.exists(document.path):
+        raise HTTPException(status_code=409, detail="Document file is missing")
+    if not is_supported(document.path):
+        raise HTTPException(status_code=400, detail="Unsupported document format")
+    # 旧文档上传时没有记录内容哈希
+    if not document.content_hash:
+        digest = hashlib.sha256()
+        with open(document.path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        document.content_hash = digest.hexdigest()
+    document = crud.reset_document_extraction(db, user.id, document_id=document_id)
+    extraction_svc.submit(document.content_hash, document.path)
+    return document
+
+@router.delete("/documents/{document_id}", tags=["Documents"])
+def delete_document(document_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    document = crud.get_document(db, user.id, document_id=document_id)
     if document is None:
         raise HTTPException(status_code=404, detail="Document not found")
     
@@ -190,40 +587,63 @@ def delete_document(document_id: int, db: Session = Depends(get_db)):
         os.remove(document.path)
     
     # 删除数据库记录
-    success = crud.delete_document(db, document_id=document_id)
+    success = crud.delete_document(db, user.id, document_id=document_id)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to delete document record")
     
     return {"detail": "Document deleted successfully"}
 
 # 邮件相关路由
-@app.post("/emails/", response_model=schemas.Email, tags=["Emails"])
-def create_email(email: schemas.EmailCreate, db: Session = Depends(get_db)):
-    return crud.create_email(db=db, email=email)
-
-@app.get("/emails/", response_model=List[schemas.Email], tags=["Emails"])
-def read_emails(application_id: Optional[int] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    emails = crud.get_emails(db, application_id=application_id, skip=skip, limit=limit)
-    return emails
+@router.post("/emails/", response_model=schemas.Email, tags=["Emails"])
+def create_email(email: schemas.EmailCreate, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    try:
+        return crud.create_email(db=db, user_id=user.id, email=email)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/emails/", response_model=List[schemas.Email], tags=["Emails"])
+def read_emails(
+    application_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields(crud.EMAIL_COLUMNS)),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return json_response(dump_rows(crud.get_email_rows(db, user.id, application_id=application_id, skip=skip, limit=limit, fields=fields)))
 
-@app.post("/emails/{email_id}/send", response_model=schemas.Email, tags=["Emails"])
+@router.post("/emails/{email_id}/send", response_model=schemas.Email, tags=["Emails"])
 def send_email(
     email_id: int, 
     smtp_server: str = Body("smtp.gmail.com"), 
     smtp_port: int = Body(587),
-    username: str = Body(...),
-    password: str = Body(...),
-    db: Session = Depends(get_db)
+    username: Optional[str] = Body(None),
+    password: Optional[str] = Body(None),
+    account_id: Optional[int] = Body(None),
+    db: Session = Depends(get_db),
+    email_svc: EmailService = Depends(get_email_service),
+    credentials = Depends(get_credential_store),
+    user: schemas.User = Depends(get_current_user)
 ):
-    db_email = crud.get_email(db, email_id=email_id)
+    db_email = crud.get_email(db, user.id, email_id=email_id)
     if db_email is None:
         raise HTTPException(status_code=404, detail="Email not found")
     
-    # 设置邮件服务
-    email_svc.smtp_server = smtp_server
-    email_svc.smtp_port = smtp_port
-    email_svc.username = username
-    email_svc.password = password
+    # 选择发信账户：请求中的账户密码 > 已保存的账户 > 配置的默认账户
+    # 共享的服务实例会被并发请求使用，按请求切换账户时创建新实例而不修改它
+    if username and password:
+        email_svc = email_svc.with_account(username, password, smtp_server, smtp_port)
+    elif account_id is not None:
+        account = crud.get_email_account(db, user.id, account_id=account_id)
+        if account is None:
+            raise HTTPException(status_code=404, detail="Email account not found")
+        try:
+            account_password = credentials.decrypt(account.password_encrypted)
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        email_svc = email_svc.with_account(account.username, account_password, account.smtp_server, account.smtp_port)
+    elif not (email_svc.username and email_svc.password):
+        raise HTTPException(status_code=400, detail="No email account configured")
     
     # 发送邮件
     result = email_svc.send_email(
@@ -234,64 +654,242 @@ def send_email(
     
     if result["success"]:
         # 更新邮件状态
-        db_email = crud.update_email(db, email_id=email_id, is_sent=True)
+        db_email = crud.update_email(db, user.id, email_id=email_id, is_sent=True, message_id=result.get("message_id"))
         return db_email
     else:
         raise HTTPException(status_code=500, detail=f"Failed to send email: {result['message']}")
 
-@app.delete("/emails/{email_id}", tags=["Emails"])
-def delete_email(email_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_email(db, email_id=email_id)
+# 发信账户相关路由，密码加密保存，响应中不返回密码
+@router.post("/email/accounts", response_model=schemas.EmailAccount, tags=["Emails"])
+def save_email_account(
+    account: schemas.EmailAccountCreate,
+    db: Session = Depends(get_db),
+    credentials = Depends(get_credential_store),
+    user: schemas.User = Depends(get_current_user)
+):
+    if not credentials.enabled:
+        raise HTTPException(status_code=503, detail="CREDENTIAL_KEY is not configured")
+    return crud.save_email_account(db, user.id, account=account, password_encrypted=credentials.encrypt(account.password))
+
+@router.get("/email/accounts", response_model=List[schemas.EmailAccount], tags=["Emails"])
+def read_email_accounts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    return crud.get_email_accounts(db, user.id, skip=skip, limit=limit)
+
+@router.delete("/email/accounts/{account_id}", tags=["Emails"])
+def delete_email_account(account_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    if not crud.delete_email_account(db, user.id, account_id=account_id):
+        raise HTTPException(status_code=404, detail="Email account not found")
+    return {"detail": "Email account deleted successfully"}
+
+@router.post("/email/accounts/{account_id}/sync", response_model=schemas.MailboxSyncResult, tags=["Emails"])
+def sync_email_account(
+    account_id: int,
+    db: Session = Depends(get_db),
+    imap_sync = Depends(get_imap_sync_service),
+    user: schemas.User = Depends(get_current_user)
+):
+    # 立即同步一次收件箱，只拉取上次同步之后的新邮件
+    account = crud.get_email_account(db, user.id, account_id=account_id)
+    if account is None:
+        raise HTTPException(status_code=404, detail="Email account not found")
+    if not account.imap_server:
+        raise HTTPException(status_code=400, detail="Email account has no IMAP server")
+    try:
+        return imap_sync.sync_account(db, account)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except (imaplib.IMAP4.error, OSError) as e:
+        raise HTTPException(status_code=502, detail=f"IMAP sync failed: {e}")
+
+@router.get("/emails/{email_id}/replies", response_model=List[schemas.EmailReply], tags=["Emails"])
+def read_email_replies(email_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    if crud.get_email(db, user.id, email_id=email_id) is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    return crud.get_email_replies(db, user.id, email_id=email_id, skip=skip, limit=limit)
+
+@router.delete("/emails/{email_id}", tags=["Emails"])
+def delete_email(email_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    success = crud.delete_email(db, user.id, email_id=email_id)
     if not success:
         raise HTTPException(status_code=404, detail="Email not found")
     return {"detail": "Email deleted successfully"}
 
 # 通知相关路由
-@app.get("/notifications/", response_model=List[schemas.Notification], tags=["Notifications"])
-def read_notifications(is_read: Optional[bool] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    notifications = crud.get_notifications(db, is_read=is_read, skip=skip, limit=limit)
-    return notifications
+@router.get("/notifications/", response_model=List[schemas.Notification], tags=["Notifications"])
+def read_notifications(
+    is_read: Optional[bool] = None,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[Tuple[str, ...]] = Depends(sparse_fields(crud.NOTIFICATION_COLUMNS)),
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return json_response(dump_rows(crud.get_notification_rows(db, user.id, is_read=is_read, skip=skip, limit=limit, fields=fields)))
 
-@app.put("/notifications/{notification_id}/read", response_model=schemas.Notification, tags=["Notifications"])
-def mark_notification_read(notification_id: int, db: Session = Depends(get_db)):
-    notification = crud.mark_notification_read(db, notification_id=notification_id)
+@router.put("/notifications/{notification_id}/read", response_model=schemas.Notification, tags=["Notifications"])
+def mark_notification_read(notification_id: int, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    notification = crud.mark_notification_read(db, user.id, notification_id=notification_id)
     if notification is None:
         raise HTTPException(status_code=404, detail="Notification not found")
     return notification
 
-@app.post("/notifications/check-deadlines", response_model=List[schemas.Notification], tags=["Notifications"])
-def check_deadlines(days_threshold: int = Query(7), db: Session = Depends(get_db)):
-    notification_service_instance = notification_service.NotificationService(db)
-    notifications = notification_service_instance.check_upcoming_deadlines(days_threshold=days_threshold)
+@router.post("/notifications/check-deadlines", response_model=List[schemas.Notification], tags=["Notifications"])
+def check_deadlines(
+    days_threshold: int = Query(7),
+    db: Session = Depends(get_db),
+    notification_svc: NotificationService = Depends(get_notification_service),
+    user: schemas.User = Depends(get_current_user)
+):
+    with crud.unit_of_work(db):
+        notifications = notification_svc.check_upcoming_deadlines(user.id, days_threshold=days_threshold, db=db)
     return notifications
 
+@router.post("/notifications/push", tags=["Notifications"])
+async def send_push_notification(
+    title: str = Body(...),
+    message: str = Body(...),
+    device_tokens: Optional[List[str]] = Body(None),
+    db: Session = Depends(get_db),
+    mobile_notification_svc: MobileNotificationService = Depends(get_mobile_notification_service),
+    user: schemas.User = Depends(get_current_user)
+):
+    return await mobile_notification_svc.broadcast(user.id, title=title, message=message, device_tokens=device_tokens, db=db)
+
+# 设备相关路由
+@router.post("/devices/", response_model=schemas.Device, tags=["Devices"])
+def register_device(device: schemas.DeviceCreate, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    return crud.register_device(db=db, user_id=user.id, device=device)
+
+@router.get("/devices/", response_model=List[schemas.Device], tags=["Devices"])
+def read_devices(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), user: schemas.User = Depends(get_current_user)):
+    return crud.get_devices(db, user.id, skip=skip, limit=limit)
+
 # 信息检索路由
-@app.get("/search/school", tags=["Search"])
-def search_school_info(school_name: str, department: Optional[str] = None):
+@router.get("/search/local", response_model=List[schemas.SearchResult], tags=["Search"])
+def search_local(
+    q: str,
+    types: Optional[List[str]] = Query(None),
+    skip: int = 0,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    user: schemas.User = Depends(get_current_user)
+):
+    return search_service.search(db, user.id, query=q, types=types, skip=skip, limit=limit)
+
+@router.get("/search/school", tags=["Search"], dependencies=[Depends(get_current_user)])
+def search_school_info(school_name: str, department: Optional[str] = None, info_service=Depends(get_info_service)):
     return info_service.search_school_info(school_name=school_name, department=department)
 
-@app.get("/search/professor", tags=["Search"])
-def search_professor_info(name: str, school: Optional[str] = None):
+@router.get("/search/professor", tags=["Search"], dependencies=[Depends(get_current_user)])
+def search_professor_info(name: str, school: Optional[str] = None, info_service=Depends(get_info_service)):
     return info_service.search_professor_info(name=name, school=school)
 
-@app.get("/search/deadlines", tags=["Search"])
-def get_application_deadlines(school_name: str, program: str):
+@router.get("/search/deadlines", tags=["Search"], dependencies=[Depends(get_current_user)])
+def get_application_deadlines(school_name: str, program: str, info_service=Depends(get_info_service)):
     deadline = info_service.get_application_deadlines(school_name=school_name, program=program)
     if deadline:
         return {"school": school_name, "program": program, "deadline": deadline}
     else:
         return {"school": school_name, "program": program, "deadline": None, "message": "Deadline not found"}
 
-@app.get("/search/publications", tags=["Search"])
-def get_professor_publications(professor_name: str, limit: int = 5):
+@router.get("/search/publications", tags=["Search"], dependencies=[Depends(get_current_user)])
+def get_professor_publications(professor_name: str, limit: int = 5, info_service=Depends(get_info_service)):
     return info_service.get_professor_publications(professor_name=professor_name, limit=limit)
 
-@app.post("/email/generate-draft", tags=["Email"])
-def generate_email_draft(professor_info: dict, student_info: dict):
+@router.post("/email/generate-draft", tags=["Email"], dependencies=[Depends(get_current_user)])
+def generate_email_draft(professor_info: dict, student_info: dict, info_service=Depends(get_info_service)):
     email_content = info_service.generate_email_draft(professor_info=professor_info, student_info=student_info)
     return {"subject": f"PhD Application Inquiry - {student_info.get('name')}", "content": email_content}
 
+# 监控指标路由
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 表结构检查放在启动阶段而不是模块导入时，导入本模块不会访问数据库
+    if app.state.settings.create_schema:
+        create_schema(app.state.engine)
+    # 上次停止时被取消的文本提取重新提交，没有等待提取的文档时不启动进程池
+    with app.state.session_factory() as db:
+        pending = crud.get_pending_extractions(db)
+    if pending:
+        extraction_service_for(app.state).resume(pending)
+    if app.state.settings.imap_sync_interval > 0:
+        app.state.imap_sync_service = create_imap_sync_service(app.state)
+        app.state.imap_sync_service.start()
+    yield
+    for name in ("ingest_service", "extraction_service", "imap_sync_service"):
+        service = getattr(app.state, name, None)
+        if service is not None:
+            service.shutdown()
+    app.state.engine.dispose()
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    创建FastAPI应用
+    
+    Args:
+        settings: 应用配置，默认从环境变量读取
+    
+    Returns:
+        FastAPI: 应用实例，数据库引擎和会话工厂保存在app.state上，服务实例按需创建
+    """
+    settings = settings or Settings.from_env()
+    
+    app = FastAPI(
+        title="PhD Application Manager",
+        description="博士申请管理系统API",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+    app.state.settings = settings
+    app.state.engine = create_db_engine(settings.database_url)
+    # 缓存的版本号和变更游标来自该应用数据库的变更日志，每个应用使用自己的缓存
+    app.state.entity_cache = EntityCache(settings.entity_cache_size, settings.entity_cache_sync_seconds)
+    app.state.response_cache = ResponseCache()
+    app.state.session_factory = sessionmaker(
+        autocommit=False, autoflush=False, bind=app.state.engine,
+        info={SESSION_INFO_KEY: app.state.entity_cache}
+    )
+    instrument_engine(app.state.engine)
+    install_query_profiler(app.state.engine, slow_query_ms=settings.slow_query_ms)
+    configure_logging(settings.query_profile_log, settings.slow_query_log)
+    
+    if settings.compression_min_size > 0:
+        app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_size)
+
+    # 限流放在CORS之内，被拒绝的响应同样带有CORS响应头
+    if settings.rate_limit_enabled:
+        if settings.rate_limit_backend == "database":
+            backend = DatabaseRateLimitBackend(app.state.engine)
+        elif settings.rate_limit_backend == "memory":
+            backend = MemoryRateLimitBackend()
+        else:
+            raise ValueError(f"未知的限流后端: {settings.rate_limit_backend}")
+        app.state.rate_limiter = RateLimiter(load_rules(settings.rate_limit_rules), backend)
+        app.add_middleware(
+            RateLimitMiddleware,
+            limiter=app.state.rate_limiter,
+            identify=lambda token: auth_service_for(app.state).token_user_id(token)
+        )
+    
+    # 添加CORS中间件
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=list(settings.cors_origins),  # 在生产环境中应该设置为特定的源
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(QueryProfilerMiddleware, token=settings.query_profiler_token)
+    app.add_middleware(MetricsMiddleware)
+    
+    app.include_router(router)
+    return app
+
 # 启动服务器
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(create_app(), host="0.0.0.0", port=8000)
@@ -0,0 +1,209 @@
+from typing import Callable, Optional
+import hmac
+import math
+import time
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..services.compression import compress, is_compressible, negotiate_encoding
+from ..services.metrics import HTTP_RATE_LIMITED, HTTP_REQUESTS, HTTP_REQUEST_DURATION
+from ..services.query_profiler import log_profile, start_profile, stop_profile
+from ..services.rate_limiter import RateLimiter, RateLimitExceeded, RateLimitRule
+
+class MetricsMiddleware:
+    """
+    记录每个路由的请求数和处理耗时的ASGI中间件
+    路由标签使用路由模板（如 /schools/{school_id}），未匹配任何路由的请求统一记为unmatched，
+    避免标签数量随URL无限增长
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, method, route_label)
+            HTTP_REQUESTS.inc(method, route_label, str(status_code))
+
+class QueryProfilerMiddleware:
+    """
+    按请求开启SQL查询分析的ASGI中间件
+    请求头X-Query-Profile的值与配置的令牌一致时记录该请求的全部SQL语句，
+    在响应头中返回查询次数、总耗时和疑似N+1查询数，完整记录写入查询分析日志。
+    未配置令牌时不会开启分析。
+    """
+
+    header = "x-query-profile"
+
+    def __init__(self, app: ASGIApp, token: Optional[str] = None, n_plus_one_threshold: int = 3):
+        self.app = app
+        self.token = token
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.token:
+            await self.app(scope, receive, send)
+            return
+        requested = Headers(scope=scope).get(self.header)
+        if not requested or not hmac.compare_digest(requested, self.token):
+            await self.app(scope, receive, send)
+            return
+
+        profile, token = start_profile(f"{scope['method']} {scope['path']}", self.n_plus_one_threshold)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-Query-Count"] = str(len(profile.queries))
+                headers["X-Query-Time-Ms"] = f"{profile.total_ms:.2f}"
+                headers["X-Query-N-Plus-One"] = str(len(profile.n_plus_one_suspects()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stop_profile(token)
+            log_profile(profile)
+
+class RateLimitMiddleware:
+    """
+    按规则限流并限制开销大的路由并发数的ASGI中间件
+    请求速率超限时返回429，排队等待并发名额超时时返回503，两者都带有Retry-After响应头。
+    携带有效访问令牌的请求按用户区分客户端，其余请求（包括令牌无效的请求和by_ip规则）按客户端IP区分；
+    未经校验的令牌不能用来区分客户端，否则每次换一个随机令牌就能得到一个新的令牌桶。
+    """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter, identify: Optional[Callable[[str], Optional[int]]] = None):
+        """
+        Args:
+            app: 下一层ASGI应用
+            limiter: 限流器
+            identify: 校验访问令牌并返回用户id的函数，令牌无效时返回None；为空时全部按IP区分
+        """
+        self.app = app
+        self.limiter = limiter
+        self.identify = identify
+
+    def _client_key(self, scope: Scope, rule: RateLimitRule) -> str:
+        if self.identify is not None and not rule.by_ip:
+            authorization = Headers(scope=scope).get("authorization", "")
+            scheme, _, token = authorization.partition(" ")
+            if scheme.lower() == "bearer" and token:
+                user_id = self.identify(token)
+                if user_id is not None:
+                    return f"user:{user_id}"
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rule = self.limiter.match(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            client = self._client_key(scope, rule)
+            if self.limiter.backend.blocking:
+                await run_in_threadpool(self.limiter.check_rate, rule, client)
+            else:
+                self.limiter.check_rate(rule, client)
+            semaphore = await self.limiter.admit(rule)
+        except RateLimitExceeded as e:
+            HTTP_RATE_LIMITED.inc(rule.name, e.reason)
+            if e.reason == "rate":
+                status_code, detail = 429, "Too many requests"
+            else:
+                status_code, detail = 503, "Server busy, try again later"
+            retry_after = str(max(1, math.ceil(e.retry_after))) if math.isfinite(e.retry_after) else "3600"
+            response = JSONResponse({"detail": detail}, status_code=status_code, headers={"Retry-After": retry_after})
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+class CompressionMiddleware:
+    """
+    按Accept-Encoding压缩响应的ASGI中间件
+    只压缩一次性返回、不小于minimum_size的可压缩响应；流式响应和已经设置Content-Encoding的响应
+    （例如cached_list_response返回的已压缩缓存）原样返回。
+    压缩后的响应带有Vary: Accept-Encoding，ETag改为弱ETag
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        # 响应头暂存到第一段响应体，根据响应体决定是否压缩
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not is_compressible(headers.get("content-type")):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            body = message.get("body", b"")
+            if start is None or message.get("more_body", False) or len(body) < self.minimum_size:
+                passthrough = True
+                if start is not None:
+                    await send(start)
+                await send(message)
+                return
+            body = compress(body, encoding)
+            headers = MutableHeaders(scope=start)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            passthrough = True
+            await send(start)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1 @@
+# 空的初始化文件，确保包导入正常工作
@@ -0,0 +1,251 @@
+"""
+确定性的大规模测试数据生成器
+
+按给定的数量和随机种子生成学校、导师、申请、文档、邮件和通知数据，相同参数总是生成相同的数据。
+所有数据属于同一个基准测试用户（BENCH_EMAIL / BENCH_PASSWORD）。
+数据分块生成并以executemany批量写入，内存占用与总行数无关，可以生成上百万行。
+
+用法（在项目根目录下）:
+    python -m backend.benchmarks.datagen --database-url sqlite:///bench.db --scale 10
+"""
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterator, List
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+
+from ..database.database import create_db_engine
+from ..models import models
+from ..services.auth_service import AuthService
+from ..services.dashboard_service import ensure_dashboard_summary
+from ..services.search_service import ensure_search_index
+
+# 生成数据的基准时间固定，保证结果可复现
+BASE_TIME = datetime(2025, 9, 1)
+
+# 生成的数据全部属于这个用户
+BENCH_USER_ID = 1
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "benchmark-password"
+
+STATUSES = ["准备中", "已提交", "已面试", "录取", "拒绝"]
+DOCUMENT_TYPES = ["CV", "个人陈述", "推荐信", "成绩单"]
+NOTIFICATION_TYPES = ["截止日期", "邮件回复", "申请状态变更"]
+DEPARTMENTS = ["Computer Science", "Electrical Engineering", "Statistics", "Physics", "计算机科学", "人工智能学院"]
+LOCATIONS = ["United States", "United Kingdom", "Canada", "Singapore", "Hong Kong", "Germany", "中国"]
+RESEARCH_TOPICS = [
+    "reinforcement learning", "computer vision", "natural language processing", "robotics",
+    "distributed systems", "databases", "graph neural networks", "computer security",
+    "quantum computing", "human-computer interaction", "强化学习", "计算机视觉", "自然语言处理",
+    "机器人", "分布式系统", "数据库",
+]
+FIRST_NAMES = ["John", "Mary", "Wei", "Li", "Anna", "David", "Yuki", "Carlos", "Fatima", "Ivan", "Min", "Sara"]
+LAST_NAMES = ["Smith", "Wang", "Zhang", "Garcia", "Müller", "Tanaka", "Kim", "Chen", "Brown", "Singh", "Liu", "Rossi"]
+
+@dataclass
+class DatasetSpec:
+    """生成数据的规模"""
+    schools: int = 1000
+    professors: int = 5000
+    applications: int = 20000
+    documents: int = 20000
+    emails: int = 50000
+    notifications: int = 50000
+    # 每位导师关联的学校数
+    schools_per_professor: int = 1
+    seed: int = 42
+
+    def scaled(self, factor: float) -> "DatasetSpec":
+        values = {
+            key: max(1, int(value * factor)) if key not in ("seed", "schools_per_professor") else value
+            for key, value in asdict(self).items()
+        }
+        return DatasetSpec(**values)
+
+def _chunks(rows: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _schools(spec: DatasetSpec, rng: random.Random) -> Iterator[Dict[str, Any]]:
+    for i in range(1, spec.schools + 1):
+        start = BASE_TIME + timedelta(days=rng.randint(-120, 120))
+        yield {
+            "id": i,
+            "name": f"University {i}",
+            "department": rng.choice(DEPARTMENTS),
+            "program": "PhD",
+            "location": rng.choice(LOCATIONS),
+            "website": f"https://www.university{i}.edu",
+            "application_start": start,
+            "application_deadline": start + timedelta(days=rng.randint(30, 150)),
+            "notes": f"重点关注{rng.choice(RESEARCH_TOPICS)}方向，需要{rng.randint(2, 4)}封推荐信",
+        }
+
+def _professors(spec: DatasetSpec, rng: random.Random) -> Iterator[Dict[str, Any]]:
+    for i in range(1, spec.professors + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        topics = rng.sample(RESEARCH_TOPICS, 3)
+        yield {
+            "id": i,
+            "name": f"{first} {last}",
+            "email": f"{first.lower()}.{last.lower()}{i}@university{rng.randint(1, spec.schools)}.edu",
+            "research_area": ", ".join(topics),
+            "website": None,
+            "notes": f"Recent papers on {topics[0]} and {topics[1]}",
+        }
+
+def _school_professor(spec: DatasetSpec, rng: random.Random) -> Iterator[Dict[str, Any]]:
+    for professor_id in range(1, spec.professors + 1):
+        for school_id in rng.sample(range(1, spec.schools + 1), min(spec.schools_per_professor, spec.schools)):
+            yield {"school_id": school_id, "professor_id": professor_id}
+
+def _applications(spec: DatasetSpec, rng: random.Random) -> Iterator[Dict[str, Any]]:
+    for i in range(1, spec.applications + 1):
+        created = BASE_TIME - timedelta(days=rng.randint(0, 365), minutes=rng.randint(0, 1440))
+        status = rng.choice(STATUSES)
+        yield {
+            "id": i,
+            "school_id": rng.randint(1, spec.schools),
+            "professor_id": rng.randint(1, spec.professors) if rng.random() < 0.8 else None,
+            "status": status,
+            "submission_date": created + timedelta(days=rng.randint(1, 60)) if status != "准备中" else None,
+            "result_date": created + timedelta(days=rng.randint(60, 150)) if status in ("录取", "拒绝") else None,
+            "cv_path": None,
+            "ps_path": None,
+            "notes": f"导师对{rng.choice(RESEARCH_TOPICS)}感兴趣" if rng.random() < 0.5 else None,
+            "created_at": created,
+            "updated_at": created,
+        }
+
+def _documents(spec: DatasetSpec, rng: random.Random) -> Iterator[Dict[str, Any]]:
+    for i in range(1, spec.documents + 1):
+        application_id = rng.randint(1, spec.applications)
+        document_type = rng.choice(DOCUMENT_TYPES)
+        yield {
+            "id": i,
+            "application_id": application_id,
+            "name": f"{document_type}_{i}.pdf",
+            "type": document_type,
+            "path": f"uploads/documents/{application_id}/{document_type}_{i}.pdf",
+            "uploaded_at": BASE_TIME - timedelta(minutes=rng.randint(0, 500000)),
+        }
+
+def _emails(spec: DatasetSpec, rng: random.Random) -> Iterator[Dict[str, Any]]:
+    for i in range(1, spec.emails + 1):
+        topic = rng.choice(RESEARCH_TOPICS)
+        yield {
+            "id": i,
+            "application_id": rng.randint(1, spec.applications),
+            "subject": f"PhD Application Inquiry - {topic}",
+            "content": f"Dear Professor,\n\nI am interested in {topic}. " * rng.randint(3, 12),
+            "sender": "student@example.com",
+            "receiver": f"professor{rng.randint(1, spec.professors)}@example.edu",
+            "sent_at": BASE_TIME - timedelta(minutes=rng.randint(0, 500000)),
+            "is_sent": rng.random() < 0.6,
+        }
+
+def _notifications(spec: DatasetSpec, rng: random.Random) -> Iterator[Dict[str, Any]]:
+    for i in range(1, spec.notifications + 1):
+        notification_type = rng.choice(NOTIFICATION_TYPES)
+        yield {
+            "id": i,
+            "title": f"University {rng.randint(1, spec.schools)}{notification_type}",
+            "content": f"您的申请有新的{notification_type}，请及时查看。",
+            "type": notification_type,
+            "is_read": rng.random() < 0.7,
+            "created_at": BASE_TIME - timedelta(minutes=rng.randint(0, 500000)),
+        }
+
+# 写入顺序满足外键依赖
+_GENERATORS: List[tuple] = [
+    (models.School.__table__, _schools),
+    (models.Professor.__table__, _professors),
+    (models.school_professor, _school_professor),
+    (models.Application.__table__, _applications),
+    (models.Document.__table__, _documents),
+    (models.Email.__table__, _emails),
+    (models.Notification.__table__, _notifications),
+]
+
+def generate(
+    engine: Engine,
+    spec: DatasetSpec,
+    chunk_size: int = 10000,
+    progress: Callable[[str, int], None] = None
+) -> Dict[str, int]:
+    """
+    向数据库写入生成的数据
+
+    Args:
+        engine: 数据库引擎，目标表应为空
+        spec: 数据规模
+        chunk_size: 每个批次写入的行数
+        progress: 进度回调，参数为表名和已写入行数
+
+    Returns:
+        Dict[str, int]: 每张表写入的行数
+    """
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User.__table__), {
+            "id": BENCH_USER_ID,
+            "email": BENCH_EMAIL,
+            "hashed_password": AuthService.hash_password(BENCH_PASSWORD),
+            "is_active": True,
+            "created_at": BASE_TIME,
+        })
+    counts = {}
+    for index, (table, make_rows) in enumerate(_GENERATORS):
+        # 每张表使用独立的随机序列，调整某张表的数量不会改变其他表的数据
+        rng = random.Random(f"{spec.seed}:{index}")
+        rows = make_rows(spec, rng)
+        if "user_id" in table.c:
+            rows = ({**row, "user_id": BENCH_USER_ID} for row in rows)
+        written = 0
+        for chunk in _chunks(rows, chunk_size):
+            with engine.begin() as conn:
+                conn.execute(insert(table), chunk)
+            written += len(chunk)
+            if progress:
+                progress(table.name, written)
+        counts[table.name] = written
+    # 全文检索索引和仪表盘汇总在数据写入后一次性回填，比逐行触发器快得多
+    ensure_search_index(engine)
+    ensure_dashboard_summary(engine)
+    return counts
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="生成确定性的测试数据")
+    parser.add_argument("--database-url", required=True, help="目标数据库URL，表应为空")
+    parser.add_argument("--scale", type=float, default=1.0, help="在默认规模基础上的缩放倍数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    for field in ("schools", "professors", "applications", "documents", "emails", "notifications"):
+        parser.add_argument(f"--{field}", type=int, help=f"{field}的行数，覆盖--scale")
+    args = parser.parse_args()
+
+    spec = DatasetSpec(seed=args.seed).scaled(args.scale)
+    for field in ("schools", "professors", "applications", "documents", "emails", "notifications"):
+        if getattr(args, field) is not None:
+            setattr(spec, field, getattr(args, field))
+
+    start = time.perf_counter()
+    counts = generate(
+        create_db_engine(args.database_url), spec, chunk_size=args.chunk_size,
+        progress=lambda table, n: print(f"\r{table}: {n}", end="", flush=True)
+    )
+    print()
+    print(f"生成完成，用时{time.perf_counter() - start:.1f}秒: {counts}")
+
+if __name__ == "__main__":
+    main()
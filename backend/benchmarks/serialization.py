@@ -0,0 +1,132 @@
+"""
+列表接口序列化开销基准测试
+
+对比两种列表响应路径的单行耗时:
+    orm_pydantic: 查询ORM对象，经response_model校验(from_attributes)后转为JSON兼容对象再json.dumps，
+                  与FastAPI处理response_model的方式一致
+    core_orjson:  查询Core行，直接用orjson编码
+
+用法（在项目根目录下）:
+    python -m backend.benchmarks.serialization --rows 20000 --output serialization.json
+"""
+from typing import Any, Callable, Dict, List
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from pydantic import TypeAdapter
+from sqlalchemy.orm import sessionmaker
+
+from ..database.database import create_db_engine
+from ..models import models, schemas
+from ..services import crud
+from ..services.entity_cache import entity_cache
+from ..services.serialization import dump_rows
+
+def _populate(db, n_rows: int) -> None:
+    now = datetime.utcnow()
+    db.bulk_insert_mappings(models.School, [
+        {
+            "user_id": 1,
+            "name": f"School {i}",
+            "department": "Computer Science",
+            "program": "PhD",
+            "location": "United States",
+            "website": f"https://school{i}.edu",
+            "application_start": now,
+            "application_deadline": now + timedelta(days=i % 365),
+            "notes": "备注" * 20,
+        }
+        for i in range(n_rows)
+    ])
+    db.bulk_insert_mappings(models.Notification, [
+        {
+            "user_id": 1,
+            "title": f"通知 {i}",
+            "content": "内容" * 50,
+            "type": "截止日期",
+            "is_read": bool(i % 2),
+            "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(n_rows)
+    ])
+    db.commit()
+
+def _time(fn: Callable[[], Any], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def run(n_rows: int, page_sizes: List[int], repeat: int) -> Dict[str, Any]:
+    engine = create_db_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    # 测量的是查询和序列化，不经过学校缓存
+    entity_cache.configure(0, 0)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        _populate(db, n_rows)
+
+    cases = {
+        "schools": (
+            TypeAdapter(List[schemas.School]),
+            lambda db, limit: crud.get_schools(db, 1, limit=limit),
+            lambda db, limit: crud.get_school_rows(db, 1, limit=limit),
+        ),
+        "notifications": (
+            TypeAdapter(List[schemas.Notification]),
+            lambda db, limit: crud.get_notifications(db, 1, limit=limit),
+            lambda db, limit: crud.get_notification_rows(db, 1, limit=limit),
+        ),
+    }
+
+    results: Dict[str, Any] = {}
+    for name, (adapter, load_orm, load_rows) in cases.items():
+        for limit in page_sizes:
+            def orm_pydantic():
+                with Session() as db:
+                    content = adapter.dump_python(
+                        adapter.validate_python(load_orm(db, limit), from_attributes=True), mode="json"
+                    )
+                    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+            def core_orjson():
+                with Session() as db:
+                    return dump_rows(load_rows(db, limit))
+
+            before = _time(orm_pydantic, repeat)
+            after = _time(core_orjson, repeat)
+            results[f"{name}_limit_{limit}"] = {
+                "orm_pydantic_us_per_row": before / limit * 1e6,
+                "core_orjson_us_per_row": after / limit * 1e6,
+                "speedup": before / after,
+            }
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="测量列表接口的序列化开销")
+    parser.add_argument("--rows", type=int, default=20000, help="每张表生成的行数")
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--output", help="结果JSON的保存路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    page_sizes = [size for size in args.page_sizes if size <= args.rows]
+    result = {
+        "rows": args.rows,
+        "python": sys.version.split()[0],
+        "results": run(args.rows, page_sizes, args.repeat),
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+启动耗时基准测试
+
+在全新的子进程中分别测量导入应用模块、create_app以及执行lifespan启动到第一个请求返回的耗时，
+每轮使用独立的临时数据库，结果以JSON输出。
+
+用法（在项目根目录下）:
+    python -m backend.benchmarks.startup --runs 10 --output startup.json
+"""
+from typing import Any, Dict, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 在子进程中执行的测量脚本
+_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from backend.app.main import create_app
+from backend.app.config import Settings
+t1 = time.perf_counter()
+app = create_app(Settings(database_url=sys.argv[1]))
+t2 = time.perf_counter()
+from starlette.testclient import TestClient
+with TestClient(app) as client:
+    t3 = time.perf_counter()
+    client.get("/")
+    t4 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "lifespan_ms": (t3 - t2) * 1000,
+    "first_request_ms": (t4 - t3) * 1000,
+    "total_ms": (t4 - t0) * 1000,
+}))
+"""
+
+def run_once() -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE, database_url],
+            cwd=PROJECT_ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(samples: List[Dict[str, float]]) -> Dict[str, Any]:
+    return {
+        key: {
+            "median": statistics.median(sample[key] for sample in samples),
+            "min": min(sample[key] for sample in samples),
+            "max": max(sample[key] for sample in samples),
+        }
+        for key in samples[0]
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="测量应用冷启动耗时")
+    parser.add_argument("--runs", type=int, default=5, help="子进程启动次数")
+    parser.add_argument("--output", help="结果JSON的保存路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    result = {"runs": args.runs, "python": sys.version.split()[0], "summary": summarize(samples)}
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
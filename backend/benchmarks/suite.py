@@ -0,0 +1,234 @@
+"""
+API吞吐量基准测试
+
+先用datagen生成确定性的数据集，再通过httpx的ASGITransport在进程内直接调用ASGI应用（不经过网络），
+依次运行各个场景，统计延迟分位数和吞吐量，结果保存为JSON以便在不同提交之间比较。
+
+用法（在项目根目录下）:
+    python -m backend.benchmarks.suite --scale 0.1 --output results.json
+    python -m backend.benchmarks.suite --scale 0.1 --compare results.json
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime
+
+import httpx
+
+from ..app.config import Settings
+from ..app.main import create_app
+from ..database.database import create_db_engine
+from .datagen import BENCH_EMAIL, BENCH_PASSWORD, STATUSES, DatasetSpec, generate
+
+Request = Callable[[httpx.AsyncClient, random.Random], Awaitable[httpx.Response]]
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+def scenarios(spec: DatasetSpec) -> Dict[str, Request]:
+    """各场景发出的单个请求，随机数据由每个工作协程自己的随机数生成器决定"""
+    upload = os.urandom(64 * 1024)
+
+    def page(total: int, rng: random.Random, limit: int = 100) -> Dict[str, int]:
+        return {"skip": rng.randrange(0, max(total - limit, 1)), "limit": limit}
+
+    async def list_schools(client, rng):
+        return await client.get("/schools/", params=page(spec.schools, rng))
+
+    async def list_professors(client, rng):
+        return await client.get("/professors/", params=page(spec.professors, rng))
+
+    async def list_applications(client, rng):
+        return await client.get("/applications/", params=page(spec.applications, rng))
+
+    async def list_emails(client, rng):
+        return await client.get("/emails/", params=page(spec.emails, rng))
+
+    async def list_notifications(client, rng):
+        return await client.get("/notifications/", params=page(spec.notifications, rng))
+
+    async def application_detail(client, rng):
+        return await client.get(f"/applications/{rng.randint(1, spec.applications)}")
+
+    async def status_update(client, rng):
+        return await client.put(
+            f"/applications/{rng.randint(1, spec.applications)}",
+            json={"status": rng.choice(STATUSES)},
+        )
+
+    async def deadline_sweep(client, rng):
+        return await client.post("/notifications/check-deadlines", params={"days_threshold": 7})
+
+    async def document_upload(client, rng):
+        return await client.post(
+            "/documents/",
+            data={
+                "application_id": str(rng.randint(1, spec.applications)),
+                "name": "CV",
+                "document_type": "CV",
+            },
+            files={"file": (f"cv_{rng.randrange(1 << 30)}.pdf", upload, "application/pdf")},
+        )
+
+    return {
+        "list_schools": list_schools,
+        "list_professors": list_professors,
+        "list_applications": list_applications,
+        "list_emails": list_emails,
+        "list_notifications": list_notifications,
+        "application_detail": application_detail,
+        "status_update": status_update,
+        "deadline_sweep": deadline_sweep,
+        "document_upload": document_upload,
+    }
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    request: Request,
+    requests: int,
+    concurrency: int,
+    seed: int
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker(worker_id: int) -> None:
+        nonlocal remaining, errors
+        rng = random.Random(f"{seed}:{worker_id}")
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await request(client, rng)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+    }
+
+async def run_suite(
+    app,
+    spec: DatasetSpec,
+    requests: int,
+    concurrency: int,
+    selected: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    available = scenarios(spec)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        # 所有场景以生成数据所属的用户身份发出请求
+        response = await client.post("/auth/token", data={"username": BENCH_EMAIL, "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        for name, request in available.items():
+            if selected and name not in selected:
+                continue
+            # 写入量大的场景减少请求数，避免数据集在运行过程中明显膨胀
+            count = max(1, requests // 10) if name in ("deadline_sweep", "document_upload") else requests
+            results[name] = await run_scenario(client, request, count, concurrency, spec.seed)
+            print(f"{name}: {results[name]['p50_ms']:.2f} ms p50, {results[name]['throughput_rps']:.0f} req/s")
+    return results
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """打印两次结果中各场景p50、p95和吞吐量的变化"""
+    print(f"{'scenario':<22}{'p50 ms':>30}{'p95 ms':>30}{'req/s':>30}")
+    for name, result in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "throughput_rps"):
+            ratio = result[key] / old[key] if old[key] else float("nan")
+            cells.append(f"{old[key]:.2f} -> {result[key]:.2f} ({ratio:.2f}x)")
+        print(f"{name:<22}" + "".join(f"{cell:>30}" for cell in cells))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="在进程内运行API基准测试")
+    parser.add_argument("--scale", type=float, default=0.1, help="数据集相对默认规模的倍数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=500, help="每个场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenario", action="append", help="只运行指定场景，可重复")
+    parser.add_argument("--workdir", help="数据库和上传文件所在目录，默认使用临时目录")
+    parser.add_argument("--output", help="结果JSON的保存路径")
+    parser.add_argument("--compare", help="与之前保存的结果JSON比较")
+    args = parser.parse_args()
+
+    spec = DatasetSpec(seed=args.seed).scaled(args.scale)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="phd-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    database_url = f"sqlite:///{os.path.join(os.path.abspath(workdir), 'bench.db')}"
+    output = os.path.abspath(args.output) if args.output else None
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+
+    # 上传的文件写入相对路径uploads/，切换到工作目录避免污染项目目录
+    os.chdir(workdir)
+
+    start = time.perf_counter()
+    engine = create_db_engine(database_url)
+    generate(engine, spec)
+    engine.dispose()
+    print(f"数据生成用时{time.perf_counter() - start:.1f}秒")
+
+    # 所有请求来自同一个客户端，关闭限流以测量处理能力本身
+    app = create_app(Settings(database_url=database_url, create_schema=False, rate_limit_enabled=False))
+    result = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "dataset": asdict(spec),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "scenarios": asyncio.run(run_suite(app, spec, args.requests, args.concurrency, args.scenario)),
+    }
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if previous:
+        compare(previous, result)
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,25 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+import os
 
 # SQLite数据库URL
-SQLALCHEMY_DATABASE_URL = "sqlite:///./phd_application.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./phd_application.db")
 
-# 创建SQLAlchemy引擎
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def create_db_engine(database_url: str) -> Engine:
+    """创建SQLAlchemy引擎，只建立连接池，不会立即连接数据库"""
+    connect_args = {"check_same_thread": False} if database_url.startswith("sqlite") else {}
+    engine = create_engine(database_url, connect_args=connect_args)
+    if database_url.startswith("sqlite") and engine.url.database not in (None, "", ":memory:"):
+        # 多个工作进程共用同一个数据库文件：WAL模式下读写互不阻塞，
+        # 写锁冲突时等待而不是立即报database is locked
+        @event.listens_for(engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA busy_timeout=5000")
+            cursor.close()
+    return engine
 
-# 创建SessionLocal类
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# 创建Base类
+# 创建Base类；引擎和会话工厂由create_app创建，导入本模块不会创建引擎
 Base = declarative_base()
-
-# 获取数据库会话的依赖函数
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close() 
\ No newline at end of file
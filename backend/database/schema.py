@@ -0,0 +1,38 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+
+from ..models import models
+from ..services.dashboard_service import ensure_dashboard_summary
+from ..services.search_service import ensure_search_index
+
+def _add_missing_columns(engine: Engine) -> None:
+    # create_all不会修改已存在的表；后来新增的可空列（例如按用户分区的user_id）在这里补上，
+    # 已有行的新列为NULL
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in models.Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or column.primary_key or not column.nullable:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+def create_schema(engine: Engine) -> None:
+    """创建缺失的表、列、索引、全文检索索引和仪表盘汇总，已有的数据不受影响"""
+    models.Base.metadata.create_all(bind=engine)
+    _add_missing_columns(engine)
+    # create_all不会给已存在的表补建后来新增的索引；
+    # 缺少列的表（主键有变化的汇总表）由ensure_dashboard_summary重建
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in models.Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for index in table.indexes:
+                if all(column.name in existing for column in index.columns):
+                    index.create(conn, checkfirst=True)
+    ensure_search_index(engine)
+    ensure_dashboard_summary(engine)
@@ -1,10 +1,19 @@
-from database.database import engine
-from models.models import Base
+import os
+import sys
+
+# 作为脚本运行时，将项目根目录加入PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.database.database import SQLALCHEMY_DATABASE_URL, create_db_engine
+from backend.database.schema import create_schema
 
 def init_database():
     """初始化数据库，创建所有表"""
-    Base.metadata.create_all(bind=engine)
+    engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
+    try:
+        create_schema(engine)
+    finally:
+        engine.dispose()
     print("数据库初始化完成！表已创建。")
 
 if __name__ == "__main__":
-    init_database() 
\ No newline at end of file
+    init_database()
@@ -1,12 +1,8 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, Table
+from sqlalchemy import Boolean, Column, Float, ForeignKey, Index, Integer, String, Text, DateTime, Table, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
-# 修改导入方式
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from database.database import Base
+from ..database.database import Base
 
 # 学校与导师多对多关系的关联表
 school_professor = Table(
@@ -16,18 +12,33 @@ school_professor = Table(
     Column("professor_id", Integer, ForeignKey("professors.id"), primary_key=True),
 )
 
+class User(Base):
+    """用户模型，每位申请者只能访问自己的数据"""
+    __tablename__ = "users"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, unique=True, index=True, nullable=False)
+    hashed_password = Column(String, nullable=False)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class School(Base):
     """学校模型"""
     __tablename__ = "schools"
+    __table_args__ = (
+        # 按用户查询即将截止的学校
+        Index("ix_schools_user_deadline", "user_id", "application_deadline"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     name = Column(String, index=True)
     department = Column(String)
     program = Column(String)
     location = Column(String)
     website = Column(String)
     application_start = Column(DateTime, nullable=True)
-    application_deadline = Column(DateTime, nullable=True)
+    application_deadline = Column(DateTime, nullable=True, index=True)
     notes = Column(Text, nullable=True)
     
     # 关系
@@ -39,6 +50,7 @@ class Professor(Base):
     __tablename__ = "professors"
     
     id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     name = Column(String, index=True)
     email = Column(String)
     research_area = Column(String)
@@ -54,6 +66,7 @@ class Application(Base):
     __tablename__ = "applications"
     
     id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     school_id = Column(Integer, ForeignKey("schools.id"))
     professor_id = Column(Integer, ForeignKey("professors.id"), nullable=True)
     status = Column(String)  # 例如: "准备中", "已提交", "已面试", "录取", "拒绝"
@@ -76,20 +89,36 @@ class Document(Base):
     __tablename__ = "documents"
     
     id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     application_id = Column(Integer, ForeignKey("applications.id"))
     name = Column(String)
     type = Column(String)  # 例如: "CV", "个人陈述", "推荐信", "成绩单"
     path = Column(String)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
+    # 文件内容的SHA-256，提取出的文本按内容保存在document_texts中
+    content_hash = Column(String, index=True, nullable=True)
+    extraction_status = Column(String, nullable=True)  # "pending", "completed", "failed", "unsupported"
+    extraction_error = Column(Text, nullable=True)
+    page_count = Column(Integer, nullable=True)
     
     # 关系
     application = relationship("Application", back_populates="documents")
 
+class DocumentText(Base):
+    """从文档文件中提取的文本，内容相同的文件只提取一次"""
+    __tablename__ = "document_texts"
+    
+    content_hash = Column(String, primary_key=True)
+    text = Column(Text, nullable=False)
+    page_count = Column(Integer, nullable=True)
+    extracted_at = Column(DateTime, default=datetime.utcnow)
+
 class Email(Base):
     """邮件模型，用于跟踪与导师或学校的通信"""
     __tablename__ = "emails"
     
     id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     application_id = Column(Integer, ForeignKey("applications.id"))
     subject = Column(String)
     content = Column(Text)
@@ -97,17 +126,148 @@ class Email(Base):
     receiver = Column(String)
     sent_at = Column(DateTime, default=datetime.utcnow)
     is_sent = Column(Boolean, default=False)
+    message_id = Column(String, index=True)  # 发送时生成的Message-ID，用于匹配回复
     
     # 关系
     application = relationship("Application", back_populates="emails")
 
+class EmailReply(Base):
+    """收件箱同步时找到的对已发送邮件的回复"""
+    __tablename__ = "email_replies"
+    __table_args__ = (
+        UniqueConstraint("user_id", "message_id", name="uq_email_replies_user_message"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    email_id = Column(Integer, ForeignKey("emails.id"), index=True)  # 被回复的邮件
+    application_id = Column(Integer, ForeignKey("applications.id"))
+    message_id = Column(String, nullable=False)
+    sender = Column(String)
+    subject = Column(String)
+    received_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Notification(Base):
     """通知模型，用于发送消息提醒"""
     __tablename__ = "notifications"
     
     id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     title = Column(String)
     content = Column(Text)
     type = Column(String)  # 例如: "截止日期", "邮件回复", "申请状态变更"
     is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow) 
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow) 
+
+class Device(Base):
+    """移动设备模型，用于推送通知"""
+    __tablename__ = "devices"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    token = Column(String, unique=True, index=True, nullable=False)
+    type = Column(String)  # 例如: "ios", "android"
+    registered_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime, default=datetime.utcnow)
+
+class SummaryCounter(Base):
+    """仪表盘汇总计数，由写操作增量维护"""
+    __tablename__ = "summary_counters"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True, index=True)
+    metric = Column(String, primary_key=True)  # 例如: "application_status", "email_state"
+    key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class SchoolApplicationCount(Base):
+    """每所学校的申请数，由写操作增量维护"""
+    __tablename__ = "school_application_counts"
+    __table_args__ = (
+        # 按用户查询申请数最多的学校
+        Index("ix_school_application_counts_user_count", "user_id", "count"),
+    )
+    
+    school_id = Column(Integer, ForeignKey("schools.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    count = Column(Integer, nullable=False, default=0, index=True)
+
+class ChangeLog(Base):
+    """变更日志，按写入顺序记录每次增删改，id即增量同步的游标"""
+    __tablename__ = "change_log"
+    __table_args__ = (
+        # 按实体类型查询最新版本
+        Index("ix_change_log_entity_id", "entity", "id"),
+        # 按用户和实体类型查询最新版本
+        Index("ix_change_log_user_entity_id", "user_id", "entity", "id"),
+        {"sqlite_autoincrement": True},
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    entity = Column(String, nullable=False)  # 例如: "school", "application", "email"
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)  # "create", "update", "delete"
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+class IngestJob(Base):
+    """批量导入任务，保存在数据库中以便任一工作进程查询进度"""
+    __tablename__ = "ingest_jobs"
+    
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    kind = Column(String, nullable=False)  # "schools", "professors"
+    filename = Column(String)
+    status = Column(String, nullable=False)  # "pending", "running", "completed", "failed"
+    rows_processed = Column(Integer, default=0)
+    inserted = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    linked = Column(Integer, default=0)
+    failed_rows = Column(Integer, default=0)
+    progress = Column(Float, nullable=True)
+    errors = Column(Text, nullable=True)  # 行级错误的JSON数组
+    errors_truncated = Column(Boolean, default=False)
+    detail = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class EmailAccount(Base):
+    """发信邮箱账户，密码加密保存，供所有工作进程共用"""
+    __tablename__ = "email_accounts"
+    __table_args__ = (
+        UniqueConstraint("user_id", "username", name="uq_email_accounts_user_username"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    username = Column(String, index=True, nullable=False)
+    smtp_server = Column(String, nullable=False)
+    smtp_port = Column(Integer, nullable=False)
+    # 收件服务器，为空时不同步收件箱
+    imap_server = Column(String)
+    imap_port = Column(Integer)
+    password_encrypted = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class MailboxState(Base):
+    """收件箱的同步进度，UIDVALIDITY不变时只拉取last_uid之后的新邮件"""
+    __tablename__ = "mailbox_states"
+    __table_args__ = (
+        UniqueConstraint("account_id", "mailbox", name="uq_mailbox_states_account_mailbox"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("email_accounts.id"), nullable=False)
+    mailbox = Column(String, nullable=False)
+    uidvalidity = Column(Integer, nullable=False)
+    last_uid = Column(Integer, nullable=False, default=0)
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+class RateLimitBucket(Base):
+    """限流令牌桶，多个工作进程共享限流状态时使用"""
+    __tablename__ = "rate_limit_buckets"
+    
+    bucket_key = Column(String, primary_key=True)  # 规则名:客户端
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False, index=True)  # Unix时间戳（秒）
@@ -1,6 +1,27 @@
 from pydantic import BaseModel, EmailStr, Field, validator
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+# 用户相关模型
+class UserBase(BaseModel):
+    email: EmailStr
+
+class UserCreate(UserBase):
+    # bcrypt只使用密码的前72个字节
+    password: str = Field(..., min_length=8, max_length=72)
+
+class User(UserBase):
+    id: int
+    is_active: bool
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
 
 # 学校相关模型
 class SchoolBase(BaseModel):
@@ -82,10 +103,20 @@ class DocumentCreate(DocumentBase):
 class Document(DocumentBase):
     id: int
     uploaded_at: datetime
+    content_hash: Optional[str] = None
+    extraction_status: Optional[str] = None  # "pending", "completed", "failed", "unsupported"
+    extraction_error: Optional[str] = None
+    page_count: Optional[int] = None
     
     class Config:
         from_attributes = True
 
+class DocumentTextContent(BaseModel):
+    document_id: int
+    extraction_status: Optional[str] = None
+    page_count: Optional[int] = None
+    text: Optional[str] = None
+
 # 邮件相关模型
 class EmailBase(BaseModel):
     application_id: int
@@ -101,10 +132,52 @@ class EmailCreate(EmailBase):
 class Email(EmailBase):
     id: int
     sent_at: datetime
+    message_id: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+class EmailReply(BaseModel):
+    id: int
+    email_id: int
+    application_id: Optional[int] = None
+    message_id: str
+    sender: Optional[str] = None
+    subject: Optional[str] = None
+    received_at: Optional[datetime] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+# 发信账户相关模型
+class EmailAccountBase(BaseModel):
+    username: str
+    smtp_server: str = "smtp.gmail.com"
+    smtp_port: int = 587
+    # 收件服务器，设置后同步收件箱中的回复
+    imap_server: Optional[str] = None
+    imap_port: Optional[int] = 993
+
+class EmailAccountCreate(EmailAccountBase):
+    password: str
+
+class EmailAccount(EmailAccountBase):
+    id: int
+    created_at: datetime
+    updated_at: datetime
     
     class Config:
         from_attributes = True
 
+class MailboxSyncResult(BaseModel):
+    account_id: int
+    mailbox: str
+    uidvalidity: int
+    last_uid: int
+    fetched: int = 0  # 本次拉取邮件头的邮件数
+    replies: int = 0  # 新找到的回复数
+
 # 通知相关模型
 class NotificationBase(BaseModel):
     title: str
@@ -122,6 +195,105 @@ class Notification(NotificationBase):
     class Config:
         from_attributes = True
 
+# 导师匹配相关模型
+class ProfessorMatchQuery(BaseModel):
+    profile: str
+    top_k: int = Field(10, ge=1, le=100)
+
+class ProfessorMatch(BaseModel):
+    professor: Professor
+    score: float
+
+# 重复记录检测相关模型
+class DuplicateCandidate(BaseModel):
+    left_id: int
+    left_name: str
+    right_id: int
+    right_name: str
+    score: float
+    reasons: List[str] = []
+
+class MergeRequest(BaseModel):
+    target_id: int  # 保留的记录
+    source_ids: List[int] = Field(..., min_length=1)  # 合并后删除的记录
+
+class MergeResult(BaseModel):
+    target_id: int
+    merged_ids: List[int]
+    applications_moved: int
+    links_moved: int
+
+# 设备相关模型
+class DeviceBase(BaseModel):
+    token: str
+    type: str
+
+class DeviceCreate(DeviceBase):
+    pass
+
+class Device(DeviceBase):
+    id: int
+    registered_at: datetime
+    last_seen_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+# 全文检索结果模型
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    title: Optional[str] = None
+    snippet: str
+    score: float
+
+# 仪表盘汇总模型
+class SchoolApplicationSummary(BaseModel):
+    school_id: int
+    name: str
+    count: int
+
+class UpcomingDeadline(BaseModel):
+    school_id: int
+    name: str
+    program: Optional[str] = None
+    application_deadline: datetime
+    days_left: int
+
+class EmailSummary(BaseModel):
+    sent: int = 0
+    draft: int = 0
+
+class DashboardSummary(BaseModel):
+    total_applications: int
+    applications_by_status: Dict[str, int]
+    applications_by_school: List[SchoolApplicationSummary]
+    upcoming_deadlines: List[UpcomingDeadline]
+    emails: EmailSummary
+
+# 批量导入任务模型
+class IngestError(BaseModel):
+    row: int
+    field: Optional[str] = None
+    message: str
+
+class IngestJob(BaseModel):
+    id: str
+    kind: str
+    filename: str
+    status: str  # "pending", "running", "completed", "failed"
+    rows_processed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    linked: int = 0
+    failed_rows: int = 0
+    progress: Optional[float] = None
+    errors: List[IngestError] = []
+    errors_truncated: bool = False
+    detail: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
 # 包含关系的扩展模型
 class SchoolWithRelations(School):
     professors: List[Professor] = []
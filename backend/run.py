@@ -6,5 +6,10 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 if __name__ == "__main__":
-    # 启动FastAPI应用
-    uvicorn.run("backend.app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    # 启动FastAPI应用，每个工作进程通过create_app创建自己的应用实例
+    # 工作进程之间共享的状态都保存在数据库中；自动重载只支持单个工作进程
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run(
+        "backend.app.main:create_app", factory=True, host="0.0.0.0", port=8000,
+        reload=workers == 1, workers=workers
+    )
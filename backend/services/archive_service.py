@@ -0,0 +1,130 @@
+from typing import Iterable, Iterator, List, NamedTuple, Sequence
+import logging
+import os
+import re
+import zipfile
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import models
+
+logger = logging.getLogger(__name__)
+
+# 申请文档打包下载
+# ZIP在写入的同时逐块输出：ZipFile写入一个不可seek的缓冲区，每写入一块就把缓冲区中的字节交给响应，
+# 文件大小和CRC记录在每个文件之后的数据描述符中，不需要临时文件，内存占用只与块大小有关。
+# 已经压缩过的格式（PDF、图片、Office文档等）直接存储，其余文件使用deflate压缩。
+
+# 直接存储、不再压缩的扩展名
+STORED_EXTENSIONS = {
+    ".pdf", ".docx", ".xlsx", ".pptx", ".zip", ".gz", ".7z", ".rar",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".mp4", ".mov",
+}
+
+CHUNK_SIZE = 64 * 1024
+
+class BundleEntry(NamedTuple):
+    """压缩包中的一个文件"""
+    arcname: str
+    path: str
+
+class _StreamBuffer:
+    """只支持追加写入的缓冲区，ZipFile检测到不能seek时会改用数据描述符"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _safe_name(value: str) -> str:
+    # 去掉路径分隔符和控制字符，避免解压时写到目标目录之外
+    value = re.sub(r'[\x00-\x1f/\\:*?"<>|]+', "_", value).strip(" .")
+    return value or "untitled"
+
+def bundle_entries(db: Session, user_id: int, application_ids: Sequence[int]) -> List[BundleEntry]:
+    """
+    列出要打包的文档
+
+    Args:
+        db: 数据库会话
+        user_id: 用户id，只包含该用户的文档
+        application_ids: 申请记录id；多个申请时每个申请一个目录
+
+    Returns:
+        List[BundleEntry]: 压缩包中的文件，文件不存在的文档会被跳过
+    """
+    rows = db.execute(
+        select(models.Document.application_id, models.Document.path, models.School.name.label("school_name"))
+        .join(models.Application, models.Application.id == models.Document.application_id)
+        .outerjoin(models.School, models.School.id == models.Application.school_id)
+        .where(models.Document.user_id == user_id, models.Document.application_id.in_(application_ids))
+        .order_by(models.Document.application_id, models.Document.id)
+    ).all()
+
+    entries = []
+    used = set()
+    for row in rows:
+        if not row.path or not os.path.isfile(row.path):
+            logger.warning("文档文件不存在，打包时跳过: %s", row.path)
+            continue
+        filename = _safe_name(os.path.basename(row.path))
+        if len(application_ids) > 1:
+            folder = _safe_name(f"{row.application_id}_{row.school_name or 'application'}")
+            filename = f"{folder}/{filename}"
+        # 同名文件加序号
+        stem, extension = os.path.splitext(filename)
+        arcname, index = filename, 2
+        while arcname in used:
+            arcname = f"{stem} ({index}){extension}"
+            index += 1
+        used.add(arcname)
+        entries.append(BundleEntry(arcname, row.path))
+    return entries
+
+def stream_zip(entries: Iterable[BundleEntry], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    逐块生成ZIP压缩包
+
+    Args:
+        entries: 压缩包中的文件
+        chunk_size: 每次读取源文件的字节数
+
+    Yields:
+        bytes: 压缩包的下一段内容
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for entry in entries:
+            try:
+                info = zipfile.ZipInfo.from_file(entry.path, entry.arcname)
+                source = open(entry.path, "rb")
+            except OSError as e:
+                # 打包过程中文件被删除
+                logger.warning("读取文档文件失败，打包时跳过 %s: %s", entry.path, e)
+                continue
+            stored = os.path.splitext(entry.path)[1].lower() in STORED_EXTENSIONS
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            with source, archive.open(info, "w") as target:
+                for block in iter(lambda: source.read(chunk_size), b""):
+                    target.write(block)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            # 关闭文件时写入数据描述符
+            data = buffer.drain()
+            if data:
+                yield data
+    # 中央目录在关闭压缩包时写入
+    yield buffer.drain()
@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+import logging
+import secrets
+import threading
+import time
+
+import bcrypt
+from jose import JWTError, jwt
+
+from ..models import schemas
+
+logger = logging.getLogger(__name__)
+
+# 用户认证
+# 登录时用bcrypt校验密码并签发JWT访问令牌，之后的请求只校验令牌。
+# 校验通过的令牌及其用户缓存在进程内，缓存有效期内的请求既不解码JWT也不查询用户表；
+# 缓存时间较短且不超过令牌本身的有效期，用户被停用后最多cache_ttl秒内仍可访问。
+# 日历订阅等无法携带请求头的场景使用长期有效、只能用于该用途的订阅令牌。
+
+class AuthService:
+    """
+    密码哈希、访问令牌签发和带缓存的令牌校验
+    """
+
+    def __init__(
+        self,
+        secret_key: Optional[str] = None,
+        algorithm: str = "HS256",
+        token_minutes: int = 60 * 24,
+        cache_ttl: float = 60.0,
+        max_cache_entries: int = 10000
+    ):
+        """
+        初始化认证服务
+
+        Args:
+            secret_key: 签名密钥，为空时生成随机密钥（进程重启或多进程部署时令牌会失效）
+            algorithm: JWT签名算法
+            token_minutes: 访问令牌的有效期（分钟）
+            cache_ttl: 令牌校验结果的缓存时间（秒），为0时不缓存
+            max_cache_entries: 最多缓存的令牌数，超出时按LRU淘汰
+        """
+        if not secret_key:
+            logger.warning("未配置JWT_SECRET，使用随机密钥，重启或多进程部署时已签发的令牌将失效")
+            secret_key = secrets.token_urlsafe(32)
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.token_minutes = token_minutes
+        self.cache_ttl = cache_ttl
+        self.max_cache_entries = max_cache_entries
+        self._lock = threading.Lock()
+        # 令牌 -> (缓存过期的monotonic时间, 用户)
+        self._cache: "OrderedDict[str, Tuple[float, schemas.User]]" = OrderedDict()
+
+    @staticmethod
+    def hash_password(password: str) -> str:
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("ascii")
+
+    @staticmethod
+    def verify_password(password: str, hashed_password: str) -> bool:
+        try:
+            return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("ascii"))
+        except ValueError:
+            # 超过72字节的密码或格式错误的哈希
+            return False
+
+    def create_access_token(self, user_id: int) -> Tuple[str, int]:
+        """
+        签发访问令牌
+
+        Args:
+            user_id: 用户id
+
+        Returns:
+            Tuple[str, int]: (令牌, 有效期秒数)
+        """
+        expires_in = self.token_minutes * 60
+        now = int(time.time())
+        claims = {"sub": str(user_id), "iat": now, "exp": now + expires_in}
+        return jwt.encode(claims, self.secret_key, algorithm=self.algorithm), expires_in
+
+    def verify_token(
+        self,
+        token: str,
+        load_user: Callable[[int], Optional[schemas.User]]
+    ) -> Optional[schemas.User]:
+        """
+        校验访问令牌
+
+        Args:
+            token: 访问令牌
+            load_user: 缓存未命中时按用户id加载用户的函数
+
+        Returns:
+            Optional[schemas.User]: 令牌有效且用户可用时返回用户，否则返回None
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(token)
+            if entry is not None:
+                if entry[0] > now:
+                    self._cache.move_to_end(token)
+                    return entry[1]
+                del self._cache[token]
+
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            user_id = int(claims["sub"])
+        except (JWTError, KeyError, TypeError, ValueError):
+            return None
+        if "scope" in claims:
+            # 订阅令牌不能作为访问令牌使用
+            return None
+        user = load_user(user_id)
+        if user is None or not user.is_active:
+            return None
+
+        ttl = min(self.cache_ttl, claims["exp"] - time.time())
+        if ttl > 0:
+            with self._lock:
+                self._cache[token] = (now + ttl, user)
+                self._cache.move_to_end(token)
+                while len(self._cache) > self.max_cache_entries:
+                    self._cache.popitem(last=False)
+        return user
+
+    def token_user_id(self, token: str) -> Optional[int]:
+        """
+        只校验访问令牌的签名和有效期，不查询用户，供限流等在路由之前执行的逻辑区分客户端
+
+        Returns:
+            Optional[int]: 令牌中的用户id，令牌无效时为None
+        """
+        with self._lock:
+            entry = self._cache.get(token)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1].id
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            if "scope" in claims:
+                return None
+            return int(claims["sub"])
+        except (JWTError, KeyError, TypeError, ValueError):
+            return None
+
+    def create_feed_token(self, user_id: int, scope: str) -> str:
+        """
+        签发订阅令牌，令牌不会过期，只能用于scope指定的订阅，修改JWT_SECRET后全部失效
+
+        Args:
+            user_id: 用户id
+            scope: 订阅的用途，例如calendar
+        """
+        claims = {"sub": str(user_id), "scope": scope, "iat": int(time.time())}
+        return jwt.encode(claims, self.secret_key, algorithm=self.algorithm)
+
+    def verify_feed_token(self, token: str, scope: str) -> Optional[int]:
+        """校验订阅令牌，返回用户id，令牌无效或用途不符时返回None"""
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            if claims.get("scope") != scope:
+                return None
+            return int(claims["sub"])
+        except (JWTError, KeyError, TypeError, ValueError):
+            return None
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._cache.clear()
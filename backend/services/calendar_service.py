@@ -0,0 +1,154 @@
+from typing import Iterator, List, Optional
+from datetime import datetime, time
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import models
+
+# iCalendar日历订阅
+# 学校的申请开放和截止日期、申请的提交和出结果日期生成为日历事件，由一条学校左连接申请的查询得到。
+# 日期由用户录入，不带时区，按浮动时间输出（日历客户端按本地时间显示）；
+# 时间为0点的日期输出为全天事件。
+
+PRODID = "-//PhD Application Manager//Calendar//ZH"
+UID_DOMAIN = "phd-application-manager"
+
+# 日历依赖的数据，任一类型变更后重新生成
+ENTITIES = ("school", "application")
+
+# 截止日期提前提醒的天数
+DEADLINE_ALARM_DAYS = 7
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+def _fold(line: str) -> str:
+    # RFC 5545: 每行不超过75个字节，续行以一个空格开头，不能截断UTF-8字符
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    current = ""
+    size = 0
+    limit = 75
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > limit:
+            parts.append(current)
+            current, size, limit = "", 0, 74
+        current += char
+        size += char_size
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+def _date_property(name: str, value: datetime) -> str:
+    if value.time() == time(0):
+        return f"{name};VALUE=DATE:{value:%Y%m%d}"
+    return f"{name}:{value:%Y%m%dT%H%M%S}"
+
+def _event(
+    uid: str,
+    start: datetime,
+    summary: str,
+    stamp: datetime,
+    description: Optional[str] = None,
+    url: Optional[str] = None,
+    alarm_days: Optional[int] = None
+) -> Iterator[str]:
+    yield "BEGIN:VEVENT"
+    yield f"UID:{uid}@{UID_DOMAIN}"
+    yield f"DTSTAMP:{stamp:%Y%m%dT%H%M%SZ}"
+    yield _date_property("DTSTART", start)
+    yield f"SUMMARY:{_escape(summary)}"
+    if description:
+        yield f"DESCRIPTION:{_escape(description)}"
+    if url:
+        yield f"URL:{url}"
+    yield "TRANSP:TRANSPARENT"
+    if alarm_days:
+        yield "BEGIN:VALARM"
+        yield "ACTION:DISPLAY"
+        yield f"DESCRIPTION:{_escape(summary)}"
+        yield f"TRIGGER:-P{alarm_days}D"
+        yield "END:VALARM"
+    yield "END:VEVENT"
+
+def build_calendar(db: Session, user_id: int, stamp: Optional[datetime] = None) -> bytes:
+    """
+    生成用户的日历
+
+    Args:
+        db: 数据库会话
+        user_id: 用户id
+        stamp: 事件的DTSTAMP（UTC），通常为数据最后一次变更的时间
+
+    Returns:
+        bytes: text/calendar内容
+    """
+    school, application = models.School, models.Application
+    rows = db.execute(
+        select(
+            school.id.label("school_id"),
+            school.name,
+            school.department,
+            school.program,
+            school.website,
+            school.application_start,
+            school.application_deadline,
+            application.id.label("application_id"),
+            application.status,
+            application.submission_date,
+            application.result_date,
+        )
+        .outerjoin(application, (application.school_id == school.id) & (application.user_id == user_id))
+        .where(school.user_id == user_id)
+        .order_by(school.id, application.id)
+    ).all()
+
+    stamp = stamp or datetime.utcnow()
+    lines: List[str] = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:博士申请",
+        "REFRESH-INTERVAL;VALUE=DURATION:PT1H",
+        "X-PUBLISHED-TTL:PT1H",
+    ]
+    seen_schools = set()
+    for row in rows:
+        title = " ".join(part for part in (row.name, row.department, row.program) if part)
+        if row.school_id not in seen_schools:
+            seen_schools.add(row.school_id)
+            if row.application_start:
+                lines.extend(_event(
+                    f"school-{row.school_id}-start", row.application_start, f"{title} 申请开放", stamp,
+                    url=row.website
+                ))
+            if row.application_deadline:
+                lines.extend(_event(
+                    f"school-{row.school_id}-deadline", row.application_deadline, f"{title} 申请截止", stamp,
+                    url=row.website, alarm_days=DEADLINE_ALARM_DAYS
+                ))
+        if row.application_id is None:
+            continue
+        if row.submission_date:
+            lines.extend(_event(
+                f"application-{row.application_id}-submitted", row.submission_date, f"已提交 {title}", stamp,
+                description=f"状态: {row.status}" if row.status else None
+            ))
+        if row.result_date:
+            lines.extend(_event(
+                f"application-{row.application_id}-result", row.result_date,
+                f"{title} 申请结果" + (f"（{row.status}）" if row.status else ""), stamp
+            ))
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_fold(line) for line in lines) + "\r\n").encode("utf-8")
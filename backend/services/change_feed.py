@@ -0,0 +1,175 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import defaultdict
+from datetime import datetime
+
+import orjson
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from ..models import models, schemas
+from .entity_cache import mark_changed
+from .serialization import schema_columns
+
+# 增量同步的变更日志
+# crud的每次增删改在同一事务内向change_log追加一条记录（实体类型、id、操作），
+# 日志的自增id即版本号。每条记录带有数据所属的用户，客户端只会读到自己的变更，
+# 保存上次同步到的游标，之后只拉取游标之后的变更；
+# 服务端的响应缓存和导师匹配索引也以此判断数据是否变化，多个工作进程之间无需另外同步。
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+
+# 实体类型 -> (ORM模型, 变更中携带的列)
+ENTITIES = {
+    "school": (models.School, schema_columns(models.School, schemas.School)),
+    "professor": (models.Professor, schema_columns(models.Professor, schemas.Professor)),
+    "application": (models.Application, schema_columns(models.Application, schemas.Application)),
+    "document": (models.Document, schema_columns(models.Document, schemas.Document)),
+    "email": (models.Email, schema_columns(models.Email, schemas.Email)),
+    "email_reply": (models.EmailReply, schema_columns(models.EmailReply, schemas.EmailReply)),
+    "notification": (models.Notification, schema_columns(models.Notification, schemas.Notification)),
+    "device": (models.Device, schema_columns(models.Device, schemas.Device)),
+}
+
+def record_change(db: Session, user_id: int, entity: str, entity_id: int, op: str) -> None:
+    """
+    追加一条变更记录，需要在写操作提交前调用，与写操作一起提交或回滚
+
+    Args:
+        db: 数据库会话
+        user_id: 数据所属的用户id
+        entity: 实体类型，ENTITIES中的键
+        entity_id: 实体id，新建的实体需要先flush以获得id
+        op: 操作类型 create/update/delete
+    """
+    db.execute(
+        insert(models.ChangeLog.__table__)
+        .values(user_id=user_id, entity=entity, entity_id=entity_id, op=op)
+    )
+    mark_changed(db, entity, user_id, (entity_id,))
+
+def record_changes(db: Session, user_id: int, entity: str, entity_ids: List[int], op: str) -> None:
+    """批量追加同一用户、同一类型的变更记录"""
+    if entity_ids:
+        db.execute(
+            insert(models.ChangeLog.__table__),
+            [
+                {"user_id": user_id, "entity": entity, "entity_id": entity_id, "op": op}
+                for entity_id in entity_ids
+            ],
+        )
+        mark_changed(db, entity, user_id, entity_ids)
+
+def latest_version(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    当前最新的变更版本号，客户端在完整下载数据之前获取，之后以此作为游标
+
+    Args:
+        db: 数据库会话
+        user_id: 只考虑该用户的变更，为None时返回全局最新版本
+    """
+    stmt = select(models.ChangeLog.id)
+    if user_id is not None:
+        stmt = stmt.where(models.ChangeLog.user_id == user_id)
+    return db.execute(stmt.order_by(models.ChangeLog.id.desc()).limit(1)).scalar() or 0
+
+def entity_version(db: Session, user_id: int, entity: str) -> int:
+    """
+    某用户某类实体的当前版本号，即这类实体最后一次变更的版本
+
+    版本号保存在数据库中，所有工作进程看到的值一致，可用于校验各进程自己的缓存。
+    """
+    return db.execute(
+        select(func.max(models.ChangeLog.id))
+        .where(models.ChangeLog.user_id == user_id, models.ChangeLog.entity == entity)
+    ).scalar() or 0
+
+def entities_version(db: Session, user_id: int, entities: Sequence[str]) -> Tuple[int, Optional[datetime]]:
+    """
+    某用户若干类实体的当前版本号及其变更时间
+
+    Returns:
+        Tuple[int, Optional[datetime]]: (版本号, 最后一次变更的时间)，没有变更时为(0, None)
+    """
+    row = db.execute(
+        select(models.ChangeLog.id, models.ChangeLog.changed_at)
+        .where(models.ChangeLog.user_id == user_id, models.ChangeLog.entity.in_(entities))
+        .order_by(models.ChangeLog.id.desc())
+        .limit(1)
+    ).first()
+    return (row.id, row.changed_at) if row else (0, None)
+
+def get_changes(db: Session, user_id: int, since: int = 0, limit: int = 500) -> Dict[str, Any]:
+    """
+    读取游标之后的变更
+
+    同一实体在本批次内的多次变更合并为一条，版本号取最后一次；新建和更新附带实体的当前数据，
+    实体已被删除时按删除返回。
+
+    Args:
+        db: 数据库会话
+        user_id: 用户id
+        since: 上次同步返回的游标
+        limit: 本批次最多读取的变更记录数
+
+    Returns:
+        Dict[str, Any]: cursor为下次请求使用的游标，has_more表示是否还有未读取的变更，
+            changes为按版本排序的变更列表
+    """
+    log = models.ChangeLog
+    rows = db.execute(
+        select(log.id, log.entity, log.entity_id, log.op)
+        .where(log.user_id == user_id, log.id > since)
+        .order_by(log.id)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest: Dict[Tuple[str, int], Any] = {}
+    created = set()
+    for row in rows:
+        key = (row.entity, row.entity_id)
+        latest.pop(key, None)
+        latest[key] = row
+        if row.op == CREATE:
+            created.add(key)
+
+    # 每种实体只查询一次当前数据
+    pending: Dict[str, List[int]] = defaultdict(list)
+    for (entity, entity_id), row in latest.items():
+        if row.op != DELETE and entity in ENTITIES:
+            pending[entity].append(entity_id)
+    current: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for entity, entity_ids in pending.items():
+        model, columns = ENTITIES[entity]
+        stmt = select(*columns).where(model.id.in_(entity_ids), model.user_id == user_id)
+        for data in db.execute(stmt).mappings():
+            current[(entity, data["id"])] = dict(data)
+
+    changes = []
+    for key, row in latest.items():
+        data = current.get(key)
+        if data is None:
+            op = DELETE
+        else:
+            # 本批次内新建后又更新的实体仍按新建返回
+            op = CREATE if key in created else row.op
+        changes.append({
+            "version": row.id,
+            "entity": row.entity,
+            "id": row.entity_id,
+            "op": op,
+            "data": data,
+        })
+
+    return {
+        "cursor": rows[-1].id if rows else since,
+        "has_more": has_more,
+        "changes": changes,
+    }
+
+def dump_changes(changes: Dict[str, Any]) -> bytes:
+    """将get_changes的结果编码为JSON"""
+    return orjson.dumps(changes)
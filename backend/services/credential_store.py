@@ -0,0 +1,43 @@
+from typing import Optional
+
+# 凭据加密
+# 发信账户的密码以Fernet对称加密后保存在数据库中，密钥来自CREDENTIAL_KEY环境变量，
+# 所有工作进程使用同一密钥即可共享账户。未配置密钥时拒绝保存，不以明文落盘。
+
+class CredentialStore:
+    """
+    凭据加解密
+    """
+
+    def __init__(self, key: Optional[str] = None):
+        """
+        初始化凭据加解密
+
+        Args:
+            key: Fernet密钥（urlsafe base64编码的32字节），为空时不能加解密
+        """
+        self._fernet = None
+        if key:
+            try:
+                from cryptography.fernet import Fernet
+            except ImportError:
+                raise ValueError("加密保存凭据需要安装cryptography")
+            self._fernet = Fernet(key.encode() if isinstance(key, str) else key)
+
+    @property
+    def enabled(self) -> bool:
+        return self._fernet is not None
+
+    def encrypt(self, secret: str) -> str:
+        if self._fernet is None:
+            raise ValueError("未配置CREDENTIAL_KEY，不能保存凭据")
+        return self._fernet.encrypt(secret.encode("utf-8")).decode("ascii")
+
+    def decrypt(self, token: str) -> str:
+        if self._fernet is None:
+            raise ValueError("未配置CREDENTIAL_KEY，不能读取已保存的凭据")
+        from cryptography.fernet import InvalidToken
+        try:
+            return self._fernet.decrypt(token.encode("ascii")).decode("utf-8")
+        except InvalidToken:
+            raise ValueError("凭据无法解密，CREDENTIAL_KEY可能已更换")
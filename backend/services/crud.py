@@ -1,195 +1,1087 @@
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from sqlalchemy.orm.exc import ObjectDeletedError
+from typing import Iterator, List, Optional, Dict, Any, Sequence, Tuple
+from contextlib import contextmanager
 from datetime import datetime
+import json
 
-# 修改导入方式
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from models import models, schemas
+from ..models import models, schemas
+from . import change_feed, dashboard_service
+from .entity_cache import cache_for
+from .serialization import pick_columns, schema_columns
+
+# 列表查询直接选取的列，顺序与响应模型一致
+SCHOOL_COLUMNS = schema_columns(models.School, schemas.School)
+PROFESSOR_COLUMNS = schema_columns(models.Professor, schemas.Professor)
+APPLICATION_COLUMNS = schema_columns(models.Application, schemas.Application)
+DOCUMENT_COLUMNS = schema_columns(models.Document, schemas.Document)
+EMAIL_COLUMNS = schema_columns(models.Email, schemas.Email)
+NOTIFICATION_COLUMNS = schema_columns(models.Notification, schemas.Notification)
+
+# 工作单元
+# 默认每个写操作各自提交。在unit_of_work内，写操作只flush（生成id、检查约束），
+# 工作单元结束时统一提交一次：其中的写操作要么全部生效要么全部回滚，
+# 也省去了每次提交的磁盘同步和提交后重新读取对象的SELECT。
+_UNIT_OF_WORK = "unit_of_work"
+
+@contextmanager
+def unit_of_work(db: Session) -> Iterator[Session]:
+    """
+    在一个事务内执行多个crud和服务的写操作，正常退出时提交，出现异常时回滚；
+    嵌套使用时并入最外层的工作单元
+
+    Args:
+        db: 数据库会话
+
+    Yields:
+        Session: 同一个数据库会话
+    """
+    if db.info.get(_UNIT_OF_WORK):
+        yield db
+        return
+    db.info[_UNIT_OF_WORK] = True
+    expire_on_commit = db.expire_on_commit
+    try:
+        yield db
+        # 默认值都在Python端生成，flush之后对象与数据库一致，提交后不需要重新加载
+        db.expire_on_commit = False
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.expire_on_commit = expire_on_commit
+        db.info.pop(_UNIT_OF_WORK, None)
+
+def _commit(db: Session, *instances: Any) -> None:
+    """提交写操作并重新加载instances；在工作单元内只flush"""
+    if db.info.get(_UNIT_OF_WORK):
+        db.flush()
+        return
+    db.commit()
+    for instance in instances:
+        db.refresh(instance)
+
+# 除用户表外，每张表都有user_id列，以下所有查询和写入都限定在当前用户的数据内。
+# 更新接口接受任意字段时不允许修改主键和所属用户
+_PROTECTED_FIELDS = ("id", "user_id")
+
+def _assign(db_obj: Any, data: Dict[str, Any]) -> None:
+    for key, value in data.items():
+        if key not in _PROTECTED_FIELDS:
+            setattr(db_obj, key, value)
+
+def _ensure_owned(db: Session, user_id: int, model: type, entity_id: Optional[int]) -> None:
+    """被引用的记录必须属于同一用户，其他用户的记录按不存在处理"""
+    if entity_id is None:
+        return
+    owned = db.execute(
+        select(model.id).where(model.id == entity_id, model.user_id == user_id)
+    ).first()
+    if owned is None:
+        raise ValueError(f"{model.__name__} {entity_id} not found")
+
+# 用户CRUD操作
+def create_user(db: Session, email: str, hashed_password: str) -> models.User:
+    db_user = models.User(email=email, hashed_password=hashed_password)
+    try:
+        with db.begin_nested():
+            db.add(db_user)
+    except IntegrityError:
+        raise ValueError("Email already registered")
+    _commit(db, db_user)
+    return db_user
+
+def get_user(db: Session, user_id: int) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.id == user_id).first()
+
+def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.email == email).first()
+
+def count_users(db: Session) -> int:
+    return db.query(models.User).count()
+
+def assign_unowned_rows(db: Session, user_id: int) -> int:
+    """
+    将按用户分区之前创建的数据（user_id为空）归属到指定用户
+
+    Returns:
+        int: 更新的行数
+    """
+    entities = {model.__table__: entity for entity, (model, _) in change_feed.ENTITIES.items()}
+    assigned = 0
+    for table in models.Base.metadata.sorted_tables:
+        if "user_id" not in table.c or table.c.user_id.primary_key:
+            continue
+        entity = entities.get(table)
+        if entity is None:
+            assigned += db.execute(
+                update(table).where(table.c.user_id.is_(None)).values(user_id=user_id)
+            ).rowcount
+            continue
+        # 同步的实体需要记录变更，客户端才能拉取到归属过来的数据
+        ids = list(db.scalars(select(table.c.id).where(table.c.user_id.is_(None))))
+        if ids:
+            db.execute(update(table).where(table.c.id.in_(ids)).values(user_id=user_id))
+            change_feed.record_changes(db, user_id, entity, ids, change_feed.UPDATE)
+            assigned += len(ids)
+    _commit(db)
+    if assigned:
+        dashboard_service.rebuild_dashboard_summary(db)
+    return assigned
+
+# 删除实体时引用它的外键 -> (子实体类型, 外键列)
+_CHILD_REFERENCES = {
+    "school": (("application", models.Application.school_id),),
+    "professor": (("application", models.Application.professor_id),),
+    "application": (
+        ("document", models.Document.application_id),
+        ("email", models.Email.application_id),
+        ("email_reply", models.EmailReply.application_id),
+    ),
+}
+
+def _detach_children(db: Session, user_id: int, entity: str, entity_id: int) -> None:
+    """
+    删除实体前置空引用它的外键，并为受影响的子实体记录变更
+
+    不显式处理时ORM会在flush时自动置空这些外键，但不会写change_log，增量同步的客户端看不到这些修改
+    """
+    for child, column in _CHILD_REFERENCES[entity]:
+        model = column.class_
+        ids = list(db.scalars(select(model.id).where(column == entity_id, model.user_id == user_id)))
+        if not ids:
+            continue
+        values = {column.key: None}
+        if "updated_at" in model.__table__.c:
+            values["updated_at"] = datetime.utcnow()
+        db.execute(update(model).where(model.id.in_(ids)).values(values))
+        change_feed.record_changes(db, user_id, child, ids, change_feed.UPDATE)
 
 # 学校CRUD操作
-def create_school(db: Session, school: schemas.SchoolCreate) -> models.School:
-    db_school = models.School(**school.model_dump())
+def create_school(db: Session, user_id: int, school: schemas.SchoolCreate) -> models.School:
+    db_school = models.School(**school.model_dump(), user_id=user_id)
     db.add(db_school)
-    db.commit()
-    db.refresh(db_school)
+    db.flush()
+    change_feed.record_change(db, user_id, "school", db_school.id, change_feed.CREATE)
+    _commit(db, db_school)
     return db_school
 
-def get_school(db: Session, school_id: int) -> Optional[models.School]:
-    return db.query(models.School).filter(models.School.id == school_id).first()
+def _load_school(db: Session, user_id: int, school_id: int) -> Optional[models.School]:
+    # 写操作使用的ORM对象，不经过缓存
+    return db.query(models.School).filter(models.School.id == school_id, models.School.user_id == user_id).first()
 
-def get_schools(db: Session, skip: int = 0, limit: int = 100) -> List[models.School]:
-    return db.query(models.School).offset(skip).limit(limit).all()
+def get_school(db: Session, user_id: int, school_id: int) -> Optional[Row]:
+    """读取学校，结果缓存在进程内（见entity_cache），返回只读的行"""
+    return cache_for(db).get(
+        db, "school", user_id, school_id,
+        lambda: db.execute(
+            select(*SCHOOL_COLUMNS).where(models.School.id == school_id, models.School.user_id == user_id)
+        ).first()
+    )
 
-def update_school(db: Session, school_id: int, school_data: Dict[str, Any]) -> Optional[models.School]:
-    db_school = get_school(db, school_id)
+def get_schools(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.School]:
+    return db.query(models.School).filter(models.School.user_id == user_id).offset(skip).limit(limit).all()
+
+def get_school_rows(db: Session, user_id: int, skip: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None) -> List[Row]:
+    return cache_for(db).get_list(
+        db, "school", user_id, (skip, limit, tuple(fields or ())),
+        lambda: db.execute(
+            select(*pick_columns(SCHOOL_COLUMNS, fields)).where(models.School.user_id == user_id).offset(skip).limit(limit)
+        ).all()
+    )
+
+def update_school(db: Session, user_id: int, school_id: int, school_data: Dict[str, Any]) -> Optional[models.School]:
+    db_school = _load_school(db, user_id, school_id)
     if db_school:
-        for key, value in school_data.items():
-            setattr(db_school, key, value)
-        db.commit()
-        db.refresh(db_school)
+        _assign(db_school, school_data)
+        change_feed.record_change(db, user_id, "school", db_school.id, change_feed.UPDATE)
+        _commit(db, db_school)
     return db_school
 
-def delete_school(db: Session, school_id: int) -> bool:
-    db_school = get_school(db, school_id)
+def delete_school(db: Session, user_id: int, school_id: int) -> bool:
+    db_school = _load_school(db, user_id, school_id)
     if db_school:
+        _detach_children(db, user_id, "school", db_school.id)
+        dashboard_service.delete_school_counts(db, [db_school.id])
         db.delete(db_school)
-        db.commit()
+        change_feed.record_change(db, user_id, "school", db_school.id, change_feed.DELETE)
+        _commit(db)
         return True
     return False
 
+SchoolKey = Tuple[str, Optional[str]]
+
+def _by_columns(rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    # executemany要求每行的键相同，导入的行只包含表格中有值的列，按列的组合分组
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return list(groups.values())
+
+def _bulk_insert(db: Session, table, rows: List[Dict[str, Any]]) -> None:
+    for group in _by_columns(rows):
+        db.execute(insert(table), group)
+
+def _bulk_update(db: Session, table, rows: List[Dict[str, Any]]) -> None:
+    # 每行以_id指定主键，其余键作为SET的列，相同列的行一次executemany；行中没有的列保持原值
+    for group in _by_columns(rows):
+        db.execute(update(table).where(table.c.id == bindparam("_id")), group)
+
+def upsert_schools(db: Session, user_id: int, schools: List[Dict[str, Any]]) -> Tuple[List[int], List[int]]:
+    """
+    按自然键（名称+院系）批量插入或更新用户的学校，在一个事务内完成
+
+    Args:
+        db: 数据库会话
+        user_id: 用户id
+        schools: 已校验的学校数据，只包含需要写入的列，更新时其他列保持原值；
+            同一自然键出现多次时以最后一行为准
+
+    Returns:
+        (新建的学校id列表, 更新的学校id列表)
+    """
+    by_key: Dict[SchoolKey, Dict[str, Any]] = {}
+    for school in schools:
+        by_key[(school["name"], school.get("department"))] = school
+    existing = get_school_ids_by_keys(db, user_id, by_key.keys())
+
+    inserts = [{**values, "user_id": user_id} for key, values in by_key.items() if key not in existing]
+    updates = [{**values, "_id": existing[key]} for key, values in by_key.items() if key in existing]
+    inserted_ids: List[int] = []
+    if inserts:
+        # 使用Core的executemany一次写入整批，再按自然键取回新id，比逐行INSERT ... RETURNING快得多
+        _bulk_insert(db, models.School.__table__, inserts)
+        created = get_school_ids_by_keys(db, user_id, [key for key in by_key if key not in existing])
+        inserted_ids = list(created.values())
+    if updates:
+        _bulk_update(db, models.School.__table__, updates)
+    updated_ids = [values["_id"] for values in updates]
+    change_feed.record_changes(db, user_id, "school", inserted_ids, change_feed.CREATE)
+    change_feed.record_changes(db, user_id, "school", updated_ids, change_feed.UPDATE)
+    _commit(db)
+    return inserted_ids, updated_ids
+
+def get_school_ids_by_keys(db: Session, user_id: int, keys) -> Dict[SchoolKey, int]:
+    """按自然键（名称+院系）查询用户的学校id，院系为None时匹配院系为空的学校"""
+    keys = set(keys)
+    names = {name for name, _ in keys}
+    if not names:
+        return {}
+    rows = db.execute(
+        select(models.School.id, models.School.name, models.School.department)
+        .where(models.School.user_id == user_id, models.School.name.in_(list(names)))
+    ).all()
+    return {(row.name, row.department): row.id for row in rows if (row.name, row.department) in keys}
+
 # 导师CRUD操作
-def create_professor(db: Session, professor: schemas.ProfessorCreate) -> models.Professor:
-    db_professor = models.Professor(**professor.model_dump())
+def create_professor(db: Session, user_id: int, professor: schemas.ProfessorCreate) -> models.Professor:
+    db_professor = models.Professor(**professor.model_dump(), user_id=user_id)
     db.add(db_professor)
-    db.commit()
-    db.refresh(db_professor)
+    db.flush()
+    change_feed.record_change(db, user_id, "professor", db_professor.id, change_feed.CREATE)
+    _commit(db, db_professor)
     return db_professor
 
-def get_professor(db: Session, professor_id: int) -> Optional[models.Professor]:
-    return db.query(models.Professor).filter(models.Professor.id == professor_id).first()
+def _load_professor(db: Session, user_id: int, professor_id: int) -> Optional[models.Professor]:
+    return (
+        db.query(models.Professor)
+        .filter(models.Professor.id == professor_id, models.Professor.user_id == user_id)
+        .first()
+    )
 
-def get_professors(db: Session, skip: int = 0, limit: int = 100) -> List[models.Professor]:
-    return db.query(models.Professor).offset(skip).limit(limit).all()
+def get_professor(db: Session, user_id: int, professor_id: int) -> Optional[Row]:
+    """读取导师，结果缓存在进程内（见entity_cache），返回只读的行"""
+    return cache_for(db).get(
+        db, "professor", user_id, professor_id,
+        lambda: db.execute(
+            select(*PROFESSOR_COLUMNS).where(models.Professor.id == professor_id, models.Professor.user_id == user_id)
+        ).first()
+    )
 
-def update_professor(db: Session, professor_id: int, professor_data: Dict[str, Any]) -> Optional[models.Professor]:
-    db_professor = get_professor(db, professor_id)
+def get_professors(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Professor]:
+    return db.query(models.Professor).filter(models.Professor.user_id == user_id).offset(skip).limit(limit).all()
+
+def get_professor_rows(db: Session, user_id: int, skip: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None) -> List[Row]:
+    return cache_for(db).get_list(
+        db, "professor", user_id, (skip, limit, tuple(fields or ())),
+        lambda: db.execute(
+            select(*pick_columns(PROFESSOR_COLUMNS, fields)).where(models.Professor.user_id == user_id).offset(skip).limit(limit)
+        ).all()
+    )
+
+def get_professors_by_ids(db: Session, user_id: int, professor_ids: List[int]) -> List[models.Professor]:
+    if not professor_ids:
+        return []
+    return (
+        db.query(models.Professor)
+        .filter(models.Professor.id.in_(professor_ids), models.Professor.user_id == user_id)
+        .all()
+    )
+
+def update_professor(db: Session, user_id: int, professor_id: int, professor_data: Dict[str, Any]) -> Optional[models.Professor]:
+    db_professor = _load_professor(db, user_id, professor_id)
     if db_professor:
-        for key, value in professor_data.items():
-            setattr(db_professor, key, value)
-        db.commit()
-        db.refresh(db_professor)
+        _assign(db_professor, professor_data)
+        change_feed.record_change(db, user_id, "professor", db_professor.id, change_feed.UPDATE)
+        _commit(db, db_professor)
     return db_professor
 
-def delete_professor(db: Session, professor_id: int) -> bool:
-    db_professor = get_professor(db, professor_id)
+def delete_professor(db: Session, user_id: int, professor_id: int) -> bool:
+    db_professor = _load_professor(db, user_id, professor_id)
     if db_professor:
+        _detach_children(db, user_id, "professor", db_professor.id)
         db.delete(db_professor)
-        db.commit()
+        change_feed.record_change(db, user_id, "professor", db_professor.id, change_feed.DELETE)
+        _commit(db)
         return True
     return False
 
+def _get_professor_ids_by_keys(db: Session, user_id: int, keys) -> Dict[Tuple[str, str], int]:
+    keys = set(keys)
+    names = {name for name, _ in keys}
+    if not names:
+        return {}
+    rows = db.execute(
+        select(models.Professor.id, models.Professor.name, models.Professor.email)
+        .where(models.Professor.user_id == user_id, models.Professor.name.in_(list(names)))
+    ).all()
+    return {(row.name, row.email): row.id for row in rows if (row.name, row.email) in keys}
+
+def upsert_professors(
+    db: Session,
+    user_id: int,
+    professors: List[Dict[str, Any]],
+    school_keys: List[List[SchoolKey]]
+) -> Dict[str, Any]:
+    """
+    按自然键（姓名+邮箱）批量插入或更新用户的导师，并关联到该用户的学校，在一个事务内完成
+
+    Args:
+        db: 数据库会话
+        user_id: 用户id
+        professors: 已校验的导师数据，只包含需要写入的列，更新时其他列保持原值；
+            同一自然键出现多次时以最后一行为准
+        school_keys: 与professors一一对应，每位导师需要关联的学校自然键
+
+    Returns:
+        Dict[str, Any]: inserted和updated为导师id列表，linked为新增的关联数，
+            missing_schools为{professors中的下标: 找不到的学校自然键列表}
+    """
+    by_key: Dict[Tuple[str, str], int] = {}
+    for index, professor in enumerate(professors):
+        by_key[(professor["name"], professor["email"])] = index
+    existing = _get_professor_ids_by_keys(db, user_id, by_key.keys())
+
+    insert_keys = [key for key in by_key if key not in existing]
+    update_keys = [key for key in by_key if key in existing]
+    ids = dict(existing)
+    if insert_keys:
+        _bulk_insert(db, models.Professor.__table__, [
+            {**professors[by_key[key]], "user_id": user_id} for key in insert_keys
+        ])
+        ids.update(_get_professor_ids_by_keys(db, user_id, insert_keys))
+    if update_keys:
+        _bulk_update(db, models.Professor.__table__, [
+            {**professors[by_key[key]], "_id": existing[key]} for key in update_keys
+        ])
+
+    # 学校关联只增不删，已存在的关联跳过
+    school_ids = get_school_ids_by_keys(
+        db, user_id, {school_key for index in by_key.values() for school_key in school_keys[index]}
+    )
+    missing: Dict[int, List[SchoolKey]] = {}
+    pairs = set()
+    for key, index in by_key.items():
+        for school_key in school_keys[index]:
+            if school_key in school_ids:
+                pairs.add((school_ids[school_key], ids[key]))
+            else:
+                missing.setdefault(index, []).append(school_key)
+    if pairs:
+        link = models.school_professor
+        existing_pairs = set(db.execute(
+            select(link.c.school_id, link.c.professor_id)
+            .where(link.c.professor_id.in_(list({professor_id for _, professor_id in pairs})))
+        ).tuples())
+        pairs -= existing_pairs
+        if pairs:
+            db.execute(insert(link), [
+                {"school_id": school_id, "professor_id": professor_id} for school_id, professor_id in pairs
+            ])
+
+    inserted_ids = [ids[key] for key in insert_keys]
+    updated_ids = [existing[key] for key in update_keys]
+    change_feed.record_changes(db, user_id, "professor", inserted_ids, change_feed.CREATE)
+    change_feed.record_changes(db, user_id, "professor", updated_ids, change_feed.UPDATE)
+    _commit(db)
+    return {
+        "inserted": inserted_ids,
+        "updated": updated_ids,
+        "linked": len(pairs),
+        "missing_schools": missing,
+    }
+
+# 合并重复的学校/导师：实体类型 -> (模型, 申请记录中的外键列, 关联表中自己的列, 关联表中对方的列)
+_MERGE_TARGETS = {
+    "school": (models.School, "school_id", "school_id", "professor_id"),
+    "professor": (models.Professor, "professor_id", "professor_id", "school_id"),
+}
+
+def merge_duplicates(db: Session, user_id: int, entity: str, target_id: int, source_ids: List[int]) -> Dict[str, Any]:
+    """
+    把重复的学校或导师合并到目标记录，在一个事务内完成：
+    申请记录改为指向目标，学校-导师关联转移到目标（已有的关联不重复），
+    目标为空的字段用被合并记录的值补全，然后删除被合并的记录
+
+    Args:
+        db: 数据库会话
+        user_id: 用户id
+        entity: "school"或"professor"
+        target_id: 保留的记录id
+        source_ids: 被合并的记录id
+
+    Returns:
+        dict: 合并的记录id、改为指向目标的申请记录数和转移的关联数
+
+    Raises:
+        ValueError: 记录不存在或不属于该用户
+    """
+    model, foreign_key, own_column, other_column = _MERGE_TARGETS[entity]
+    source_ids = sorted(set(source_ids) - {target_id})
+    if not source_ids:
+        raise ValueError("No records to merge")
+    records = {
+        record.id: record
+        for record in db.query(model).filter(model.user_id == user_id, model.id.in_(source_ids + [target_id]))
+    }
+    missing = [record_id for record_id in [target_id] + source_ids if record_id not in records]
+    if missing:
+        raise ValueError(f"{model.__name__} {missing[0]} not found")
+
+    target = records[target_id]
+    for column in model.__table__.columns:
+        if column.primary_key or column.name == "user_id" or getattr(target, column.name) not in (None, ""):
+            continue
+        for source_id in source_ids:
+            value = getattr(records[source_id], column.name)
+            if value not in (None, ""):
+                setattr(target, column.name, value)
+                break
+    db.flush()
+
+    applications = models.Application.__table__
+    application_ids = list(db.scalars(
+        select(applications.c.id)
+        .where(applications.c.user_id == user_id, applications.c[foreign_key].in_(source_ids))
+    ))
+    if application_ids:
+        db.execute(
+            update(applications)
+            .where(applications.c.id.in_(application_ids))
+            .values({foreign_key: target_id, "updated_at": datetime.utcnow()})
+        )
+    if entity == "school":
+        dashboard_service.merge_school_counts(db, user_id, source_ids, target_id)
+
+    link = models.school_professor
+    linked = set(db.scalars(select(link.c[other_column]).where(link.c[own_column] == target_id)))
+    moved = set(db.scalars(select(link.c[other_column]).where(link.c[own_column].in_(source_ids)))) - linked
+    db.execute(link.delete().where(link.c[own_column].in_(source_ids)))
+    if moved:
+        db.execute(insert(link), [{own_column: target_id, other_column: other_id} for other_id in sorted(moved)])
+
+    db.execute(model.__table__.delete().where(model.__table__.c.id.in_(source_ids)))
+    change_feed.record_changes(db, user_id, "application", application_ids, change_feed.UPDATE)
+    change_feed.record_change(db, user_id, entity, target_id, change_feed.UPDATE)
+    change_feed.record_changes(db, user_id, entity, source_ids, change_feed.DELETE)
+    _commit(db)
+    return {
+        "target_id": target_id,
+        "merged_ids": source_ids,
+        "applications_moved": len(application_ids),
+        "links_moved": len(moved),
+    }
+
 # 申请记录CRUD操作
-def create_application(db: Session, application: schemas.ApplicationCreate) -> models.Application:
-    db_application = models.Application(**application.model_dump())
+def _summary_fields(db_application: models.Application) -> Dict[str, Any]:
+    return {"status": db_application.status, "school_id": db_application.school_id}
+
+def _lock_summary_fields(db: Session, db_application: models.Application) -> Optional[Dict[str, Any]]:
+    """
+    在写事务中取得申请的当前status和school_id，用于调整仪表盘计数
+
+    先前读到的值可能已被并发的写操作修改，两个修改都按旧值调整计数会使计数偏离。
+    以读到的值为条件UPDATE该行：命中说明值未变，同时取得该行的写锁，提交前不会再被修改；
+    未命中时重新读取再试。
+
+    Returns:
+        Optional[Dict[str, Any]]: 当前的status和school_id，申请已被删除时为None
+    """
+    table = models.Application.__table__
+    while True:
+        old = _summary_fields(db_application)
+        claimed = db.execute(
+            update(table)
+            .where(
+                table.c.id == db_application.id,
+                table.c.status == old["status"],
+                table.c.school_id == old["school_id"],
+            )
+            .values(updated_at=datetime.utcnow())
+        ).rowcount
+        if claimed:
+            return old
+        try:
+            db.refresh(db_application)
+        except ObjectDeletedError:
+            return None
+
+def create_application(db: Session, user_id: int, application: schemas.ApplicationCreate) -> models.Application:
+    _ensure_owned(db, user_id, models.School, application.school_id)
+    _ensure_owned(db, user_id, models.Professor, application.professor_id)
+    db_application = models.Application(**application.model_dump(), user_id=user_id)
     db.add(db_application)
-    db.commit()
-    db.refresh(db_application)
+    dashboard_service.track_application(db, user_id, None, _summary_fields(db_application))
+    db.flush()
+    change_feed.record_change(db, user_id, "application", db_application.id, change_feed.CREATE)
+    _commit(db, db_application)
     return db_application
 
-def get_application(db: Session, application_id: int) -> Optional[models.Application]:
-    return db.query(models.Application).filter(models.Application.id == application_id).first()
+def get_application(db: Session, user_id: int, application_id: int) -> Optional[models.Application]:
+    return (
+        db.query(models.Application)
+        .filter(models.Application.id == application_id, models.Application.user_id == user_id)
+        .first()
+    )
+
+def get_applications(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Application]:
+    return db.query(models.Application).filter(models.Application.user_id == user_id).offset(skip).limit(limit).all()
+
+def get_application_rows(db: Session, user_id: int, skip: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None) -> List[Row]:
+    return db.execute(
+        select(*pick_columns(APPLICATION_COLUMNS, fields)).where(models.Application.user_id == user_id).offset(skip).limit(limit)
+    ).all()
 
-def get_applications(db: Session, skip: int = 0, limit: int = 100) -> List[models.Application]:
-    return db.query(models.Application).offset(skip).limit(limit).all()
+def count_applications(db: Session, user_id: int, application_ids: List[int]) -> int:
+    """统计application_ids中属于该用户的申请数"""
+    return db.execute(
+        select(func.count())
+        .select_from(models.Application)
+        .where(models.Application.user_id == user_id, models.Application.id.in_(set(application_ids)))
+    ).scalar_one()
 
-def update_application(db: Session, application_id: int, application_data: Dict[str, Any]) -> Optional[models.Application]:
-    db_application = get_application(db, application_id)
+def update_application(db: Session, user_id: int, application_id: int, application_data: Dict[str, Any]) -> Optional[models.Application]:
+    db_application = get_application(db, user_id, application_id)
     if db_application:
-        for key, value in application_data.items():
-            setattr(db_application, key, value)
+        if "school_id" in application_data:
+            _ensure_owned(db, user_id, models.School, application_data["school_id"])
+        if "professor_id" in application_data:
+            _ensure_owned(db, user_id, models.Professor, application_data["professor_id"])
+        old = _lock_summary_fields(db, db_application)
+        if old is None:
+            return None
+        _assign(db_application, application_data)
         db_application.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(db_application)
+        dashboard_service.track_application(db, user_id, old, _summary_fields(db_application))
+        change_feed.record_change(db, user_id, "application", db_application.id, change_feed.UPDATE)
+        _commit(db, db_application)
     return db_application
 
-def delete_application(db: Session, application_id: int) -> bool:
-    db_application = get_application(db, application_id)
+def delete_application(db: Session, user_id: int, application_id: int) -> bool:
+    db_application = get_application(db, user_id, application_id)
     if db_application:
+        old = _lock_summary_fields(db, db_application)
+        if old is None:
+            return False
+        dashboard_service.track_application(db, user_id, old, None)
+        _detach_children(db, user_id, "application", db_application.id)
         db.delete(db_application)
-        db.commit()
+        change_feed.record_change(db, user_id, "application", db_application.id, change_feed.DELETE)
+        _commit(db)
         return True
     return False
 
 # 文档CRUD操作
-def create_document(db: Session, document: schemas.DocumentCreate) -> models.Document:
-    db_document = models.Document(**document.model_dump())
+def create_document(
+    db: Session,
+    user_id: int,
+    document: schemas.DocumentCreate,
+    content_hash: Optional[str] = None,
+    extraction_status: Optional[str] = None
+) -> models.Document:
+    _ensure_owned(db, user_id, models.Application, document.application_id)
+    # 相同内容的文本已经提取过时直接复用
+    extracted = db.get(models.DocumentText, content_hash) if content_hash else None
+    db_document = models.Document(
+        **document.model_dump(),
+        user_id=user_id,
+        content_hash=content_hash,
+        extraction_status="completed" if extracted else extraction_status,
+        page_count=extracted.page_count if extracted else None
+    )
     db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+    db.flush()
+    change_feed.record_change(db, user_id, "document", db_document.id, change_feed.CREATE)
+    _commit(db, db_document)
     return db_document
 
-def get_document(db: Session, document_id: int) -> Optional[models.Document]:
-    return db.query(models.Document).filter(models.Document.id == document_id).first()
+def get_document(db: Session, user_id: int, document_id: int) -> Optional[models.Document]:
+    return (
+        db.query(models.Document)
+        .filter(models.Document.id == document_id, models.Document.user_id == user_id)
+        .first()
+    )
 
-def get_documents(db: Session, application_id: Optional[int] = None, skip: int = 0, limit: int = 100) -> List[models.Document]:
-    query = db.query(models.Document)
+def get_documents(db: Session, user_id: int, application_id: Optional[int] = None, skip: int = 0, limit: int = 100) -> List[models.Document]:
+    query = db.query(models.Document).filter(models.Document.user_id == user_id)
     if application_id:
         query = query.filter(models.Document.application_id == application_id)
     return query.offset(skip).limit(limit).all()
 
-def delete_document(db: Session, document_id: int) -> bool:
-    db_document = get_document(db, document_id)
+def get_document_rows(db: Session, user_id: int, application_id: Optional[int] = None, skip: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None) -> List[Row]:
+    stmt = select(*pick_columns(DOCUMENT_COLUMNS, fields)).where(models.Document.user_id == user_id)
+    if application_id:
+        stmt = stmt.where(models.Document.application_id == application_id)
+    return db.execute(stmt.offset(skip).limit(limit)).all()
+
+def delete_document(db: Session, user_id: int, document_id: int) -> bool:
+    db_document = get_document(db, user_id, document_id)
     if db_document:
         db.delete(db_document)
-        db.commit()
+        change_feed.record_change(db, user_id, "document", db_document.id, change_feed.DELETE)
+        _commit(db)
         return True
     return False
 
+def get_document_text(db: Session, content_hash: str) -> Optional[models.DocumentText]:
+    return db.get(models.DocumentText, content_hash)
+
+def _set_extraction_result(db: Session, content_hash: str, values: Dict[str, Any]) -> int:
+    # 更新所有等待该内容提取结果的文档（可能属于不同用户），并为每位用户记录变更
+    rows = db.execute(
+        select(models.Document.id, models.Document.user_id)
+        .where(models.Document.content_hash == content_hash, models.Document.extraction_status == "pending")
+    ).all()
+    if not rows:
+        return 0
+    db.execute(
+        update(models.Document)
+        .where(models.Document.id.in_([row.id for row in rows]))
+        .values(**values)
+    )
+    by_user: Dict[int, List[int]] = {}
+    for row in rows:
+        by_user.setdefault(row.user_id, []).append(row.id)
+    for owner_id, document_ids in by_user.items():
+        change_feed.record_changes(db, owner_id, "document", document_ids, change_feed.UPDATE)
+    return len(rows)
+
+def complete_document_extraction(db: Session, content_hash: str, text: str, page_count: Optional[int]) -> int:
+    """
+    保存提取出的文本，并把内容相同、等待提取的文档标记为完成
+
+    Returns:
+        int: 更新的文档数
+    """
+    db.merge(models.DocumentText(content_hash=content_hash, text=text, page_count=page_count))
+    # 文本需要先写入，更新文档时全文检索触发器才能读到
+    db.flush()
+    count = _set_extraction_result(
+        db, content_hash, {"extraction_status": "completed", "extraction_error": None, "page_count": page_count}
+    )
+    _commit(db)
+    return count
+
+def fail_document_extraction(db: Session, content_hash: str, error: str, status: str = "failed") -> int:
+    """把内容相同、等待提取的文档标记为失败，返回更新的文档数"""
+    count = _set_extraction_result(db, content_hash, {"extraction_status": status, "extraction_error": error})
+    _commit(db)
+    return count
+
+def get_pending_extractions(db: Session) -> List[Tuple[str, str]]:
+    """等待提取的文档内容，每个content_hash返回一个文件路径"""
+    return [
+        (row.content_hash, row.path) for row in db.execute(
+            select(models.Document.content_hash, func.min(models.Document.path).label("path"))
+            .where(models.Document.extraction_status == "pending", models.Document.content_hash.is_not(None))
+            .group_by(models.Document.content_hash)
+        )
+    ]
+
+def reset_document_extraction(db: Session, user_id: int, document_id: int) -> Optional[models.Document]:
+    """把文档重新标记为等待提取"""
+    db_document = get_document(db, user_id, document_id)
+    if db_document:
+        db_document.extraction_status = "pending"
+        db_document.extraction_error = None
+        change_feed.record_change(db, user_id, "document", db_document.id, change_feed.UPDATE)
+        _commit(db, db_document)
+    return db_document
+
 # 邮件CRUD操作
-def create_email(db: Session, email: schemas.EmailCreate) -> models.Email:
-    db_email = models.Email(**email.model_dump())
+def create_email(db: Session, user_id: int, email: schemas.EmailCreate) -> models.Email:
+    _ensure_owned(db, user_id, models.Application, email.application_id)
+    db_email = models.Email(**email.model_dump(), user_id=user_id)
     db.add(db_email)
-    db.commit()
-    db.refresh(db_email)
+    dashboard_service.track_email(db, user_id, None, bool(db_email.is_sent))
+    db.flush()
+    change_feed.record_change(db, user_id, "email", db_email.id, change_feed.CREATE)
+    _commit(db, db_email)
     return db_email
 
-def get_email(db: Session, email_id: int) -> Optional[models.Email]:
-    return db.query(models.Email).filter(models.Email.id == email_id).first()
+def get_email(db: Session, user_id: int, email_id: int) -> Optional[models.Email]:
+    return db.query(models.Email).filter(models.Email.id == email_id, models.Email.user_id == user_id).first()
 
-def get_emails(db: Session, application_id: Optional[int] = None, skip: int = 0, limit: int = 100) -> List[models.Email]:
-    query = db.query(models.Email)
+def get_emails(db: Session, user_id: int, application_id: Optional[int] = None, skip: int = 0, limit: int = 100) -> List[models.Email]:
+    query = db.query(models.Email).filter(models.Email.user_id == user_id)
     if application_id:
         query = query.filter(models.Email.application_id == application_id)
     return query.offset(skip).limit(limit).all()
 
-def update_email(db: Session, email_id: int, is_sent: bool = True) -> Optional[models.Email]:
-    db_email = get_email(db, email_id)
+def get_email_rows(db: Session, user_id: int, application_id: Optional[int] = None, skip: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None) -> List[Row]:
+    stmt = select(*pick_columns(EMAIL_COLUMNS, fields)).where(models.Email.user_id == user_id)
+    if application_id:
+        stmt = stmt.where(models.Email.application_id == application_id)
+    return db.execute(stmt.offset(skip).limit(limit)).all()
+
+def update_email(db: Session, user_id: int, email_id: int, is_sent: bool = True, message_id: Optional[str] = None) -> Optional[models.Email]:
+    db_email = get_email(db, user_id, email_id)
     if db_email:
+        dashboard_service.track_email(db, user_id, bool(db_email.is_sent), is_sent)
         db_email.is_sent = is_sent
         db_email.sent_at = datetime.utcnow()
-        db.commit()
-        db.refresh(db_email)
+        if message_id:
+            db_email.message_id = message_id
+        change_feed.record_change(db, user_id, "email", db_email.id, change_feed.UPDATE)
+        _commit(db, db_email)
     return db_email
 
-def delete_email(db: Session, email_id: int) -> bool:
-    db_email = get_email(db, email_id)
+def delete_email(db: Session, user_id: int, email_id: int) -> bool:
+    db_email = get_email(db, user_id, email_id)
     if db_email:
+        dashboard_service.track_email(db, user_id, bool(db_email.is_sent), None)
+        reply_ids = list(db.scalars(select(models.EmailReply.id).where(models.EmailReply.email_id == db_email.id)))
+        if reply_ids:
+            db.query(models.EmailReply).filter(models.EmailReply.id.in_(reply_ids)).delete(synchronize_session=False)
+            change_feed.record_changes(db, user_id, "email_reply", reply_ids, change_feed.DELETE)
         db.delete(db_email)
-        db.commit()
+        change_feed.record_change(db, user_id, "email", db_email.id, change_feed.DELETE)
+        _commit(db)
+        return True
+    return False
+
+# 发信账户CRUD操作
+def save_email_account(db: Session, user_id: int, account: schemas.EmailAccountCreate, password_encrypted: str) -> models.EmailAccount:
+    """按用户名新建或更新用户的发信账户，密码需要由调用方加密"""
+    db_account = (
+        db.query(models.EmailAccount)
+        .filter(models.EmailAccount.user_id == user_id, models.EmailAccount.username == account.username)
+        .first()
+    )
+    if db_account is None:
+        db_account = models.EmailAccount(user_id=user_id, username=account.username)
+        db.add(db_account)
+    db_account.smtp_server = account.smtp_server
+    db_account.smtp_port = account.smtp_port
+    if (db_account.imap_server, db_account.imap_port) != (account.imap_server, account.imap_port):
+        # 换了收件服务器，同步进度不再有效
+        db.query(models.MailboxState).filter(models.MailboxState.account_id == db_account.id).delete(synchronize_session=False)
+    db_account.imap_server = account.imap_server
+    db_account.imap_port = account.imap_port
+    db_account.password_encrypted = password_encrypted
+    _commit(db, db_account)
+    return db_account
+
+def get_email_account(db: Session, user_id: int, account_id: int) -> Optional[models.EmailAccount]:
+    return (
+        db.query(models.EmailAccount)
+        .filter(models.EmailAccount.id == account_id, models.EmailAccount.user_id == user_id)
+        .first()
+    )
+
+def get_email_accounts(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.EmailAccount]:
+    return (
+        db.query(models.EmailAccount)
+        .filter(models.EmailAccount.user_id == user_id)
+        .order_by(models.EmailAccount.id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+def delete_email_account(db: Session, user_id: int, account_id: int) -> bool:
+    db_account = get_email_account(db, user_id, account_id)
+    if db_account:
+        db.query(models.MailboxState).filter(models.MailboxState.account_id == db_account.id).delete(synchronize_session=False)
+        db.delete(db_account)
+        _commit(db)
         return True
     return False
 
+def get_imap_account_ids(db: Session) -> List[int]:
+    """所有用户中设置了收件服务器的账户，供后台同步使用"""
+    return list(db.scalars(
+        select(models.EmailAccount.id)
+        .where(models.EmailAccount.imap_server.is_not(None))
+        .order_by(models.EmailAccount.id)
+    ))
+
+# 收件箱同步CRUD操作
+def get_mailbox_state(db: Session, account_id: int, mailbox: str) -> Optional[models.MailboxState]:
+    return (
+        db.query(models.MailboxState)
+        .filter(models.MailboxState.account_id == account_id, models.MailboxState.mailbox == mailbox)
+        .first()
+    )
+
+def save_mailbox_state(db: Session, account_id: int, mailbox: str, uidvalidity: int, last_uid: int) -> models.MailboxState:
+    """记录同步进度，每拉取一批邮件调用一次，中断后从上次的进度继续"""
+    state = get_mailbox_state(db, account_id, mailbox)
+    if state is None:
+        state = models.MailboxState(account_id=account_id, mailbox=mailbox)
+        db.add(state)
+    state.uidvalidity = uidvalidity
+    state.last_uid = last_uid
+    state.synced_at = datetime.utcnow()
+    _commit(db)
+    return state
+
+def get_earliest_unreplied_sent_at(db: Session, user_id: int) -> Optional[datetime]:
+    """尚未收到回复的已发送邮件中最早的发送时间，首次同步时只需查找此后收到的邮件"""
+    replied = select(models.EmailReply.email_id).where(models.EmailReply.user_id == user_id)
+    return db.scalar(
+        select(func.min(models.Email.sent_at))
+        .where(
+            models.Email.user_id == user_id,
+            models.Email.message_id.is_not(None),
+            models.Email.id.not_in(replied),
+        )
+    )
+
+def get_emails_by_message_ids(db: Session, user_id: int, message_ids: List[str]) -> Dict[str, models.Email]:
+    if not message_ids:
+        return {}
+    emails = (
+        db.query(models.Email)
+        .filter(models.Email.user_id == user_id, models.Email.message_id.in_(message_ids))
+        .all()
+    )
+    return {email.message_id: email for email in emails}
+
+def get_reply_message_ids(db: Session, user_id: int, message_ids: List[str]) -> set:
+    """已经保存过的回复，重复同步时跳过"""
+    if not message_ids:
+        return set()
+    return set(db.scalars(
+        select(models.EmailReply.message_id)
+        .where(models.EmailReply.user_id == user_id, models.EmailReply.message_id.in_(message_ids))
+    ))
+
+def create_email_reply(
+    db: Session,
+    user_id: int,
+    email: models.Email,
+    message_id: str,
+    sender: Optional[str],
+    subject: Optional[str],
+    received_at: Optional[datetime]
+) -> Optional[models.EmailReply]:
+    """保存回复，另一个进程已经保存过同一封回复时返回None"""
+    db_reply = models.EmailReply(
+        user_id=user_id,
+        email_id=email.id,
+        application_id=email.application_id,
+        message_id=message_id,
+        sender=sender,
+        subject=subject,
+        received_at=received_at,
+    )
+    try:
+        # 只回滚这一条，不影响所在工作单元中的其他写操作
+        with db.begin_nested():
+            db.add(db_reply)
+    except IntegrityError:
+        return None
+    change_feed.record_change(db, user_id, "email_reply", db_reply.id, change_feed.CREATE)
+    _commit(db, db_reply)
+    return db_reply
+
+def get_email_replies(db: Session, user_id: int, email_id: Optional[int] = None, skip: int = 0, limit: int = 100) -> List[models.EmailReply]:
+    query = db.query(models.EmailReply).filter(models.EmailReply.user_id == user_id)
+    if email_id is not None:
+        query = query.filter(models.EmailReply.email_id == email_id)
+    return query.order_by(models.EmailReply.received_at.desc(), models.EmailReply.id.desc()).offset(skip).limit(limit).all()
+
+def get_professor_name_by_email(db: Session, user_id: int, address: str) -> Optional[str]:
+    return db.scalar(
+        select(models.Professor.name)
+        .where(models.Professor.user_id == user_id, func.lower(models.Professor.email) == address.lower())
+        .limit(1)
+    )
+
 # 通知CRUD操作
-def create_notification(db: Session, notification: schemas.NotificationCreate) -> models.Notification:
-    db_notification = models.Notification(**notification.model_dump())
+def create_notification(db: Session, user_id: int, notification: schemas.NotificationCreate) -> models.Notification:
+    db_notification = models.Notification(**notification.model_dump(), user_id=user_id)
     db.add(db_notification)
-    db.commit()
-    db.refresh(db_notification)
+    db.flush()
+    change_feed.record_change(db, user_id, "notification", db_notification.id, change_feed.CREATE)
+    _commit(db, db_notification)
     return db_notification
 
-def get_notification(db: Session, notification_id: int) -> Optional[models.Notification]:
-    return db.query(models.Notification).filter(models.Notification.id == notification_id).first()
+def get_notification(db: Session, user_id: int, notification_id: int) -> Optional[models.Notification]:
+    return (
+        db.query(models.Notification)
+        .filter(models.Notification.id == notification_id, models.Notification.user_id == user_id)
+        .first()
+    )
 
-def get_notifications(db: Session, is_read: Optional[bool] = None, skip: int = 0, limit: int = 100) -> List[models.Notification]:
-    query = db.query(models.Notification)
+def get_notifications(db: Session, user_id: int, is_read: Optional[bool] = None, skip: int = 0, limit: int = 100) -> List[models.Notification]:
+    query = db.query(models.Notification).filter(models.Notification.user_id == user_id)
     if is_read is not None:
         query = query.filter(models.Notification.is_read == is_read)
     return query.order_by(models.Notification.created_at.desc()).offset(skip).limit(limit).all()
 
-def mark_notification_read(db: Session, notification_id: int, is_read: bool = True) -> Optional[models.Notification]:
-    db_notification = get_notification(db, notification_id)
+def get_notification_rows(db: Session, user_id: int, is_read: Optional[bool] = None, skip: int = 0, limit: int = 100, fields: Optional[Sequence[str]] = None) -> List[Row]:
+    stmt = select(*pick_columns(NOTIFICATION_COLUMNS, fields)).where(models.Notification.user_id == user_id)
+    if is_read is not None:
+        stmt = stmt.where(models.Notification.is_read == is_read)
+    return db.execute(stmt.order_by(models.Notification.created_at.desc()).offset(skip).limit(limit)).all()
+
+def mark_notification_read(db: Session, user_id: int, notification_id: int, is_read: bool = True) -> Optional[models.Notification]:
+    db_notification = get_notification(db, user_id, notification_id)
     if db_notification:
         db_notification.is_read = is_read
-        db.commit()
-        db.refresh(db_notification)
+        change_feed.record_change(db, user_id, "notification", db_notification.id, change_feed.UPDATE)
+        _commit(db, db_notification)
     return db_notification
 
-def delete_notification(db: Session, notification_id: int) -> bool:
-    db_notification = get_notification(db, notification_id)
+def delete_notification(db: Session, user_id: int, notification_id: int) -> bool:
+    db_notification = get_notification(db, user_id, notification_id)
     if db_notification:
         db.delete(db_notification)
-        db.commit()
+        change_feed.record_change(db, user_id, "notification", db_notification.id, change_feed.DELETE)
+        _commit(db)
         return True
-    return False 
\ No newline at end of file
+    return False 
+
+# 设备CRUD操作
+def get_device_by_token(db: Session, token: str) -> Optional[models.Device]:
+    # 设备令牌全局唯一，不按用户过滤；调用方需要检查所属用户
+    return db.query(models.Device).filter(models.Device.token == token).first()
+
+def get_devices(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Device]:
+    return (
+        db.query(models.Device)
+        .filter(models.Device.user_id == user_id)
+        .order_by(models.Device.id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+def register_device(db: Session, user_id: int, device: schemas.DeviceCreate) -> models.Device:
+    # 按令牌去重：已注册的设备只刷新类型和最近活跃时间
+    db_device = get_device_by_token(db, device.token)
+    if db_device is None:
+        db_device = models.Device(**device.model_dump(), user_id=user_id)
+        try:
+            with db.begin_nested():
+                db.add(db_device)
+        except IntegrityError:
+            # 并发注册同一令牌时由唯一索引兜底，回滚到保存点后按已有记录处理
+            db_device = get_device_by_token(db, device.token)
+        else:
+            change_feed.record_change(db, user_id, "device", db_device.id, change_feed.CREATE)
+            _commit(db, db_device)
+            return db_device
+    if db_device.user_id != user_id:
+        # 设备换了登录用户，推送改为发给新用户
+        change_feed.record_change(db, db_device.user_id, "device", db_device.id, change_feed.DELETE)
+        db_device.user_id = user_id
+        change_feed.record_change(db, user_id, "device", db_device.id, change_feed.CREATE)
+    else:
+        change_feed.record_change(db, user_id, "device", db_device.id, change_feed.UPDATE)
+    db_device.type = device.type
+    db_device.last_seen_at = datetime.utcnow()
+    _commit(db, db_device)
+    return db_device
+
+def iter_device_tokens(db: Session, user_id: int, batch_size: int = 500) -> Iterator[List[str]]:
+    """按主键游标分批读取用户的设备令牌，内存占用只与批大小有关"""
+    last_id = 0
+    while True:
+        rows = (
+            db.query(models.Device.id, models.Device.token)
+            .filter(models.Device.user_id == user_id, models.Device.id > last_id)
+            .order_by(models.Device.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield [row.token for row in rows]
+
+def get_owned_device_tokens(db: Session, user_id: int, tokens: List[str], chunk_size: int = 500) -> List[str]:
+    """从给定的令牌中筛选出属于用户的令牌，保持原有顺序"""
+    owned = set()
+    for i in range(0, len(tokens), chunk_size):
+        owned.update(
+            row.token for row in
+            db.query(models.Device.token)
+            .filter(models.Device.user_id == user_id, models.Device.token.in_(tokens[i:i + chunk_size]))
+        )
+    return [token for token in tokens if token in owned]
+
+def delete_devices_by_tokens(db: Session, user_id: int, tokens: List[str], chunk_size: int = 500) -> int:
+    deleted = 0
+    for i in range(0, len(tokens), chunk_size):
+        device_ids = [
+            row.id for row in
+            db.query(models.Device.id)
+            .filter(models.Device.user_id == user_id, models.Device.token.in_(tokens[i:i + chunk_size]))
+        ]
+        if not device_ids:
+            continue
+        deleted += (
+            db.query(models.Device)
+            .filter(models.Device.id.in_(device_ids))
+            .delete(synchronize_session=False)
+        )
+        change_feed.record_changes(db, user_id, "device", device_ids, change_feed.DELETE)
+    _commit(db)
+    return deleted
+
+# 批量导入任务
+def save_ingest_job(db: Session, job: Dict[str, Any]) -> None:
+    """按任务id插入或更新导入任务的状态，errors为行级错误列表"""
+    data = {**job, "errors": json.dumps(job.get("errors") or [], ensure_ascii=False)}
+    db.merge(models.IngestJob(**data))
+    _commit(db)
+
+def get_ingest_job(db: Session, user_id: int, job_id: str) -> Optional[models.IngestJob]:
+    return (
+        db.query(models.IngestJob)
+        .filter(models.IngestJob.id == job_id, models.IngestJob.user_id == user_id)
+        .first()
+    )
+
+def delete_old_ingest_jobs(db: Session, user_id: int, keep: int = 100) -> int:
+    """每位用户只保留最近创建的keep个导入任务"""
+    recent = (
+        select(models.IngestJob.id)
+        .where(models.IngestJob.user_id == user_id)
+        .order_by(models.IngestJob.created_at.desc())
+        .limit(keep)
+    )
+    deleted = (
+        db.query(models.IngestJob)
+        .filter(models.IngestJob.user_id == user_id, models.IngestJob.id.not_in(recent.scalar_subquery()))
+        .delete(synchronize_session=False)
+    )
+    _commit(db)
+    return deleted
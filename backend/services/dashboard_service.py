@@ -0,0 +1,239 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, insert, inspect, literal, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from ..models import models
+
+# 仪表盘汇总
+# 每位用户各状态的申请数、每所学校的申请数和已发送/草稿邮件数保存在汇总表中，
+# 由crud的写操作在同一事务内增量更新，仪表盘读取时不需要扫描业务表。
+# 汇总表首次创建时（或调用rebuild时）用GROUP BY从业务表重新计算。
+
+APPLICATION_STATUS = "application_status"
+EMAIL_STATE = "email_state"
+
+def _status_key(status: Optional[str]) -> str:
+    return status or ""
+
+def _email_key(is_sent: Optional[bool]) -> str:
+    return "sent" if is_sent else "draft"
+
+def _adjust_counter(db: Session, user_id: int, metric: str, key: str, delta: int) -> None:
+    counter = models.SummaryCounter.__table__
+    result = db.execute(
+        update(counter)
+        .where(counter.c.user_id == user_id, counter.c.metric == metric, counter.c.key == key)
+        .values(count=counter.c.count + delta)
+    )
+    if result.rowcount == 0:
+        db.execute(insert(counter).values(user_id=user_id, metric=metric, key=key, count=delta))
+
+def _adjust_school(db: Session, user_id: int, school_id: Optional[int], delta: int) -> None:
+    if school_id is None:
+        return
+    counts = models.SchoolApplicationCount.__table__
+    result = db.execute(
+        update(counts)
+        .where(counts.c.school_id == school_id)
+        .values(count=counts.c.count + delta)
+    )
+    if result.rowcount == 0:
+        db.execute(insert(counts).values(school_id=school_id, user_id=user_id, count=delta))
+
+def track_application(
+    db: Session,
+    user_id: int,
+    old: Optional[Dict[str, Any]],
+    new: Optional[Dict[str, Any]]
+) -> None:
+    """
+    按申请记录的变化调整汇总计数，需要在写操作提交前调用
+
+    Args:
+        db: 数据库会话
+        user_id: 申请记录所属的用户id
+        old: 变化前的status和school_id，新建时为None
+        new: 变化后的status和school_id，删除时为None
+    """
+    old_status = _status_key(old["status"]) if old else None
+    new_status = _status_key(new["status"]) if new else None
+    if old_status != new_status:
+        if old_status is not None:
+            _adjust_counter(db, user_id, APPLICATION_STATUS, old_status, -1)
+        if new_status is not None:
+            _adjust_counter(db, user_id, APPLICATION_STATUS, new_status, 1)
+
+    old_school = old["school_id"] if old else None
+    new_school = new["school_id"] if new else None
+    if old_school != new_school:
+        _adjust_school(db, user_id, old_school, -1)
+        _adjust_school(db, user_id, new_school, 1)
+
+def merge_school_counts(db: Session, user_id: int, source_ids: List[int], target_id: int) -> None:
+    """
+    合并学校时把被合并学校的申请数加到目标学校上，需要在写操作提交前调用
+
+    Args:
+        db: 数据库会话
+        user_id: 学校所属的用户id
+        source_ids: 被合并的学校id
+        target_id: 保留的学校id
+    """
+    counts = models.SchoolApplicationCount.__table__
+    moved = db.scalar(select(func.coalesce(func.sum(counts.c.count), 0)).where(counts.c.school_id.in_(source_ids)))
+    delete_school_counts(db, source_ids)
+    if moved:
+        _adjust_school(db, user_id, target_id, moved)
+
+def delete_school_counts(db: Session, school_ids: List[int]) -> None:
+    """删除学校时删除其申请数，申请的school_id已被置空，需要在写操作提交前调用"""
+    counts = models.SchoolApplicationCount.__table__
+    db.execute(delete(counts).where(counts.c.school_id.in_(school_ids)))
+
+def track_email(db: Session, user_id: int, old_is_sent: Optional[bool], new_is_sent: Optional[bool]) -> None:
+    """
+    按邮件发送状态的变化调整汇总计数，需要在写操作提交前调用
+
+    Args:
+        db: 数据库会话
+        user_id: 邮件所属的用户id
+        old_is_sent: 变化前的发送状态，新建时为None
+        new_is_sent: 变化后的发送状态，删除时为None
+    """
+    old_key = _email_key(old_is_sent) if old_is_sent is not None else None
+    new_key = _email_key(new_is_sent) if new_is_sent is not None else None
+    if old_key == new_key:
+        return
+    if old_key is not None:
+        _adjust_counter(db, user_id, EMAIL_STATE, old_key, -1)
+    if new_key is not None:
+        _adjust_counter(db, user_id, EMAIL_STATE, new_key, 1)
+
+def _rebuild(conn: Connection) -> None:
+    counter = models.SummaryCounter.__table__
+    school_counts = models.SchoolApplicationCount.__table__
+    applications = models.Application.__table__
+    emails = models.Email.__table__
+
+    conn.execute(delete(counter))
+    conn.execute(delete(school_counts))
+    # 尚未归属任何用户的旧数据不计入汇总
+    status = func.coalesce(applications.c.status, "")
+    conn.execute(insert(counter).from_select(
+        ["user_id", "metric", "key", "count"],
+        select(applications.c.user_id, literal(APPLICATION_STATUS), status, func.count())
+        .where(applications.c.user_id.is_not(None))
+        .group_by(applications.c.user_id, status),
+    ))
+    email_state = case((emails.c.is_sent == True, "sent"), else_="draft")  # noqa: E712
+    conn.execute(insert(counter).from_select(
+        ["user_id", "metric", "key", "count"],
+        select(emails.c.user_id, literal(EMAIL_STATE), email_state, func.count())
+        .where(emails.c.user_id.is_not(None))
+        .group_by(emails.c.user_id, email_state),
+    ))
+    conn.execute(insert(school_counts).from_select(
+        ["school_id", "user_id", "count"],
+        select(applications.c.school_id, applications.c.user_id, func.count())
+        .where(applications.c.school_id.is_not(None), applications.c.user_id.is_not(None))
+        .group_by(applications.c.school_id, applications.c.user_id),
+    ))
+
+def rebuild_dashboard_summary(db: Session) -> None:
+    """从业务表重新计算全部汇总计数"""
+    _rebuild(db.connection())
+    db.commit()
+
+def ensure_dashboard_summary(engine: Engine) -> None:
+    """
+    确保汇总表存在，汇总表为空时从现有数据回填
+
+    Args:
+        engine: 数据库引擎，需要在业务表创建之后调用
+    """
+    summary_tables = [models.SummaryCounter.__table__, models.SchoolApplicationCount.__table__]
+    with engine.begin() as conn:
+        # 按用户分区之前创建的汇总表主键不含user_id，汇总数据可以重新计算，直接重建
+        inspector = inspect(conn)
+        counter_table = models.SummaryCounter.__tablename__
+        if (inspector.has_table(counter_table)
+                and "user_id" not in inspector.get_pk_constraint(counter_table)["constrained_columns"]):
+            for table in summary_tables:
+                table.drop(conn, checkfirst=True)
+        for table in summary_tables:
+            table.create(conn, checkfirst=True)
+        empty = all(conn.execute(select(literal(1)).select_from(table).limit(1)).first() is None
+                    for table in summary_tables)
+        if empty:
+            _rebuild(conn)
+
+def get_dashboard_summary(
+    db: Session,
+    user_id: int,
+    days: int = 30,
+    school_limit: int = 10,
+    deadline_limit: int = 10,
+    now: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """
+    读取仪表盘汇总数据
+
+    Args:
+        db: 数据库会话
+        user_id: 用户id
+        days: 统计未来多少天内的截止日期
+        school_limit: 返回申请数最多的前几所学校
+        deadline_limit: 最多返回多少个截止日期
+        now: 当前时间，默认为datetime.utcnow()
+
+    Returns:
+        Dict[str, Any]: 与schemas.DashboardSummary对应的字典
+    """
+    now = now or datetime.utcnow()
+    counter = models.SummaryCounter
+
+    rows = db.execute(
+        select(counter.metric, counter.key, counter.count)
+        .where(counter.user_id == user_id, counter.count > 0)
+    ).all()
+    by_status = {row.key: row.count for row in rows if row.metric == APPLICATION_STATUS}
+    emails = {row.key: row.count for row in rows if row.metric == EMAIL_STATE}
+
+    by_school = db.execute(
+        select(models.School.id, models.School.name, models.SchoolApplicationCount.count)
+        .join(models.School, models.School.id == models.SchoolApplicationCount.school_id)
+        .where(models.SchoolApplicationCount.user_id == user_id, models.SchoolApplicationCount.count > 0)
+        .order_by(models.SchoolApplicationCount.count.desc(), models.School.id)
+        .limit(school_limit)
+    ).all()
+
+    deadlines = db.execute(
+        select(models.School.id, models.School.name, models.School.program, models.School.application_deadline)
+        .where(models.School.user_id == user_id)
+        .where(models.School.application_deadline >= now)
+        .where(models.School.application_deadline <= now + timedelta(days=days))
+        .order_by(models.School.application_deadline)
+        .limit(deadline_limit)
+    ).all()
+
+    return {
+        "total_applications": sum(by_status.values()),
+        "applications_by_status": by_status,
+        "applications_by_school": [
+            {"school_id": row.id, "name": row.name, "count": row.count} for row in by_school
+        ],
+        "upcoming_deadlines": [
+            {
+                "school_id": row.id,
+                "name": row.name,
+                "program": row.program,
+                "application_deadline": row.application_deadline,
+                "days_left": (row.application_deadline - now).days,
+            }
+            for row in deadlines
+        ],
+        "emails": {"sent": emails.get("sent", 0), "draft": emails.get("draft", 0)},
+    }
@@ -0,0 +1,250 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import re
+import unicodedata
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import models
+
+# 重复记录检测
+# 逐对比较全部学校或导师是O(n²)的。这里先为每条记录生成若干分块键（规范化后的名称词、缩写、
+# 姓+名首字母、邮箱及邮箱域名），只在共享同一个键的记录之间计算字符串相似度，
+# 比较次数约为 记录数 × 块大小。过大的块（例如所有名称含"university"的学校）区分度太低，直接跳过。
+# 相似度不低于阈值的记录对作为合并候选返回，合并由crud.merge_duplicates在一个事务内完成。
+
+DEFAULT_THRESHOLD = 0.8
+
+# 超过此大小的块不做两两比较
+MAX_BLOCK_SIZE = 200
+
+# 长度决定的相似度上界低于此值时不再计算，按0处理
+MIN_SIMILARITY = 0.5
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CJK = r"\u3400-\u9fff\uf900-\ufaff"
+_CJK_RUN = re.compile(f"[{_CJK}]+")
+_NAME_PART = re.compile(f"[a-z0-9]+|[{_CJK}]+")
+
+_STOP_WORDS = {"of", "the", "at", "and", "in", "for", "de", "la", "du", "der", "und"}
+# 学校名称中常见的词，参与相似度和缩写但不作为分块键
+_SCHOOL_GENERIC = {
+    "university", "univ", "college", "institute", "school", "technology", "science", "sciences",
+    "national", "state", "polytechnic", "大学", "学院", "大學", "學院",
+}
+_TITLES = {"prof", "professor", "dr", "mr", "ms", "mrs", "教授", "博士", "老师"}
+
+class Candidate(NamedTuple):
+    """一对疑似重复的记录"""
+    left_id: int
+    left_name: str
+    right_id: int
+    right_name: str
+    score: float
+    reasons: List[str]
+
+class _Record(NamedTuple):
+    id: int
+    name: str
+    normalized: str
+    tokens: Tuple[str, ...]
+    acronym: str
+    extra: Tuple[Optional[str], ...]  # 学校: (院系,)；导师: (姓, 名, 邮箱, 邮箱域名)
+    keys: Tuple[str, ...]
+
+def _normalize(value: Optional[str]) -> str:
+    # 去掉重音符号和标点，全角转半角，统一小写
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(char for char in value if not unicodedata.combining(char)).lower()
+    return " ".join(_NAME_PART.findall(value))
+
+def _lcs_length(a: str, b: str) -> int:
+    # 位并行的最长公共子序列（Hyyrö 2004）：a的每个位置对应整数的一位，b的每个字符只需几次整数运算
+    masks: Dict[str, int] = {}
+    for index, char in enumerate(a):
+        masks[char] = masks.get(char, 0) | (1 << index)
+    full = (1 << len(a)) - 1
+    row = full
+    for char in b:
+        matched = row & masks.get(char, 0)
+        row = ((row + matched) | (row - matched)) & full
+    return len(a) - bin(row).count("1")
+
+def _similarity(a: str, b: str) -> float:
+    """归一化的编辑相似度 2·LCS / (len(a) + len(b))，与difflib的ratio含义相同"""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    total = len(a) + len(b)
+    if 2 * min(len(a), len(b)) / total < MIN_SIMILARITY:
+        return 0.0
+    return 2 * _lcs_length(a, b) / total
+
+def _jaccard(a: Iterable[str], b: Iterable[str]) -> float:
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def _school_record(row) -> _Record:
+    normalized = _normalize(row.name)
+    tokens = tuple(token for token in normalized.split() if token not in _STOP_WORDS)
+    latin = [token for token in tokens if _WORD.fullmatch(token)]
+    acronym = "".join(token[0] for token in latin) if len(latin) > 1 else ""
+    keys = {f"t:{token}" for token in tokens if len(token) > 2 and token not in _SCHOOL_GENERIC}
+    for run in _CJK_RUN.findall(normalized):
+        # 中文名称按相邻两个字分块
+        keys.update(f"t:{run[i:i + 2]}" for i in range(len(run) - 1) if run[i:i + 2] not in _SCHOOL_GENERIC)
+    # 缩写与全称分到同一块：MIT / Massachusetts Institute of Technology
+    if acronym:
+        keys.add(f"a:{acronym}")
+    if len(tokens) == 1 and 2 <= len(tokens[0]) <= 6 and _WORD.fullmatch(tokens[0]):
+        keys.add(f"a:{tokens[0]}")
+    return _Record(row.id, row.name or "", normalized, tokens, acronym, (_normalize(row.department),), tuple(keys))
+
+def _split_person(normalized: str, raw: str) -> Tuple[str, Tuple[str, ...]]:
+    tokens = [token for token in normalized.split() if token not in _TITLES]
+    if not tokens:
+        return "", ()
+    if all(_CJK_RUN.fullmatch(token) for token in tokens):
+        # 中文姓名：第一个字为姓
+        name = "".join(tokens)
+        return name[:1], (name[1:],) if len(name) > 1 else ()
+    if "," in raw:
+        # "Smith, John"
+        surname = _normalize(raw.split(",", 1)[0]).split()
+        if surname:
+            surname_tokens = len(surname)
+            return " ".join(tokens[:surname_tokens]), tuple(tokens[surname_tokens:])
+    return tokens[-1], tuple(tokens[:-1])
+
+def _professor_record(row) -> _Record:
+    normalized = _normalize(row.name)
+    surname, given = _split_person(normalized, row.name or "")
+    email = (row.email or "").strip().lower() or None
+    domain = email.rpartition("@")[2] if email and "@" in email else None
+    initial = given[0][:1] if given else ""
+    keys = set()
+    if surname:
+        keys.add(f"n:{surname}|{initial}")
+    if email:
+        keys.add(f"e:{email}")
+    if domain and initial:
+        # 同一单位、名字首字母相同，覆盖姓的拼写错误
+        keys.add(f"d:{domain}|{initial}")
+    tokens = tuple(token for token in normalized.split() if token not in _TITLES)
+    return _Record(row.id, row.name or "", " ".join(tokens), tokens, "", (surname, " ".join(given), email, domain), tuple(keys))
+
+def _school_score(a: _Record, b: _Record, threshold: float) -> Tuple[float, List[str]]:
+    department_a, department_b = a.extra[0], b.extra[0]
+    # 同一学校的不同院系是不同的记录
+    if department_a and department_b and _similarity(department_a, department_b) < DEFAULT_THRESHOLD:
+        return 0.0, []
+    compact_a, compact_b = a.normalized.replace(" ", ""), b.normalized.replace(" ", "")
+    if compact_a == compact_b:
+        return 1.0, ["名称相同"]
+    if (a.acronym and a.acronym == compact_b) or (b.acronym and b.acronym == compact_a):
+        return 0.95, ["名称缩写"]
+    tokens = _jaccard(a.tokens, b.tokens)
+    text = _similarity(a.normalized, b.normalized)
+    if tokens >= text:
+        return tokens, ["名称用词相同" if tokens == 1.0 else "名称用词相近"]
+    return text, ["名称相似"]
+
+def _given_score(a: str, b: str) -> Tuple[float, Optional[str]]:
+    if not a or not b:
+        return 0.8, None
+    if a == b:
+        return 1.0, None
+    first_a, first_b = a.split()[0], b.split()[0]
+    # J. Smith / John Smith
+    if (len(first_a) == 1 or len(first_b) == 1) and first_a[0] == first_b[0]:
+        return 0.9, "名字缩写"
+    return _similarity(a, b), None
+
+def _professor_score(a: _Record, b: _Record, threshold: float) -> Tuple[float, List[str]]:
+    surname_a, given_a, email_a, domain_a = a.extra
+    surname_b, given_b, email_b, domain_b = b.extra
+    if email_a and email_a == email_b:
+        return 1.0, ["邮箱相同"]
+    given, reason = _given_score(given_a, given_b)
+    # 名字差别已经大到姓完全相同也达不到阈值时，不再比较姓
+    if 0.6 + 0.4 * given + 0.05 < threshold:
+        return 0.0, []
+    surname = _similarity(surname_a, surname_b)
+    if surname < DEFAULT_THRESHOLD:
+        return 0.0, []
+    score = 0.6 * surname + 0.4 * given
+    reasons = ["姓相同" if surname == 1.0 else "姓相似"]
+    if reason:
+        reasons.append(reason)
+    if domain_a and domain_b:
+        if domain_a == domain_b:
+            score = min(1.0, score + 0.05)
+            reasons.append("邮箱域名相同")
+        else:
+            score -= 0.25
+            reasons.append("邮箱域名不同")
+    return score, reasons
+
+# 实体类型 -> (查询的列, 记录构造, 相似度)
+_ENTITIES = {
+    "school": (
+        (models.School.id, models.School.name, models.School.department),
+        _school_record,
+        _school_score,
+    ),
+    "professor": (
+        (models.Professor.id, models.Professor.name, models.Professor.email),
+        _professor_record,
+        _professor_score,
+    ),
+}
+
+def find_duplicates(
+    db: Session,
+    user_id: int,
+    entity: str,
+    threshold: float = DEFAULT_THRESHOLD,
+    limit: int = 100
+) -> List[Candidate]:
+    """
+    查找用户的学校或导师中疑似重复的记录
+
+    Args:
+        db: 数据库会话
+        user_id: 用户id
+        entity: "school"或"professor"
+        threshold: 相似度阈值，MIN_SIMILARITY到1
+        limit: 最多返回的候选数
+
+    Returns:
+        List[Candidate]: 按相似度从高到低排列的候选
+    """
+    columns, make_record, score = _ENTITIES[entity]
+    model = columns[0].class_
+    rows = db.execute(select(*columns).where(model.user_id == user_id).execution_options(yield_per=1000))
+
+    blocks: Dict[str, List[_Record]] = defaultdict(list)
+    for row in rows:
+        record = make_record(row)
+        for key in record.keys:
+            blocks[key].append(record)
+
+    compared: Set[Tuple[int, int]] = set()
+    candidates = []
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > MAX_BLOCK_SIZE:
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pair = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                value, reasons = score(a, b, threshold)
+                if value >= threshold:
+                    left, right = (a, b) if a.id < b.id else (b, a)
+                    candidates.append(Candidate(left.id, left.name, right.id, right.name, round(value, 3), reasons))
+    candidates.sort(key=lambda candidate: (-candidate.score, candidate.left_id, candidate.right_id))
+    return candidates[:limit]
@@ -2,11 +2,14 @@ import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
+from email.utils import make_msgid
 from typing import List, Dict, Optional, Any
 import os
 import json
 from datetime import datetime
 
+from .metrics import SMTP_SEND_DURATION, SMTP_SENDS, track_call
+
 class EmailService:
     """邮件服务，负责发送和管理邮件"""
     
@@ -31,6 +34,33 @@ class EmailService:
         self.username = username
         self.password = password
         
+    def with_account(
+        self,
+        username: str,
+        password: str,
+        smtp_server: Optional[str] = None,
+        smtp_port: Optional[int] = None
+    ) -> "EmailService":
+        """
+        返回使用指定账户的新服务实例，当前实例不受影响
+        共享的服务实例可能同时被多个请求使用，按请求切换账户时应使用此方法而不是修改属性
+
+        Args:
+            username: 邮箱用户名
+            password: 邮箱密码或应用密码
+            smtp_server: SMTP服务器地址，默认沿用当前实例的配置
+            smtp_port: SMTP服务器端口，默认沿用当前实例的配置
+
+        Returns:
+            EmailService: 新的邮件服务实例
+        """
+        return EmailService(
+            smtp_server=smtp_server or self.smtp_server,
+            smtp_port=smtp_port or self.smtp_port,
+            username=username,
+            password=password
+        )
+
     def setup_email_account(self, username: str, password: str) -> bool:
         """
         设置邮箱账户
@@ -56,6 +86,7 @@ class EmailService:
             print(f"Email account setup failed: {str(e)}")
             return False
     
+    @track_call(SMTP_SEND_DURATION, SMTP_SENDS)
     def send_email(
         self, 
         subject: str, 
@@ -77,7 +108,7 @@ class EmailService:
             bcc: 密送邮箱列表
         
         Returns:
-            dict: 包含发送状态和消息的字典
+            dict: 包含发送状态和消息的字典，发送成功时message_id为邮件的Message-ID，用于匹配回复
         """
         if not self.username or not self.password:
             return {"success": False, "message": "Email account not setup"}
@@ -87,6 +118,8 @@ class EmailService:
             msg['From'] = self.username
             msg['To'] = to_email
             msg['Subject'] = subject
+            # 使用发件人的域名生成Message-ID，回复邮件的In-Reply-To/References会引用它
+            msg['Message-ID'] = make_msgid(domain=self.username.split("@")[-1] if "@" in self.username else None)
             
             if cc:
                 msg['Cc'] = ", ".join(cc)
@@ -121,6 +154,7 @@ class EmailService:
             return {
                 "success": True, 
                 "message": "Email sent successfully",
+                "message_id": msg['Message-ID'],
                 "timestamp": datetime.utcnow().isoformat()
             }
             
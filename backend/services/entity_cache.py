@@ -0,0 +1,227 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import threading
+import time
+
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from ..models import models
+from .metrics import ENTITY_CACHE_INVALIDATIONS, ENTITY_CACHE_LOOKUPS
+
+# 学校/导师读穿缓存
+# 学校和导师的读取远多于写入。单条记录和列表分页在进程内按LRU缓存，缓存的是不可变的Row，
+# 各请求共享同一份快照。
+# 失效分两路：本进程的写操作经change_feed.record_change登记，事务提交后立即失效；
+# 其他工作进程的写操作通过轮询change_log发现，每个进程至多每sync_interval秒查询一次，
+# 跨进程的陈旧时间不超过sync_interval。
+# 读取数据库和写入缓存之间如果发生了失效，这次读到的结果不写入缓存，避免把旧数据放回去。
+# 每个应用使用自己的缓存实例，通过会话工厂的info传给会话（见cache_for），
+# 同一进程中连接不同数据库的应用不会互相读到对方的数据；没有指定时使用进程内共享的实例。
+
+ENTITIES = ("school", "professor")
+
+_PENDING_KEY = "entity_cache_pending"
+# 会话info中保存该会话所用缓存的键
+SESSION_INFO_KEY = "entity_cache"
+
+ItemKey = Tuple[str, int, int]  # (实体类型, 用户id, 实体id)
+GroupKey = Tuple[str, int]  # (实体类型, 用户id)
+
+class EntityCache:
+    """
+    进程内的学校/导师缓存
+    """
+
+    def __init__(self, max_entries: int = 4096, sync_interval: float = 1.0):
+        """
+        初始化实体缓存
+
+        Args:
+            max_entries: 最多缓存的单条记录数，列表分页另按用户计数；为0时不缓存
+            sync_interval: 轮询change_log获取其他进程写操作的最小间隔（秒）
+        """
+        self.max_entries = max_entries
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[ItemKey, Row]" = OrderedDict()
+        # 每个用户每类实体的列表分页: (skip, limit) -> 行
+        self._lists: "OrderedDict[GroupKey, Dict[Hashable, Tuple[Row, ...]]]" = OrderedDict()
+        self._generation = 0
+        self._cursor: Optional[int] = None
+        self._synced_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def configure(self, max_entries: int, sync_interval: float) -> None:
+        """修改容量和轮询间隔并清空缓存，应用启动时调用"""
+        with self._lock:
+            self.max_entries = max_entries
+            self.sync_interval = sync_interval
+            self._clear()
+
+    def _clear(self) -> None:
+        self._items.clear()
+        self._lists.clear()
+        self._generation += 1
+        self._cursor = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def sync(self, db: Session, force: bool = False) -> None:
+        """
+        读取上次轮询之后的change_log，让其他进程修改过的记录失效
+
+        Args:
+            db: 数据库会话
+            force: 忽略轮询间隔
+        """
+        now = time.monotonic()
+        if not force and now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+        log = models.ChangeLog
+        cursor = self._cursor
+        if cursor is None:
+            # 第一次使用：缓存为空，从当前最新的变更开始跟踪
+            latest = db.execute(select(func.max(log.id))).scalar() or 0
+            with self._lock:
+                if self._cursor is None:
+                    self._cursor = latest
+            return
+        rows = db.execute(
+            select(log.id, log.user_id, log.entity, log.entity_id)
+            .where(log.entity.in_(ENTITIES), log.id > cursor)
+            .order_by(log.id)
+        ).all()
+        if not rows:
+            return
+        self._invalidate({(row.entity, row.user_id, row.entity_id) for row in rows}, "remote")
+        with self._lock:
+            if self._cursor is not None:
+                self._cursor = max(self._cursor, rows[-1].id)
+
+    def _invalidate(self, keys: Iterable[ItemKey], source: str) -> None:
+        keys = set(keys)
+        if not keys:
+            return
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._items.pop(key, None)
+                self._lists.pop(key[:2], None)
+        ENTITY_CACHE_INVALIDATIONS.inc(source, amount=len(keys))
+
+    def invalidate(self, entity: str, user_id: int, entity_ids: Iterable[int]) -> None:
+        """让本进程缓存的记录及该用户这类实体的全部列表失效"""
+        self._invalidate(((entity, user_id, entity_id) for entity_id in entity_ids), "local")
+
+    def get(self, db: Session, entity: str, user_id: int, entity_id: int, load: Callable[[], Optional[Row]]) -> Optional[Row]:
+        """
+        读取单条记录，未命中时调用load从数据库读取并缓存；不存在的记录不缓存
+
+        Args:
+            db: 数据库会话，用于轮询change_log
+            entity: 实体类型
+            user_id: 用户id
+            entity_id: 实体id
+            load: 从数据库读取记录
+
+        Returns:
+            Optional[Row]: 记录，不存在或不属于该用户时为None
+        """
+        if not self.enabled:
+            return load()
+        self.sync(db)
+        key = (entity, user_id, entity_id)
+        with self._lock:
+            row = self._items.get(key)
+            if row is not None:
+                self._items.move_to_end(key)
+            generation = self._generation
+        if row is not None:
+            ENTITY_CACHE_LOOKUPS.inc(entity, "item", "hit")
+            return row
+        ENTITY_CACHE_LOOKUPS.inc(entity, "item", "miss")
+        row = load()
+        if row is not None:
+            with self._lock:
+                if self._generation == generation:
+                    self._items[key] = row
+                    while len(self._items) > self.max_entries:
+                        self._items.popitem(last=False)
+        return row
+
+    def get_list(
+        self,
+        db: Session,
+        entity: str,
+        user_id: int,
+        page: Hashable,
+        load: Callable[[], List[Row]]
+    ) -> List[Row]:
+        """
+        读取列表分页，该用户这类实体有任何变更时全部分页失效
+
+        Args:
+            db: 数据库会话，用于轮询change_log
+            entity: 实体类型
+            user_id: 用户id
+            page: 分页参数，例如(skip, limit)
+            load: 从数据库读取该页
+
+        Returns:
+            List[Row]: 该页的行，调用方可以修改返回的列表
+        """
+        if not self.enabled:
+            return load()
+        self.sync(db)
+        group = (entity, user_id)
+        with self._lock:
+            pages = self._lists.get(group)
+            rows = pages.get(page) if pages is not None else None
+            if pages is not None:
+                self._lists.move_to_end(group)
+            generation = self._generation
+        if rows is not None:
+            ENTITY_CACHE_LOOKUPS.inc(entity, "list", "hit")
+            return list(rows)
+        ENTITY_CACHE_LOOKUPS.inc(entity, "list", "miss")
+        result = load()
+        with self._lock:
+            if self._generation == generation:
+                self._lists.setdefault(group, {})[page] = tuple(result)
+                self._lists.move_to_end(group)
+                # 列表按用户计数，每个用户通常只有几个分页
+                while len(self._lists) > max(1, self.max_entries // 16):
+                    self._lists.popitem(last=False)
+        return result
+
+# 进程内共享实例，会话没有指定缓存时使用
+entity_cache = EntityCache()
+
+def cache_for(db: Session) -> EntityCache:
+    """会话所属应用的实体缓存"""
+    return db.info.get(SESSION_INFO_KEY, entity_cache)
+
+def mark_changed(db: Session, entity: str, user_id: int, entity_ids: Iterable[int]) -> None:
+    """登记本事务修改的记录，事务提交后失效；由change_feed.record_change调用"""
+    if entity not in ENTITIES:
+        return
+    pending: Set[ItemKey] = db.info.setdefault(_PENDING_KEY, set())
+    pending.update((entity, user_id, entity_id) for entity_id in entity_ids)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        cache_for(session)._invalidate(pending, "local")
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,137 @@
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+from datetime import datetime
+import csv
+import io
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from ..models import models
+
+# 数据导出
+# 每种导出只执行一条（关联）查询，只包含当前用户的数据，以yield_per分批从游标读取并逐批编码输出，
+# 内存占用只与批大小有关，与导出的总行数无关。
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+def _applications(user_id: int) -> Select:
+    application, school, professor = models.Application, models.School, models.Professor
+    return (
+        select(
+            application.id,
+            application.status,
+            application.submission_date,
+            application.result_date,
+            application.notes,
+            application.created_at,
+            application.updated_at,
+            school.id.label("school_id"),
+            school.name.label("school_name"),
+            school.department.label("school_department"),
+            school.program.label("school_program"),
+            school.application_deadline,
+            professor.id.label("professor_id"),
+            professor.name.label("professor_name"),
+            professor.email.label("professor_email"),
+        )
+        .outerjoin(school, school.id == application.school_id)
+        .outerjoin(professor, professor.id == application.professor_id)
+        .where(application.user_id == user_id)
+        .order_by(application.id)
+    )
+
+def _emails(user_id: int) -> Select:
+    email, application, school = models.Email, models.Application, models.School
+    return (
+        select(
+            email.id,
+            email.application_id,
+            school.name.label("school_name"),
+            email.subject,
+            email.content,
+            email.sender,
+            email.receiver,
+            email.sent_at,
+            email.is_sent,
+        )
+        .outerjoin(application, application.id == email.application_id)
+        .outerjoin(school, school.id == application.school_id)
+        .where(email.user_id == user_id)
+        .order_by(email.id)
+    )
+
+def _notifications(user_id: int) -> Select:
+    notification = models.Notification
+    return select(
+        notification.id,
+        notification.title,
+        notification.content,
+        notification.type,
+        notification.is_read,
+        notification.created_at,
+    ).where(notification.user_id == user_id).order_by(notification.id)
+
+# 可导出的数据 -> 按用户id构造查询的函数
+EXPORTS: Dict[str, Callable[[int], Select]] = {
+    "applications": _applications,
+    "emails": _emails,
+    "notifications": _notifications,
+}
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _encode_csv(keys: Sequence[str], rows: Sequence[Sequence[Any]], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(keys)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+def _encode_ndjson(keys: Sequence[str], rows: Sequence[Sequence[Any]]) -> bytes:
+    return b"".join(orjson.dumps(dict(zip(keys, row))) + b"\n" for row in rows)
+
+def stream_export(
+    session_factory: Callable[[], Session],
+    user_id: int,
+    dataset: str,
+    fmt: str = "csv",
+    batch_size: int = 1000
+) -> Iterator[bytes]:
+    """
+    逐批生成导出内容
+
+    生成器自己创建并关闭数据库会话，因此可以在请求处理函数返回之后由StreamingResponse继续迭代。
+
+    Args:
+        session_factory: 数据库会话工厂
+        user_id: 用户id
+        dataset: 导出的数据，EXPORTS中的键
+        fmt: 导出格式，csv或ndjson
+        batch_size: 每批从数据库读取的行数
+
+    Yields:
+        bytes: 编码后的一批数据
+    """
+    db = session_factory()
+    try:
+        result = db.execute(EXPORTS[dataset](user_id), execution_options={"yield_per": batch_size})
+        keys: List[str] = list(result.keys())
+        if fmt == "csv":
+            # UTF-8 BOM，Excel打开时才能正确识别中文
+            yield "\ufeff".encode("utf-8") + _encode_csv(keys, [], header=True)
+            for rows in result.partitions():
+                yield _encode_csv(keys, rows, header=False)
+        else:
+            for rows in result.partitions():
+                yield _encode_ndjson(keys, rows)
+    finally:
+        db.close()
@@ -0,0 +1,102 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+import logging
+import multiprocessing
+import threading
+
+from sqlalchemy.orm import Session
+
+from . import crud
+from .text_extraction import UnsupportedDocument, extract_text
+
+logger = logging.getLogger(__name__)
+
+# 文档文本提取
+# 上传的文档在进程池中提取文本，解析PDF等CPU密集的工作不占用事件循环和请求线程池。
+# 提取结果按文件内容的SHA-256保存在document_texts中：内容已经提取过的文件上传时直接完成，
+# 同一内容正在提取时不会重复提交。
+# 提取完成后在单独的线程中写入数据库，并更新所有等待该内容的文档。
+# 服务停止时未完成的提取被取消，文档保持pending；应用启动时重新提交，
+# 文件已不存在的文档提取失败，标记为failed。
+
+class DocumentExtractionService:
+    """
+    文档文本提取服务
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], max_workers: int = 2):
+        """
+        初始化文本提取服务
+
+        Args:
+            session_factory: 数据库会话工厂
+            max_workers: 提取文本的工作进程数
+        """
+        self.session_factory = session_factory
+        # 使用spawn启动工作进程：fork会复制当前进程的线程锁和数据库连接
+        self._pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        # 单线程写入提取结果，避免多个结果同时争用数据库写锁
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="extraction")
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    def submit(self, content_hash: str, path: str) -> bool:
+        """
+        提交提取任务，结果写入所有内容为content_hash且等待提取的文档
+
+        Args:
+            content_hash: 文件内容的SHA-256
+            path: 文件路径
+
+        Returns:
+            bool: 是否提交了新任务，相同内容正在提取时返回False
+        """
+        with self._lock:
+            if content_hash in self._inflight:
+                return False
+            future = self._pool.submit(extract_text, path)
+            self._inflight[content_hash] = future
+        future.add_done_callback(lambda f: self._on_done(content_hash, f))
+        return True
+
+    def resume(self, pending: List[Tuple[str, str]]) -> int:
+        """
+        重新提交等待提取的文档，应用启动时调用
+
+        Args:
+            pending: crud.get_pending_extractions返回的内容哈希和文件路径
+
+        Returns:
+            int: 提交的任务数
+        """
+        return sum(self.submit(content_hash, path) for content_hash, path in pending)
+
+    def _on_done(self, content_hash: str, future: Future) -> None:
+        try:
+            self._writer.submit(self._save, content_hash, future)
+        except RuntimeError:
+            # 服务已关闭，文档保持pending，下次启动时重新提交
+            logger.info("文本提取服务已关闭，未保存提取结果 %s", content_hash)
+
+    def _save(self, content_hash: str, future: Future) -> None:
+        with self._lock:
+            self._inflight.pop(content_hash, None)
+        db = self.session_factory()
+        try:
+            try:
+                text, page_count = future.result()
+            except UnsupportedDocument as e:
+                crud.fail_document_extraction(db, content_hash, str(e), status="unsupported")
+            except Exception as e:
+                logger.warning("提取文档文本失败 %s: %s", content_hash, e)
+                crud.fail_document_extraction(db, content_hash, str(e) or type(e).__name__)
+            else:
+                crud.complete_document_extraction(db, content_hash, text, page_count)
+        except Exception:
+            logger.exception("保存文档文本提取结果失败 %s", content_hash)
+        finally:
+            db.close()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._writer.shutdown(wait=False)
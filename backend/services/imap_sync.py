@@ -0,0 +1,383 @@
+from email.parser import BytesHeaderParser
+from email.utils import getaddresses, parsedate_to_datetime
+from email import policy
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from datetime import datetime, timezone
+import imaplib
+import itertools
+import logging
+import re
+import select
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from ..models import models, schemas
+from . import crud
+from .credential_store import CredentialStore
+from .metrics import IMAP_MESSAGES_FETCHED, IMAP_SYNC_DURATION, IMAP_SYNCS, track_call
+from .notification_service import NotificationService
+
+logger = logging.getLogger(__name__)
+
+# 收件箱同步
+# 按邮箱记录UIDVALIDITY和已处理的最大UID：UIDVALIDITY不变时只用UID SEARCH找出之后的新邮件，
+# 分批只拉取匹配需要的几个邮件头（不下载正文，不改变已读状态），每批处理完提交进度，
+# 同步的开销只与新邮件数量有关，与收件箱大小无关。UIDVALIDITY变化（邮箱被重建）或首次同步时，
+# 只查找最早一封尚未收到回复的已发送邮件之后收到的邮件。
+# 邮件头中的In-Reply-To/References引用了已发送邮件的Message-ID时保存为回复并发送通知，
+# 同一封回复按Message-ID去重，重复同步或多个进程同时同步不会重复通知。
+# 后台同步为每个设置了收件服务器的账户保持一个连接，服务器支持IDLE时等待新邮件推送，否则定时轮询。
+
+# 匹配回复需要的邮件头
+HEADER_FIELDS = "MESSAGE-ID IN-REPLY-TO REFERENCES FROM SUBJECT DATE"
+
+# RFC 2177建议IDLE每29分钟重新发起一次，避免被服务器当作空闲连接断开
+MAX_IDLE_SECONDS = 29 * 60
+
+SOCKET_TIMEOUT = 60.0
+
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+_MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+_FETCH_UID = re.compile(rb"\bUID (\d+)")
+
+def _imap_date(value: datetime) -> str:
+    # SEARCH SINCE的日期格式固定使用英文月份，不能用受locale影响的strftime("%b")
+    return f"{value.day}-{_MONTHS[value.month - 1]}-{value.year}"
+
+def _quote_mailbox(name: str) -> str:
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _message_ids(value: Optional[str]) -> List[str]:
+    return _MESSAGE_ID.findall(value or "")
+
+def _received_at(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _batches(values: Sequence[int], size: int) -> Iterator[Sequence[int]]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+class ImapSyncService:
+    """
+    收件箱同步服务
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        credentials: CredentialStore,
+        mailbox: str = "INBOX",
+        batch_size: int = 200,
+        interval: float = 300.0
+    ):
+        """
+        初始化收件箱同步服务
+
+        Args:
+            session_factory: 数据库会话工厂，后台同步使用
+            credentials: 解密账户密码
+            mailbox: 同步的邮箱
+            batch_size: 每次FETCH的邮件数
+            interval: 后台同步的轮询间隔（秒）；服务器支持IDLE时为一次IDLE的最长等待时间
+        """
+        self.session_factory = session_factory
+        self.credentials = credentials
+        self.mailbox = mailbox
+        self.batch_size = batch_size
+        self.interval = interval
+        self._notifications = NotificationService()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._watchers: Dict[int, threading.Thread] = {}
+        self._supervisor: Optional[threading.Thread] = None
+        self._tags = itertools.count(1)
+
+    def connect(self, account: models.EmailAccount, password: str) -> imaplib.IMAP4:
+        """
+        连接并登录收件服务器，993端口使用SSL，其他端口在服务器支持时使用STARTTLS
+
+        Args:
+            account: 发信账户，需要设置imap_server
+            password: 账户密码
+
+        Returns:
+            imaplib.IMAP4: 已登录的连接
+        """
+        if not account.imap_server:
+            raise ValueError("该账户未设置收件服务器")
+        port = account.imap_port or 993
+        if port == 993:
+            conn = imaplib.IMAP4_SSL(account.imap_server, port)
+        else:
+            conn = imaplib.IMAP4(account.imap_server, port)
+            if "STARTTLS" in conn.capabilities:
+                conn.starttls()
+        conn.sock.settimeout(SOCKET_TIMEOUT)
+        conn.login(account.username, password)
+        return conn
+
+    def _search(self, conn: imaplib.IMAP4, *criteria: str) -> List[int]:
+        typ, data = conn.uid("SEARCH", *criteria)
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"UID SEARCH失败: {data}")
+        return sorted(int(uid) for uid in (data[0] or b"").split())
+
+    def _fetch_headers(self, conn: imaplib.IMAP4, uids: Sequence[int]) -> List[Tuple[int, object]]:
+        typ, data = conn.uid("FETCH", ",".join(map(str, uids)), f"(UID BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])")
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"UID FETCH失败: {data}")
+        parser = BytesHeaderParser(policy=policy.default)
+        messages = []
+        for item in data:
+            # 每封邮件的响应为(前缀, 邮件头)元组，元组之间夹着结束的b")"
+            if not isinstance(item, tuple):
+                continue
+            match = _FETCH_UID.search(item[0])
+            if match is None:
+                continue
+            messages.append((int(match.group(1)), parser.parsebytes(item[1])))
+        return messages
+
+    def _save_replies(self, db: Session, account: models.EmailAccount, uidvalidity: int, messages: List[Tuple[int, object]]) -> int:
+        user_id = account.user_id
+        parsed = []
+        references = set()
+        for uid, headers in messages:
+            try:
+                message_id = (_message_ids(headers["Message-ID"]) or [None])[0]
+                # In-Reply-To指向直接回复的邮件；References从旧到新排列，倒序时越靠前越近
+                refs = _message_ids(headers["In-Reply-To"]) + _message_ids(headers["References"])[::-1]
+                sender = getaddresses([str(headers["From"] or "")])
+                subject = str(headers["Subject"] or "") or None
+                received_at = _received_at(headers["Date"])
+            except Exception as e:
+                logger.warning("无法解析邮件头 %s UID %s: %s", account.username, uid, e)
+                continue
+            if not refs:
+                continue
+            # 没有Message-ID的邮件用UID代替，同一邮箱内同样唯一
+            message_id = message_id or f"<{uidvalidity}.{uid}@{account.imap_server}>"
+            parsed.append((message_id, refs, sender[0] if sender else ("", ""), subject, received_at))
+            references.update(refs)
+
+        emails = crud.get_emails_by_message_ids(db, user_id, list(references))
+        if not emails:
+            return 0
+        seen = crud.get_reply_message_ids(db, user_id, [item[0] for item in parsed])
+        count = 0
+        for message_id, refs, (name, address), subject, received_at in parsed:
+            email = next((emails[ref] for ref in refs if ref in emails), None)
+            if email is None or message_id in seen:
+                continue
+            seen.add(message_id)
+            sender = f"{name} <{address}>" if name and address else (address or name or None)
+            reply = crud.create_email_reply(db, user_id, email, message_id, sender, subject, received_at)
+            if reply is None:
+                continue
+            professor = (address and crud.get_professor_name_by_email(db, user_id, address)) or name or address or "导师"
+            self._notifications.create_email_reply_notification(professor, email.subject or "", user_id, db=db)
+            count += 1
+        return count
+
+    @track_call(IMAP_SYNC_DURATION, IMAP_SYNCS)
+    def sync(self, db: Session, account: models.EmailAccount, conn: imaplib.IMAP4) -> schemas.MailboxSyncResult:
+        """
+        同步一次收件箱
+
+        Args:
+            db: 数据库会话
+            account: 发信账户
+            conn: 已登录的连接
+
+        Returns:
+            schemas.MailboxSyncResult: 同步进度和本次找到的回复数
+        """
+        typ, data = conn.select(_quote_mailbox(self.mailbox), readonly=True)
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"无法打开邮箱{self.mailbox}: {data}")
+        uidvalidity = conn.response("UIDVALIDITY")[1][0]
+        if uidvalidity is None:
+            raise imaplib.IMAP4.error("服务器没有返回UIDVALIDITY")
+        uidvalidity = int(uidvalidity)
+        uidnext = conn.response("UIDNEXT")[1][0]
+
+        state = crud.get_mailbox_state(db, account.id, self.mailbox)
+        incremental = state is not None and state.uidvalidity == uidvalidity
+        if incremental:
+            last_uid = state.last_uid
+            # n:*在n大于最大UID时仍会返回最后一封邮件，需要再过滤一次
+            uids = [uid for uid in self._search(conn, "UID", f"{last_uid + 1}:*") if uid > last_uid]
+            synced_uid = max([last_uid] + uids)
+        else:
+            since = crud.get_earliest_unreplied_sent_at(db, account.user_id)
+            uids = self._search(conn, "SINCE", _imap_date(since)) if since else []
+            # 之后的同步从当前最后一封邮件之后开始
+            if uidnext is not None:
+                synced_uid = int(uidnext) - 1
+            else:
+                synced_uid = (self._search(conn, "*") or [0])[-1]
+            synced_uid = max([synced_uid] + uids)
+
+        result = schemas.MailboxSyncResult(
+            account_id=account.id, mailbox=self.mailbox, uidvalidity=uidvalidity, last_uid=synced_uid
+        )
+        for batch in _batches(uids, self.batch_size):
+            messages = self._fetch_headers(conn, batch)
+            IMAP_MESSAGES_FETCHED.inc(amount=len(messages))
+            result.fetched += len(messages)
+            # 一批回复、通知和同步进度一起提交
+            with crud.unit_of_work(db):
+                result.replies += self._save_replies(db, account, uidvalidity, messages)
+                if incremental:
+                    crud.save_mailbox_state(db, account.id, self.mailbox, uidvalidity, batch[-1])
+        crud.save_mailbox_state(db, account.id, self.mailbox, uidvalidity, synced_uid)
+        return result
+
+    def sync_account(self, db: Session, account: models.EmailAccount) -> schemas.MailboxSyncResult:
+        """
+        连接收件服务器同步一次，完成后断开
+
+        Args:
+            db: 数据库会话
+            account: 发信账户，需要设置imap_server
+
+        Returns:
+            schemas.MailboxSyncResult: 同步结果
+
+        Raises:
+            ValueError: 账户未设置收件服务器或密码无法解密
+            imaplib.IMAP4.error, OSError: 连接或同步失败
+        """
+        password = self.credentials.decrypt(account.password_encrypted)
+        conn = self.connect(account, password)
+        try:
+            return self.sync(db, account, conn)
+        finally:
+            try:
+                conn.logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+
+    def _idle(self, conn: imaplib.IMAP4, timeout: float) -> bool:
+        """
+        发起IDLE等待新邮件，收到EXISTS、超时或服务停止时结束
+
+        Returns:
+            bool: 是否收到了新邮件的推送
+        """
+        tag = f"IDLE{next(self._tags)}".encode()
+        conn.send(tag + b" IDLE\r\n")
+        while True:
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("IDLE时连接被关闭")
+            if line.startswith(b"+"):
+                break
+            if line.startswith(tag):
+                raise imaplib.IMAP4.error(f"服务器拒绝IDLE: {line!r}")
+
+        sock = conn.sock
+        received = False
+        deadline = time.monotonic() + timeout
+        while not received and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # SSL连接中已解密但未读取的数据不会让select返回，需要先检查pending
+            pending = getattr(sock, "pending", None)
+            if not (pending and pending()):
+                readable, _, _ = select.select([sock], [], [], min(remaining, 1.0))
+                if not readable:
+                    continue
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("IDLE时连接被关闭")
+            received = line.startswith(b"*") and b"EXISTS" in line.upper()
+
+        conn.send(b"DONE\r\n")
+        while True:
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("结束IDLE时连接被关闭")
+            if line.startswith(tag):
+                return received
+
+    def _watch(self, account_id: int) -> None:
+        while not self._stop.is_set():
+            db = self.session_factory()
+            conn = None
+            try:
+                account = db.get(models.EmailAccount, account_id)
+                if account is None or not account.imap_server:
+                    return
+                config = (account.imap_server, account.imap_port, account.username, account.password_encrypted)
+                conn = self.connect(account, self.credentials.decrypt(account.password_encrypted))
+                # 登录后服务器可能返回更多的能力
+                typ, data = conn.capability()
+                supports_idle = typ == "OK" and b"IDLE" in (data[0] or b"").upper().split()
+                while not self._stop.is_set():
+                    self.sync(db, account, conn)
+                    if supports_idle:
+                        self._idle(conn, min(self.interval, MAX_IDLE_SECONDS))
+                    else:
+                        self._stop.wait(self.interval)
+                    # 账户被删除或修改后重新读取配置
+                    db.expire_all()
+                    account = db.get(models.EmailAccount, account_id)
+                    if account is None or not account.imap_server:
+                        return
+                    if (account.imap_server, account.imap_port, account.username, account.password_encrypted) != config:
+                        break
+            except Exception as e:
+                logger.warning("同步收件箱失败，账户%s: %s", account_id, e)
+                db.rollback()
+                self._stop.wait(self.interval)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.logout()
+                    except Exception:
+                        pass
+                db.close()
+
+    def _supervise(self) -> None:
+        while not self._stop.is_set():
+            db = self.session_factory()
+            try:
+                account_ids = crud.get_imap_account_ids(db)
+            except Exception:
+                logger.exception("读取收件箱账户失败")
+                account_ids = []
+            finally:
+                db.close()
+            with self._lock:
+                for account_id in account_ids:
+                    watcher = self._watchers.get(account_id)
+                    if watcher is None or not watcher.is_alive():
+                        watcher = threading.Thread(
+                            target=self._watch, args=(account_id,), name=f"imap-sync-{account_id}", daemon=True
+                        )
+                        self._watchers[account_id] = watcher
+                        watcher.start()
+            # 新增的账户在下一轮开始同步
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """启动后台同步，轮询间隔不大于0时不启动"""
+        if self.interval <= 0 or self._supervisor is not None:
+            return
+        self._supervisor = threading.Thread(target=self._supervise, name="imap-sync", daemon=True)
+        self._supervisor.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
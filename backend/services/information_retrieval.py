@@ -4,6 +4,8 @@ from datetime import datetime
 import re
 import json
 
+from .metrics import UPSTREAM_REQUEST_DURATION, UPSTREAM_REQUESTS, track_call
+
 class InformationRetrievalService:
     """
     负责从网络获取学校和导师信息的服务
@@ -118,6 +120,7 @@ class DeepSeekService:
             "Content-Type": "application/json"
         }
     
+    @track_call(UPSTREAM_REQUEST_DURATION, UPSTREAM_REQUESTS, "deepseek", "search")
     def search_information(self, query: str) -> Dict[str, Any]:
         """
         使用DeepSeek搜索信息
@@ -142,6 +145,7 @@ class DeepSeekService:
         except Exception as e:
             return {"error": str(e)}
     
+    @track_call(UPSTREAM_REQUEST_DURATION, UPSTREAM_REQUESTS, "deepseek", "generate")
     def generate_content(self, prompt: str) -> Dict[str, Any]:
         """
         使用DeepSeek生成内容
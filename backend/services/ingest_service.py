@@ -0,0 +1,333 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type
+from datetime import datetime
+import csv
+import io
+import json
+import logging
+import os
+import threading
+import uuid
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from sqlalchemy.orm import Session
+
+from ..models import models, schemas
+from . import crud
+
+logger = logging.getLogger(__name__)
+
+# 学校/导师表格批量导入
+# 上传的CSV或XLSX文件在后台线程中逐行流式读取，每chunk_size行为一批：
+# 整批交给Pydantic校验，校验通过的行按自然键在一个事务内插入或更新，
+# 出错的行记录行号和原因，不影响其他行。
+# 更新已有记录时只写入表格中有值的列，缺少的列和空白单元格保持原值。
+# 任务进度每批写入数据库，任一工作进程都能查询。
+# 服务停止时等待正在执行的任务处理完当前一批后结束，排队中的任务不再执行，
+# 两者都标记为失败并说明原因，不会在数据库中一直停留在pending或running。
+
+KINDS = {
+    "schools": schemas.SchoolCreate,
+    "professors": schemas.ProfessorCreate,
+}
+FORMATS = (".csv", ".xlsx")
+
+# 导师表格中用于关联学校的列，多所学校以分号分隔
+SCHOOL_COLUMN = "school"
+SCHOOL_DEPARTMENT_COLUMN = "school_department"
+
+def _values(model: BaseModel) -> Dict[str, Any]:
+    # 只保留表格中提供且不为空的列，更新时不会把其他列清空
+    return model.model_dump(exclude_unset=True, exclude_none=True)
+
+def _normalize_header(value: Any) -> str:
+    return str(value or "").strip().lower().replace(" ", "_")
+
+def _clean(value: Any) -> Any:
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+def _iter_csv(path: str, progress: Callable[[float], None]) -> Iterator[Dict[str, Any]]:
+    size = os.path.getsize(path) or 1
+    with open(path, "rb") as raw:
+        # utf-8-sig兼容Excel导出的带BOM的CSV
+        reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+        header = [_normalize_header(name) for name in next(reader, [])]
+        for index, values in enumerate(reader):
+            yield dict(zip(header, values))
+            if index % 1000 == 0:
+                progress(raw.tell() / size)
+
+def _iter_xlsx(path: str, progress: Callable[[float], None]) -> Iterator[Dict[str, Any]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("导入XLSX文件需要安装openpyxl")
+    # 只读模式按行解析工作表，不把整个文件载入内存
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = [_normalize_header(name) for name in next(rows, ())]
+        total = sheet.max_row
+        for index, values in enumerate(rows):
+            yield dict(zip(header, values))
+            if total and index % 1000 == 0:
+                progress(index / total)
+    finally:
+        workbook.close()
+
+class IngestInterrupted(Exception):
+    """服务停止时导入任务被中断"""
+
+class IngestJob:
+    """正在执行的导入任务的状态"""
+
+    def __init__(self, user_id: int, kind: str, filename: str, path: str, max_errors: int):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.kind = kind
+        self.filename = filename
+        self.path = path
+        self.max_errors = max_errors
+        self.status = "pending"
+        self.rows_processed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.linked = 0
+        self.failed_rows = 0
+        self.progress: Optional[float] = None
+        self.errors: List[Dict[str, Any]] = []
+        self.errors_truncated = False
+        self.detail: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def add_error(self, row: int, message: str, field: Optional[str] = None) -> None:
+        with self._lock:
+            if len(self.errors) < self.max_errors:
+                self.errors.append({"row": row, "field": field, "message": message})
+            else:
+                self.errors_truncated = True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "id": self.id,
+                "user_id": self.user_id,
+                "kind": self.kind,
+                "filename": self.filename,
+                "status": self.status,
+                "rows_processed": self.rows_processed,
+                "inserted": self.inserted,
+                "updated": self.updated,
+                "linked": self.linked,
+                "failed_rows": self.failed_rows,
+                "progress": self.progress,
+                "errors": list(self.errors),
+                "errors_truncated": self.errors_truncated,
+                "detail": self.detail,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+class IngestService:
+    """
+    批量导入服务，导入任务在后台线程中依次执行
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        chunk_size: int = 1000,
+        max_errors: int = 1000,
+        max_jobs: int = 100
+    ):
+        """
+        初始化批量导入服务
+
+        Args:
+            session_factory: 数据库会话工厂
+            chunk_size: 每批校验和写入的行数，也是单个事务的大小
+            max_errors: 每个任务最多保留的行级错误数
+            max_jobs: 每位用户最多保留的任务记录数，超出时删除最早的任务
+        """
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.max_jobs = max_jobs
+        # 单线程执行，避免多个导入任务同时争用数据库写锁
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        self._stopping = threading.Event()
+        self._adapters: Dict[str, TypeAdapter] = {
+            kind: TypeAdapter(List[schema]) for kind, schema in KINDS.items()
+        }
+
+    def submit(self, user_id: int, kind: str, filename: str, path: str) -> IngestJob:
+        """
+        提交导入任务，数据导入到指定用户名下，任务结束后删除path指向的文件
+
+        Args:
+            user_id: 用户id
+            kind: 导入的数据类型，schools或professors
+            filename: 上传时的文件名，用于判断格式
+            path: 已保存的上传文件路径
+
+        Returns:
+            IngestJob: 新建的任务
+        """
+        if kind not in KINDS:
+            raise ValueError(f"不支持的导入类型: {kind}")
+        if not filename.lower().endswith(FORMATS):
+            raise ValueError("只支持CSV和XLSX文件")
+        job = IngestJob(user_id, kind, filename, path, self.max_errors)
+        db = self.session_factory()
+        try:
+            crud.save_ingest_job(db, job.snapshot())
+            crud.delete_old_ingest_jobs(db, user_id, keep=self.max_jobs)
+        finally:
+            db.close()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, user_id: int, job_id: str) -> Optional[Dict[str, Any]]:
+        """读取用户的任务状态，任务可以由任一工作进程提交"""
+        db = self.session_factory()
+        try:
+            record = crud.get_ingest_job(db, user_id, job_id)
+            if record is None:
+                return None
+            data = {column.name: getattr(record, column.name) for column in models.IngestJob.__table__.columns}
+            data["errors"] = json.loads(record.errors) if record.errors else []
+            return data
+        finally:
+            db.close()
+
+    def _save(self, job: IngestJob) -> None:
+        db = self.session_factory()
+        try:
+            crud.save_ingest_job(db, job.snapshot())
+        finally:
+            db.close()
+
+    def _rows(self, job: IngestJob) -> Iterator[Dict[str, Any]]:
+        def progress(value: float) -> None:
+            job.progress = min(value, 1.0)
+        if job.filename.lower().endswith(".xlsx"):
+            return _iter_xlsx(job.path, progress)
+        return _iter_csv(job.path, progress)
+
+    def _run(self, job: IngestJob) -> None:
+        try:
+            if self._stopping.is_set():
+                raise IngestInterrupted("服务停止，任务未执行，请重新上传文件")
+            job.status = "running"
+            self._save(job)
+            chunk: List[Tuple[int, Dict[str, Any]]] = []
+            # 行号从2开始，第1行为表头
+            for line, row in enumerate(self._rows(job), start=2):
+                chunk.append((line, row))
+                if len(chunk) >= self.chunk_size:
+                    self._process_chunk(job, chunk)
+                    chunk = []
+                    if self._stopping.is_set():
+                        # 已提交的批次按自然键写入，重新上传同一文件只会更新这些行
+                        raise IngestInterrupted(
+                            f"服务停止，导入在第{job.rows_processed + 1}行之前中断，已导入的行已保存，请重新上传文件"
+                        )
+            if chunk:
+                self._process_chunk(job, chunk)
+            job.progress = 1.0
+            job.status = "completed"
+        except IngestInterrupted as e:
+            logger.warning("导入任务%s被中断: %s", job.id, e)
+            job.status = "failed"
+            job.detail = str(e)
+        except Exception as e:
+            logger.exception("导入任务%s失败", job.id)
+            job.status = "failed"
+            job.detail = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            try:
+                self._save(job)
+            except Exception:
+                logger.exception("保存导入任务%s的状态失败", job.id)
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+
+    def _validate(
+        self,
+        job: IngestJob,
+        chunk: List[Tuple[int, Dict[str, Any]]]
+    ) -> List[Tuple[int, Dict[str, Any], BaseModel]]:
+        schema: Type[BaseModel] = KINDS[job.kind]
+        fields = schema.model_fields
+        lines = [line for line, _ in chunk]
+        records = [
+            {key: _clean(value) for key, value in row.items() if key in fields}
+            for _, row in chunk
+        ]
+        adapter = self._adapters[job.kind]
+        try:
+            results = adapter.validate_python(records)
+            return [(line, row, result) for (line, row), result in zip(chunk, results)]
+        except ValidationError as e:
+            invalid = set()
+            for error in e.errors():
+                index = error["loc"][0]
+                invalid.add(index)
+                field = ".".join(str(part) for part in error["loc"][1:]) or None
+                job.add_error(lines[index], error["msg"], field)
+            job.failed_rows += len(invalid)
+            valid = [i for i in range(len(chunk)) if i not in invalid]
+            # 第一遍已经定位到全部出错的行，剩余的行再整批校验一次即可
+            results = adapter.validate_python([records[i] for i in valid])
+            return [(chunk[i][0], chunk[i][1], result) for i, result in zip(valid, results)]
+
+    def _process_chunk(self, job: IngestJob, chunk: List[Tuple[int, Dict[str, Any]]]) -> None:
+        validated = self._validate(job, chunk)
+        if validated:
+            db = self.session_factory()
+            try:
+                if job.kind == "schools":
+                    inserted, updated = crud.upsert_schools(db, job.user_id, [_values(model) for _, _, model in validated])
+                    job.inserted += len(inserted)
+                    job.updated += len(updated)
+                else:
+                    self._upsert_professors(db, job, validated)
+            finally:
+                db.close()
+        job.rows_processed += len(chunk)
+        self._save(job)
+
+    def _upsert_professors(
+        self,
+        db: Session,
+        job: IngestJob,
+        validated: List[Tuple[int, Dict[str, Any], BaseModel]]
+    ) -> None:
+        school_keys = []
+        for _, row, _ in validated:
+            names = _clean(row.get(SCHOOL_COLUMN))
+            department = _clean(row.get(SCHOOL_DEPARTMENT_COLUMN))
+            school_keys.append([
+                (name.strip(), department) for name in str(names or "").split(";") if name.strip()
+            ])
+        result = crud.upsert_professors(db, job.user_id, [_values(model) for _, _, model in validated], school_keys)
+        job.inserted += len(result["inserted"])
+        job.updated += len(result["updated"])
+        job.linked += result["linked"]
+        for index, missing in result["missing_schools"].items():
+            names = ", ".join(name if department is None else f"{name} ({department})" for name, department in missing)
+            job.add_error(validated[index][0], f"找不到学校: {names}", SCHOOL_COLUMN)
+
+    def shutdown(self) -> None:
+        """停止导入：正在执行的任务处理完当前一批后中断，排队中的任务直接标记为失败"""
+        self._stopping.set()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,234 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import re
+import threading
+import zlib
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import models
+from . import change_feed
+
+_LATIN_WORD = re.compile(r"[a-z0-9]+")
+_CJK_RUN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+
+# 英文中过于常见、对匹配没有帮助的词
+_STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "of", "on", "or", "the", "to", "with", "i", "my", "me", "am", "have", "has",
+}
+
+def tokenize(value: Optional[str]) -> List[str]:
+    """
+    将文本切分为匹配用的词项
+    英文按单词切分并加入相邻词组成的二元词组，中文按相邻两个汉字切分
+
+    Args:
+        value: 待切分的文本
+
+    Returns:
+        List[str]: 词项列表
+    """
+    if not value:
+        return []
+    lowered = value.lower()
+    words = [w for w in _LATIN_WORD.findall(lowered) if w not in _STOP_WORDS]
+    terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for run in _CJK_RUN.findall(lowered):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+class _UserIndex:
+    """单个用户的导师索引"""
+
+    def __init__(self):
+        # 导师id -> (特征索引, 词频)
+        self.rows: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self.pending: Set[int] = set()
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.matrix: Optional[sparse.csr_matrix] = None
+        # 出现过的特征索引（升序）及其IDF，只保存出现过的特征，内存与导师数成正比
+        self.terms = np.zeros(0, dtype=np.int64)
+        self.idf = np.zeros(0, dtype=np.float32)
+
+class ProfessorMatcher:
+    """
+    导师研究方向匹配引擎
+    将导师的研究方向和备注（通常包含代表性论文）哈希为稀疏TF-IDF矩阵，
+    用一次稀疏矩阵乘法计算与学生背景的余弦相似度。
+
+    每位用户只在自己的导师中匹配，索引按用户分别建立，在该用户第一次查询时加载，
+    超过max_users个用户时淘汰最久未使用的索引。
+    索引缓存在进程内，每次查询前从变更日志读取其他请求或其他工作进程对导师的增删改，
+    只重新切分变更的行，IDF加权和归一化在下一次查询时以向量化方式重新计算。
+    """
+
+    def __init__(self, n_features: int = 2 ** 18, max_users: int = 256):
+        """
+        初始化匹配引擎
+
+        Args:
+            n_features: 哈希特征空间维度
+            max_users: 最多缓存多少位用户的索引
+        """
+        self.n_features = n_features
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._indexes: "OrderedDict[int, _UserIndex]" = OrderedDict()
+        self._started = False
+        # 已处理到的变更日志版本
+        self._change_cursor = 0
+
+    def _hash(self, terms: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        # crc32在不同进程间稳定，内置hash会随机加盐
+        hashed = np.fromiter(
+            (zlib.crc32(term.encode("utf-8")) % self.n_features for term in terms),
+            dtype=np.int64,
+        )
+        indices, counts = np.unique(hashed, return_counts=True)
+        return indices, counts.astype(np.float32)
+
+    def _vectorize_professor(self, research_area: Optional[str], notes: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        # 研究方向是最直接的信号，权重加倍
+        terms = tokenize(research_area) * 2 + tokenize(notes)
+        return self._hash(terms)
+
+    def invalidate(self) -> None:
+        """丢弃全部缓存，下次查询时从数据库重新加载"""
+        with self._lock:
+            self._indexes.clear()
+            self._started = False
+
+    def _load_rows(
+        self,
+        db: Session,
+        user_id: int,
+        index: _UserIndex,
+        professor_ids: Optional[List[int]] = None
+    ) -> None:
+        stmt = (
+            select(models.Professor.id, models.Professor.research_area, models.Professor.notes)
+            .where(models.Professor.user_id == user_id)
+        )
+        if professor_ids is not None:
+            stmt = stmt.where(models.Professor.id.in_(professor_ids))
+        seen = set()
+        for row in db.execute(stmt.execution_options(yield_per=1000)):
+            seen.add(row.id)
+            vector = self._vectorize_professor(row.research_area, row.notes)
+            if len(vector[0]):
+                index.rows[row.id] = vector
+            else:
+                index.rows.pop(row.id, None)
+        if professor_ids is not None:
+            # 已删除的导师
+            for professor_id in set(professor_ids) - seen:
+                index.rows.pop(professor_id, None)
+        index.matrix = None
+
+    def _sync_changes(self, db: Session) -> None:
+        if not self._started:
+            # 先记下版本再读取数据，读取期间发生的变更会在下次查询时重新处理
+            self._change_cursor = change_feed.latest_version(db)
+            self._started = True
+            return
+        log = models.ChangeLog
+        rows = db.execute(
+            select(log.id, log.user_id, log.entity_id)
+            .where(log.entity == "professor", log.id > self._change_cursor)
+            .order_by(log.id)
+        ).all()
+        if rows:
+            for row in rows:
+                index = self._indexes.get(row.user_id)
+                if index is not None:
+                    index.pending.add(row.entity_id)
+            self._change_cursor = rows[-1].id
+
+    def _refresh(self, db: Session, user_id: int) -> _UserIndex:
+        self._sync_changes(db)
+        index = self._indexes.get(user_id)
+        if index is None:
+            index = _UserIndex()
+            self._load_rows(db, user_id, index)
+            self._indexes[user_id] = index
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(user_id)
+        if index.pending:
+            pending = list(index.pending)
+            index.pending.clear()
+            for i in range(0, len(pending), 500):
+                self._load_rows(db, user_id, index, pending[i:i + 500])
+
+        if index.matrix is not None:
+            return index
+
+        ids = np.fromiter(index.rows.keys(), dtype=np.int64, count=len(index.rows))
+        rows = list(index.rows.values())
+        lengths = np.fromiter((len(r[0]) for r in rows), dtype=np.int64, count=len(rows))
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.concatenate([r[0] for r in rows]) if rows else np.zeros(0, dtype=np.int64)
+        counts = np.concatenate([r[1] for r in rows]) if rows else np.zeros(0, dtype=np.float32)
+
+        n_docs = len(rows)
+        # 每行内的特征索引不重复，出现次数即文档频率
+        terms, df = np.unique(indices, return_counts=True)
+        idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        # 次线性词频缩放后乘以IDF，并做L2归一化
+        data = (1 + np.log(counts)) * idf[np.searchsorted(terms, indices)]
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(n_docs, self.n_features))
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        matrix = sparse.diags(1 / norms).dot(matrix).tocsr()
+
+        index.ids = ids
+        index.terms = terms
+        index.idf = idf
+        index.matrix = matrix
+        return index
+
+    def top_k(self, db: Session, user_id: int, profile: str, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        在用户自己的导师中查询与学生背景最匹配的导师
+
+        Args:
+            db: 数据库会话
+            user_id: 用户id
+            profile: 学生的研究兴趣、背景和项目经历等文本
+            k: 返回的导师数量
+
+        Returns:
+            List[Tuple[int, float]]: (导师id, 相似度) 列表，按相似度从高到低排序
+        """
+        with self._lock:
+            index = self._refresh(db, user_id)
+            matrix, ids, terms, idf = index.matrix, index.ids, index.terms, index.idf
+
+        indices, counts = self._hash(tokenize(profile))
+        if not len(indices) or matrix.shape[0] == 0:
+            return []
+        # 导师中没有出现过的词文档频率为0
+        query_idf = np.full(len(indices), np.log(1 + matrix.shape[0]) + 1, dtype=np.float32)
+        positions = np.searchsorted(terms, indices)
+        found = positions < len(terms)
+        found[found] = terms[positions[found]] == indices[found]
+        query_idf[found] = idf[positions[found]]
+        weights = (1 + np.log(counts)) * query_idf
+        weights /= np.linalg.norm(weights)
+        query = sparse.csr_matrix(
+            (weights, indices, np.array([0, len(indices)])), shape=(1, self.n_features)
+        )
+        scores = matrix.dot(query.T).toarray().ravel()
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > 0]
@@ -0,0 +1,262 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 轻量的进程内指标收集，以Prometheus文本格式导出
+# 每次记录只做一次字典查找和少量加法，开销足够低，可以在生产环境常开。
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    """单调递增的计数器"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def get(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+class Histogram:
+    """按区间统计观测值分布的直方图"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # 标签值 -> [各区间计数..., 总和, 总数]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def count(self, *labelvalues: str) -> float:
+        state = self._values.get(labelvalues)
+        return state[-1] if state else 0.0
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(state)) for labels, state in self._values.items()]
+        lines = []
+        for labels, state in items:
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {_format_value(cumulative)}"
+                )
+            inf = 'le="+Inf"'
+            lines.append(
+                f"{self.name}_bucket{_format_labels(self.labelnames, labels, inf)} {_format_value(state[-1])}"
+            )
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {_format_value(state[-1])}")
+        return lines
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._metrics.get(name) or self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self._metrics.get(name) or self.register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def render(self) -> str:
+        """以Prometheus文本格式导出全部指标"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# HTTP请求
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP请求数", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP请求处理耗时", ("method", "route")
+)
+HTTP_RATE_LIMITED = REGISTRY.counter(
+    "http_rate_limited_total", "被限流拒绝的HTTP请求数", ("rule", "reason")
+)
+
+# 数据库
+DB_QUERIES = REGISTRY.counter(
+    "db_queries_total", "执行的SQL语句数", ("operation",)
+)
+DB_QUERY_DURATION = REGISTRY.histogram(
+    "db_query_duration_seconds", "SQL语句执行耗时", ("operation",)
+)
+DB_QUERY_ERRORS = REGISTRY.counter(
+    "db_query_errors_total", "执行失败的SQL语句数", ("operation",)
+)
+
+# 进程内缓存
+ENTITY_CACHE_LOOKUPS = REGISTRY.counter(
+    "entity_cache_lookups_total", "学校/导师缓存的查找次数", ("entity", "kind", "result")
+)
+ENTITY_CACHE_INVALIDATIONS = REGISTRY.counter(
+    "entity_cache_invalidations_total", "学校/导师缓存失效的记录数", ("source",)
+)
+
+# 外部调用
+SMTP_SENDS = REGISTRY.counter(
+    "smtp_send_total", "SMTP发信次数", ("result",)
+)
+SMTP_SEND_DURATION = REGISTRY.histogram(
+    "smtp_send_duration_seconds", "SMTP发信耗时", buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+IMAP_SYNCS = REGISTRY.counter(
+    "imap_sync_total", "收件箱同步次数", ("result",)
+)
+IMAP_SYNC_DURATION = REGISTRY.histogram(
+    "imap_sync_duration_seconds", "收件箱同步耗时", buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+IMAP_MESSAGES_FETCHED = REGISTRY.counter(
+    "imap_messages_fetched_total", "收件箱同步拉取邮件头的邮件数"
+)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "upstream_requests_total", "上游API调用次数", ("service", "endpoint", "result")
+)
+UPSTREAM_REQUEST_DURATION = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "上游API调用耗时", ("service", "endpoint"),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+
+def _result_label(result: Any) -> str:
+    # 服务方法以返回字典表示结果：{"success": False, ...} 或 {"error": ...} 视为失败
+    if isinstance(result, dict) and (result.get("success") is False or "error" in result):
+        return "failure"
+    return "success"
+
+def track_call(
+    histogram: Histogram,
+    counter: Counter,
+    *labelvalues: str
+) -> Callable[[Callable], Callable]:
+    """
+    记录被装饰函数的耗时和调用结果
+
+    Args:
+        histogram: 记录耗时的直方图，使用labelvalues作为标签
+        counter: 记录调用次数的计数器，标签为labelvalues加上结果(success/failure/error)
+        labelvalues: 标签值
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                counter.inc(*labelvalues, "error")
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, *labelvalues)
+            counter.inc(*labelvalues, _result_label(result))
+            return result
+        return wrapper
+    return decorator
+
+def _operation(statement: str) -> str:
+    head = statement.lstrip().split(None, 1)
+    return head[0].upper() if head else "UNKNOWN"
+
+def instrument_engine(engine: Engine) -> None:
+    """在数据库引擎上注册事件，统计SQL语句的数量和耗时"""
+    if getattr(engine, "_metrics_instrumented", False):
+        return
+    engine._metrics_instrumented = True
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        operation = _operation(statement)
+        DB_QUERIES.inc(operation)
+        DB_QUERY_DURATION.observe(elapsed, operation)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        stack = context.connection.info.get("query_start_time") if context.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_QUERY_ERRORS.inc(_operation(context.statement or ""))
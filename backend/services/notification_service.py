@@ -1,14 +1,13 @@
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Set, TypeVar
 from datetime import datetime, timedelta
+import asyncio
+import functools
 import json
 import os
 from sqlalchemy.orm import Session
 
-# 修改导入方式
-import sys
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from models import models, schemas
-from database.database import get_db
+from ..models import models, schemas
+from . import crud
 
 class NotificationService:
     """
@@ -29,6 +28,7 @@ class NotificationService:
         title: str, 
         content: str, 
         notification_type: str,
+        user_id: int,
         db: Optional[Session] = None
     ) -> models.Notification:
         """
@@ -38,6 +38,7 @@ class NotificationService:
             title: 通知标题
             content: 通知内容
             notification_type: 通知类型 (例如: "截止日期", "邮件回复", "申请状态变更")
+            user_id: 接收通知的用户id
             db: 数据库会话 (可选)
         
         Returns:
@@ -53,17 +54,13 @@ class NotificationService:
             type=notification_type
         )
         
-        db_notification = models.Notification(**notification_data.model_dump())
-        _db.add(db_notification)
-        _db.commit()
-        _db.refresh(db_notification)
-        
-        return db_notification
+        return crud.create_notification(_db, user_id, notification_data)
     
     def create_deadline_notification(
         self, 
         school_name: str, 
         deadline: datetime,
+        user_id: int,
         days_before: int = 7,
         db: Optional[Session] = None
     ) -> models.Notification:
@@ -73,6 +70,7 @@ class NotificationService:
         Args:
             school_name: 学校名称
             deadline: 截止日期
+            user_id: 接收通知的用户id
             days_before: 提前多少天发送通知
             db: 数据库会话 (可选)
         
@@ -91,6 +89,7 @@ class NotificationService:
             title=title,
             content=content,
             notification_type="截止日期",
+            user_id=user_id,
             db=db
         )
     
@@ -98,6 +97,7 @@ class NotificationService:
         self, 
         professor_name: str, 
         email_subject: str,
+        user_id: int,
         db: Optional[Session] = None
     ) -> models.Notification:
         """
@@ -106,6 +106,7 @@ class NotificationService:
         Args:
             professor_name: 导师姓名
             email_subject: 邮件主题
+            user_id: 接收通知的用户id
             db: 数据库会话 (可选)
         
         Returns:
@@ -118,6 +119,7 @@ class NotificationService:
             title=title,
             content=content,
             notification_type="邮件回复",
+            user_id=user_id,
             db=db
         )
     
@@ -126,6 +128,7 @@ class NotificationService:
         school_name: str, 
         old_status: str,
         new_status: str,
+        user_id: int,
         db: Optional[Session] = None
     ) -> models.Notification:
         """
@@ -135,6 +138,7 @@ class NotificationService:
             school_name: 学校名称
             old_status: 旧状态
             new_status: 新状态
+            user_id: 接收通知的用户id
             db: 数据库会话 (可选)
         
         Returns:
@@ -147,14 +151,16 @@ class NotificationService:
             title=title,
             content=content,
             notification_type="申请状态变更",
+            user_id=user_id,
             db=db
         )
     
-    def check_upcoming_deadlines(self, days_threshold: int = 7, db: Optional[Session] = None) -> List[models.Notification]:
+    def check_upcoming_deadlines(self, user_id: int, days_threshold: int = 7, db: Optional[Session] = None) -> List[models.Notification]:
         """
-        检查即将到来的截止日期并创建通知
+        检查用户即将到来的截止日期并创建通知
         
         Args:
+            user_id: 用户id
             days_threshold: 提前多少天发送通知
             db: 数据库会话 (可选)
         
@@ -168,6 +174,7 @@ class NotificationService:
         # 获取即将到来的截止日期
         deadline_threshold = datetime.utcnow() + timedelta(days=days_threshold)
         schools_with_deadlines = _db.query(models.School).filter(
+            models.School.user_id == user_id,
             models.School.application_deadline <= deadline_threshold,
             models.School.application_deadline > datetime.utcnow()
         ).all()
@@ -177,6 +184,7 @@ class NotificationService:
             notification = self.create_deadline_notification(
                 school_name=school.name,
                 deadline=school.application_deadline,
+                user_id=user_id,
                 days_before=days_threshold,
                 db=_db
             )
@@ -184,11 +192,12 @@ class NotificationService:
         
         return notifications
     
-    def get_unread_notifications(self, db: Optional[Session] = None) -> List[models.Notification]:
+    def get_unread_notifications(self, user_id: int, db: Optional[Session] = None) -> List[models.Notification]:
         """
-        获取未读通知
+        获取用户的未读通知
         
         Args:
+            user_id: 用户id
             db: 数据库会话 (可选)
         
         Returns:
@@ -198,13 +207,14 @@ class NotificationService:
         if not _db:
             raise ValueError("Database session is required")
         
-        return _db.query(models.Notification).filter(models.Notification.is_read == False).order_by(models.Notification.created_at.desc()).all()
+        return _db.query(models.Notification).filter(models.Notification.user_id == user_id, models.Notification.is_read == False).order_by(models.Notification.created_at.desc()).all()
     
-    def mark_notification_as_read(self, notification_id: int, db: Optional[Session] = None) -> bool:
+    def mark_notification_as_read(self, user_id: int, notification_id: int, db: Optional[Session] = None) -> bool:
         """
-        将通知标记为已读
+        将用户的通知标记为已读
         
         Args:
+            user_id: 用户id
             notification_id: 通知ID
             db: 数据库会话 (可选)
         
@@ -215,72 +225,233 @@ class NotificationService:
         if not _db:
             raise ValueError("Database session is required")
         
-        notification = _db.query(models.Notification).filter(models.Notification.id == notification_id).first()
-        if notification:
-            notification.is_read = True
-            _db.commit()
-            return True
-        return False
+        return crud.mark_notification_read(_db, user_id, notification_id) is not None
+
+# 推送服务提供方
+INVALID_TOKEN = "invalid_token"
+
+T = TypeVar("T")
+
+async def _run_sync(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    # 同步的数据库操作放到线程池中执行，不阻塞事件循环上的其他请求
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+class PushProvider:
+    """
+    推送服务提供方接口
+    具体实现需要对接第三方推送服务，例如Firebase Cloud Messaging或Apple Push Notification Service
+    """
+    
+    # 单次请求允许携带的最大令牌数，由提供方限制决定
+    max_batch_size: int = 500
+    
+    async def send_batch(self, tokens: List[str], title: str, message: str) -> Dict[str, str]:
+        """
+        向一批设备发送推送通知
+        
+        Args:
+            tokens: 设备令牌列表，长度不超过max_batch_size
+            title: 通知标题
+            message: 通知内容
+        
+        Returns:
+            Dict[str, str]: 发送失败的令牌及失败原因，令牌失效时原因为INVALID_TOKEN
+        """
+        raise NotImplementedError
+
+class LocalPushProvider(PushProvider):
+    """
+    本地模拟推送服务，不发起任何网络请求
+    用于开发环境和测试，可以指定失效令牌和模拟网络延迟
+    """
+    
+    def __init__(
+        self, 
+        max_batch_size: int = 500, 
+        invalid_tokens: Optional[Set[str]] = None,
+        latency: float = 0.0
+    ):
+        """
+        初始化本地模拟推送服务
+        
+        Args:
+            max_batch_size: 单批最大令牌数
+            invalid_tokens: 视为已失效的令牌集合
+            latency: 每批请求模拟的延迟秒数
+        """
+        self.max_batch_size = max_batch_size
+        self.invalid_tokens = set(invalid_tokens or ())
+        self.latency = latency
+        self.batches_sent = 0
+        self.delivered = 0
+    
+    async def send_batch(self, tokens: List[str], title: str, message: str) -> Dict[str, str]:
+        if len(tokens) > self.max_batch_size:
+            raise ValueError(f"Batch size {len(tokens)} exceeds provider limit {self.max_batch_size}")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        
+        failures = {token: INVALID_TOKEN for token in tokens if token in self.invalid_tokens}
+        self.batches_sent += 1
+        self.delivered += len(tokens) - len(failures)
+        return failures
 
 # 可扩展的移动设备通知服务
 class MobileNotificationService:
     """
     移动设备通知服务，用于向移动设备发送推送通知
-    注意：这是一个示例实现，实际应用中需要集成第三方推送服务
+    设备注册信息保存在数据库中，按提供方批大小分批并发发送
     """
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self, 
+        api_key: Optional[str] = None,
+        db: Optional[Session] = None,
+        provider: Optional[PushProvider] = None,
+        max_concurrency: int = 8,
+        max_failure_samples: int = 20
+    ):
         """
         初始化移动设备通知服务
         
         Args:
             api_key: 推送服务API密钥
+            db: 数据库会话
+            provider: 推送服务提供方，默认使用本地模拟实现
+            max_concurrency: 同时在途的批次数上限
+            max_failure_samples: 发送结果中最多列出的失败令牌数
         """
         self.api_key = api_key
-        self.devices = []  # 存储已注册的设备
+        self.db = db
+        self.provider = provider or LocalPushProvider()
+        self.max_concurrency = max_concurrency
+        self.max_failure_samples = max_failure_samples
     
-    def register_device(self, device_token: str, device_type: str) -> bool:
+    def register_device(self, user_id: int, device_token: str, device_type: str, db: Optional[Session] = None) -> bool:
         """
-        注册设备
+        为用户注册设备，相同令牌重复注册时只更新已有记录
         
         Args:
+            user_id: 用户id
             device_token: 设备令牌
             device_type: 设备类型 (例如: "ios", "android")
+            db: 数据库会话 (可选)
         
         Returns:
             bool: 注册是否成功
         """
-        self.devices.append({
-            "token": device_token,
-            "type": device_type,
-            "registered_at": datetime.utcnow().isoformat()
-        })
+        _db = db or self.db
+        if not _db:
+            raise ValueError("Database session is required")
+        
+        crud.register_device(_db, user_id, schemas.DeviceCreate(token=device_token, type=device_type))
         return True
     
-    def send_push_notification(self, title: str, message: str, device_tokens: List[str] = None) -> Dict[str, Any]:
+    async def broadcast(
+        self, 
+        user_id: int,
+        title: str, 
+        message: str, 
+        device_tokens: Optional[List[str]] = None,
+        db: Optional[Session] = None
+    ) -> Dict[str, Any]:
         """
-        发送推送通知
+        向用户的设备分批并发发送推送通知，并清理提供方报告失效的令牌
         
         Args:
+            user_id: 用户id
             title: 通知标题
             message: 通知内容
-            device_tokens: 设备令牌列表，如果为None则发送给所有已注册设备
+            device_tokens: 设备令牌列表，只会发送给其中属于该用户的设备；如果为None则发送给该用户的所有设备
+            db: 数据库会话 (可选)
         
         Returns:
-            Dict[str, Any]: 发送结果
+            Dict[str, Any]: 发送结果，包含成功数、失败数、最多max_failure_samples个失败令牌及原因和清理的令牌数
         """
-        # 这是一个示例实现，实际应用中需要集成第三方推送服务
-        # 例如Firebase Cloud Messaging或Apple Push Notification Service
-        
-        if not device_tokens:
-            device_tokens = [device["token"] for device in self.devices]
+        _db = db or self.db
+        if not _db:
+            raise ValueError("Database session is required")
         
-        # 模拟发送通知
-        result = {
-            "success": True,
-            "sent_to": len(device_tokens),
+        batch_size = self.provider.max_batch_size
+        if device_tokens is None:
+            # 从数据库按游标分批读取，避免一次加载全部设备
+            batches = crud.iter_device_tokens(_db, user_id, batch_size=batch_size)
+        else:
+            unique_tokens = await _run_sync(crud.get_owned_device_tokens, _db, user_id, list(dict.fromkeys(device_tokens)))
+            batches = iter([unique_tokens[i:i + batch_size] for i in range(0, len(unique_tokens), batch_size)])
+        
+        sent = 0
+        failed = 0
+        pruned = 0
+        failures: Dict[str, str] = {}
+        invalid_tokens: List[str] = []
+        
+        async def send(tokens: List[str]) -> None:
+            nonlocal sent, failed
+            try:
+                batch_failures = await self.provider.send_batch(tokens, title, message)
+            except Exception as e:
+                batch_failures = {token: str(e) for token in tokens}
+            sent += len(tokens) - len(batch_failures)
+            failed += len(batch_failures)
+            for token, reason in batch_failures.items():
+                if len(failures) < self.max_failure_samples:
+                    failures[token] = reason
+                if reason == INVALID_TOKEN:
+                    invalid_tokens.append(token)
+        
+        async def prune() -> None:
+            # 已完成批次报告失效的令牌随即删除，待删除的令牌不随设备总数累积
+            nonlocal pruned
+            if invalid_tokens:
+                tokens = invalid_tokens[:]
+                invalid_tokens.clear()
+                pruned += await _run_sync(crud.delete_devices_by_tokens, _db, user_id, tokens)
+        
+        # 在途批次数不超过max_concurrency，内存占用与设备总数无关
+        pending = set()
+        # 每次读取下一批令牌都在线程池中进行，会话同一时间只在一个线程中使用
+        while True:
+            tokens = await _run_sync(next, batches, None)
+            if tokens is None:
+                break
+            if len(pending) >= self.max_concurrency:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            await prune()
+            pending.add(asyncio.create_task(send(tokens)))
+        if pending:
+            await asyncio.wait(pending)
+        await prune()
+        
+        return {
+            "success": not failed,
+            "sent_to": sent,
+            "failed": failed,
+            "failures": failures,
+            "pruned": pruned,
             "timestamp": datetime.utcnow().isoformat(),
-            "message": f"Notification '{title}' sent successfully"
+            "message": f"Notification '{title}' sent to {sent} devices"
         }
+    
+    def send_push_notification(
+        self, 
+        user_id: int,
+        title: str, 
+        message: str, 
+        device_tokens: List[str] = None,
+        db: Optional[Session] = None
+    ) -> Dict[str, Any]:
+        """
+        发送推送通知，broadcast的同步版本，不能在运行中的事件循环内调用
+        
+        Args:
+            user_id: 用户id
+            title: 通知标题
+            message: 通知内容
+            device_tokens: 设备令牌列表，如果为None则发送给该用户的所有设备
+            db: 数据库会话 (可选)
         
-        return result 
\ No newline at end of file
+        Returns:
+            Dict[str, Any]: 发送结果
+        """
+        return asyncio.run(self.broadcast(user_id, title, message, device_tokens=device_tokens, db=db))
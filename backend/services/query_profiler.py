@@ -0,0 +1,188 @@
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# SQL查询分析
+# 每个请求可以通过请求头开启分析，记录该请求执行的所有SQL语句、耗时和发起位置，
+# 并把同一语句重复执行多次的情况标记为疑似N+1查询。
+# 慢查询不论是否开启分析都会连同EXPLAIN QUERY PLAN写入慢查询日志。
+# 日志中只有语句，不记录参数：参数中可能有密码哈希和加密的邮箱凭据。
+
+profile_logger = logging.getLogger("backend.query_profiler")
+slow_query_logger = logging.getLogger("backend.slow_queries")
+
+# 发起位置只统计项目内的代码，跳过本模块和指标模块
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SKIP_FILES = {os.path.abspath(__file__), os.path.join(_BACKEND_DIR, "services", "metrics.py")}
+
+_current_profile: ContextVar[Optional["QueryProfile"]] = ContextVar("query_profile", default=None)
+
+def _origin() -> Optional[str]:
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_BACKEND_DIR) and filename not in _SKIP_FILES:
+            return f"{os.path.relpath(filename, _BACKEND_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+class QueryProfile:
+    """单个请求的SQL查询记录"""
+
+    def __init__(self, label: str, n_plus_one_threshold: int = 3):
+        """
+        初始化查询记录
+
+        Args:
+            label: 记录的名称，通常为请求方法和路径
+            n_plus_one_threshold: 同一语句执行达到多少次时标记为疑似N+1查询
+        """
+        self.label = label
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.queries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def record(self, statement: str, duration: float, origin: Optional[str]) -> None:
+        with self._lock:
+            self.queries.append({
+                "statement": statement,
+                "duration_ms": duration * 1000,
+                "origin": origin,
+            })
+
+    @property
+    def total_ms(self) -> float:
+        return sum(query["duration_ms"] for query in self.queries)
+
+    def n_plus_one_suspects(self) -> List[Dict[str, Any]]:
+        groups: Dict[str, Dict[str, Any]] = {}
+        for query in self.queries:
+            group = groups.setdefault(query["statement"], {
+                "statement": query["statement"],
+                "count": 0,
+                "total_ms": 0.0,
+                "origins": set(),
+            })
+            group["count"] += 1
+            group["total_ms"] += query["duration_ms"]
+            if query["origin"]:
+                group["origins"].add(query["origin"])
+        return [
+            {**group, "origins": sorted(group["origins"])}
+            for group in groups.values()
+            if group["count"] >= self.n_plus_one_threshold
+        ]
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "request": self.label,
+            "elapsed_ms": (time.perf_counter() - self._start) * 1000,
+            "query_count": len(self.queries),
+            "query_ms": self.total_ms,
+            "n_plus_one": self.n_plus_one_suspects(),
+            "queries": self.queries,
+        }
+
+def start_profile(label: str, n_plus_one_threshold: int = 3):
+    """
+    在当前上下文中开始记录SQL查询
+
+    Returns:
+        (QueryProfile, token): token用于stop_profile恢复上下文
+    """
+    profile = QueryProfile(label, n_plus_one_threshold=n_plus_one_threshold)
+    return profile, _current_profile.set(profile)
+
+def stop_profile(token) -> None:
+    _current_profile.reset(token)
+
+def configure_logging(profile_log: Optional[str] = None, slow_query_log: Optional[str] = None) -> None:
+    """
+    设置查询分析报告和慢查询日志的输出，重复调用时替换之前设置的处理器
+
+    Args:
+        profile_log: 查询分析报告的日志文件，为空时输出到标准错误
+        slow_query_log: 慢查询日志文件，为空时只交给上级日志系统
+    """
+    for logger, path, level in (
+        (profile_logger, profile_log, logging.INFO),
+        (slow_query_logger, slow_query_log, logging.WARNING),
+    ):
+        for handler in list(logger.handlers):
+            if getattr(handler, "_query_profiler", False):
+                logger.removeHandler(handler)
+                handler.close()
+        logger.setLevel(level)
+        if path:
+            handler = logging.FileHandler(path, encoding="utf-8")
+        elif logger is profile_logger:
+            # 报告只在请求显式开启分析时产生，默认的WARNING级别下会被丢弃
+            handler = logging.StreamHandler()
+        else:
+            continue
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        handler._query_profiler = True
+        logger.addHandler(handler)
+
+def log_profile(profile: QueryProfile) -> None:
+    profile_logger.info(json.dumps(profile.report(), ensure_ascii=False, default=str))
+
+def _explain(cursor, statement: str, parameters: Any) -> Optional[str]:
+    try:
+        explain_cursor = cursor.connection.cursor()
+        try:
+            explain_cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+            return "\n".join(str(row[-1]) for row in explain_cursor.fetchall())
+        finally:
+            explain_cursor.close()
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+
+def install_query_profiler(engine: Engine, slow_query_ms: Optional[float] = 200.0) -> None:
+    """
+    在数据库引擎上注册查询分析事件
+
+    Args:
+        engine: 数据库引擎
+        slow_query_ms: 慢查询阈值（毫秒），为None时不记录慢查询
+    """
+    if getattr(engine, "_query_profiler_installed", False):
+        return
+    engine._query_profiler_installed = True
+    explain_supported = engine.dialect.name == "sqlite"
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profiler_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["profiler_start_time"].pop()
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.record(statement, duration, _origin())
+        if slow_query_ms is not None and duration * 1000 >= slow_query_ms:
+            plan = None
+            if explain_supported and not executemany and statement.lstrip().upper().startswith("SELECT"):
+                plan = _explain(cursor, statement, parameters)
+            slow_query_logger.warning(json.dumps({
+                "duration_ms": duration * 1000,
+                "statement": statement,
+                "origin": _origin(),
+                "query_plan": plan,
+            }, ensure_ascii=False, default=str))
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        stack = context.connection.info.get("profiler_start_time") if context.connection is not None else None
+        if stack:
+            stack.pop()
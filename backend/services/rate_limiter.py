@@ -0,0 +1,259 @@
+from dataclasses import dataclass, replace
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import asyncio
+import json
+import re
+import threading
+import time
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.engine import Engine
+
+from ..models import models
+
+# 限流和准入控制
+# 每条规则按请求路径匹配，为每个客户端维护一个令牌桶：桶容量为burst，每秒补充requests / period个令牌，
+# 每个请求消耗一个令牌，令牌不足时返回需要等待的秒数。
+# 开销大的路由（外部检索、生成草稿、发信、上传）还限制了同时处理的请求数，
+# 超出的请求排队等待，等待超过queue_timeout秒后拒绝。
+#
+# 令牌桶默认保存在进程内存中；多进程部署时可以改用数据库后端，由所有工作进程共享。
+# 并发上限始终按进程计算。
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """一条限流规则"""
+    name: str
+    # 匹配请求路径的正则表达式
+    pattern: str
+    # 适用的请求方法，为空时适用于所有方法
+    methods: Tuple[str, ...] = ()
+    # 每period秒允许requests个请求，为0时不限制请求速率
+    requests: float = 0
+    period: float = 60.0
+    # 允许的突发请求数，为空时等于requests
+    burst: Optional[float] = None
+    # 同时处理的请求数上限（每个进程），为空时不限制
+    max_concurrency: Optional[int] = None
+    # 达到并发上限时最多排队等待的秒数
+    queue_timeout: float = 10.0
+    # 只按客户端IP区分客户端，不看访问令牌（登录、注册等请求本身还没有可信的身份）
+    by_ip: bool = False
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.period if self.period > 0 else 0.0
+
+    @property
+    def capacity(self) -> float:
+        return self.burst if self.burst is not None else self.requests
+
+    def matches(self, method: str, path: str) -> bool:
+        return (not self.methods or method in self.methods) and re.fullmatch(self.pattern, path) is not None
+
+# 按顺序匹配，第一条匹配的规则生效
+DEFAULT_RULES: Tuple[RateLimitRule, ...] = (
+    # 登录和注册：防止暴力破解密码
+    RateLimitRule("auth", r"/auth/(token|register)", ("POST",), requests=10, period=60, by_ip=True),
+    # 调用DeepSeek API生成邮件草稿
+    RateLimitRule(
+        "generate", r"/email/generate-draft", ("POST",),
+        requests=10, period=60, max_concurrency=4, queue_timeout=30.0
+    ),
+    # 调用DeepSeek API检索学校和导师信息
+    RateLimitRule(
+        "external_search", r"/search/(school|professor|deadlines|publications)", ("GET",),
+        requests=30, period=60, burst=10, max_concurrency=8, queue_timeout=30.0
+    ),
+    # 通过SMTP发信、同步收件箱或推送通知
+    RateLimitRule(
+        "send", r"/emails/\d+/send|/email/accounts/\d+/sync|/notifications/push", ("POST",),
+        requests=20, period=60, max_concurrency=4, queue_timeout=30.0
+    ),
+    # 上传文档和导入文件
+    RateLimitRule(
+        "upload", r"/documents/|/ingest/[^/]+", ("POST",),
+        requests=60, period=60, burst=20, max_concurrency=4, queue_timeout=30.0
+    ),
+    # 其余接口
+    RateLimitRule("default", r".*", requests=20, period=1, burst=100),
+)
+
+def load_rules(overrides: Optional[str] = None) -> Tuple[RateLimitRule, ...]:
+    """
+    在默认规则的基础上应用配置的修改
+
+    Args:
+        overrides: JSON对象，键为规则名，值为要修改的字段，例如
+            {"generate": {"requests": 5, "max_concurrency": 2}}
+
+    Returns:
+        Tuple[RateLimitRule, ...]: 修改后的规则
+    """
+    if not overrides:
+        return DEFAULT_RULES
+    changes = json.loads(overrides)
+    names = {rule.name for rule in DEFAULT_RULES}
+    unknown = set(changes) - names
+    if unknown:
+        raise ValueError(f"未知的限流规则: {', '.join(sorted(unknown))}")
+    return tuple(replace(rule, **changes[rule.name]) if rule.name in changes else rule for rule in DEFAULT_RULES)
+
+class RateLimitBackend:
+    """令牌桶的存储后端"""
+
+    # acquire是否会阻塞（例如访问数据库），阻塞的后端在线程池中调用
+    blocking = True
+
+    def acquire(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        """
+        尝试从令牌桶中取出令牌
+
+        Args:
+            key: 令牌桶的键
+            rate: 每秒补充的令牌数
+            capacity: 桶容量
+            cost: 需要的令牌数
+
+        Returns:
+            float: 0表示成功取得令牌，否则为令牌足够之前需要等待的秒数
+        """
+        raise NotImplementedError
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """保存在进程内存中的令牌桶，超出max_keys时淘汰最久未使用的桶"""
+
+    blocking = False
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate if rate > 0 else float("inf")
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+class DatabaseRateLimitBackend(RateLimitBackend):
+    """
+    保存在数据库rate_limit_buckets表中的令牌桶，所有工作进程共享
+    每次取令牌是一条INSERT ... ON CONFLICT DO UPDATE语句，令牌不足时WHERE条件不成立、不更新任何行，
+    并发请求之间不需要额外的锁。时间使用各进程的系统时钟。
+    """
+
+    _table = models.RateLimitBucket.__tablename__
+
+    def __init__(self, engine: Engine, max_idle: float = 3600.0, cleanup_every: int = 1000):
+        """
+        初始化数据库后端
+
+        Args:
+            engine: 数据库引擎，需要支持ON CONFLICT（SQLite 3.24+或PostgreSQL）
+            max_idle: 超过这个秒数未使用的令牌桶会被清理
+            cleanup_every: 每处理多少次请求清理一次
+        """
+        self.engine = engine
+        self.max_idle = max_idle
+        self.cleanup_every = cleanup_every
+        self._calls = 0
+        # 不同进程的时钟可能有微小偏差，经过的时间不能为负
+        elapsed = f"(CASE WHEN :now > {self._table}.updated_at THEN :now - {self._table}.updated_at ELSE 0 END)"
+        refilled = (
+            f"CASE WHEN {self._table}.tokens + {elapsed} * :rate > :capacity THEN :capacity "
+            f"ELSE {self._table}.tokens + {elapsed} * :rate END"
+        )
+        self._acquire = text(
+            f"INSERT INTO {self._table} (bucket_key, tokens, updated_at) VALUES (:key, :capacity - :cost, :now) "
+            f"ON CONFLICT (bucket_key) DO UPDATE SET tokens = {refilled} - :cost, updated_at = :now "
+            f"WHERE {refilled} >= :cost"
+        )
+
+    def acquire(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        now = time.time()
+        params = {"key": key, "rate": rate, "capacity": capacity, "cost": cost, "now": now}
+        with self.engine.begin() as conn:
+            if conn.execute(self._acquire, params).rowcount:
+                wait = 0.0
+            else:
+                row = conn.execute(
+                    select(models.RateLimitBucket.tokens, models.RateLimitBucket.updated_at)
+                    .where(models.RateLimitBucket.bucket_key == key)
+                ).first()
+                tokens = min(capacity, row.tokens + max(now - row.updated_at, 0.0) * rate) if row else 0.0
+                wait = (cost - tokens) / rate if rate > 0 else float("inf")
+            self._calls += 1
+            if self._calls % self.cleanup_every == 0:
+                conn.execute(delete(models.RateLimitBucket).where(models.RateLimitBucket.updated_at < now - self.max_idle))
+        return wait
+
+class RateLimitExceeded(Exception):
+    """请求被限流或排队超时"""
+
+    def __init__(self, rule: RateLimitRule, retry_after: float, reason: str):
+        super().__init__(f"{rule.name}: {reason}")
+        self.rule = rule
+        self.retry_after = retry_after
+        # "rate"（请求速率超限）或"concurrency"（排队超时）
+        self.reason = reason
+
+class RateLimiter:
+    """
+    按规则对请求进行限流和准入控制
+    """
+
+    def __init__(self, rules: Sequence[RateLimitRule] = DEFAULT_RULES, backend: Optional[RateLimitBackend] = None):
+        """
+        初始化限流器
+
+        Args:
+            rules: 按顺序匹配的规则
+            backend: 令牌桶的存储后端，默认保存在进程内存中
+        """
+        self.rules: List[RateLimitRule] = list(rules)
+        self.backend = backend or MemoryRateLimitBackend()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def match(self, method: str, path: str) -> Optional[RateLimitRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    def check_rate(self, rule: RateLimitRule, client: str) -> None:
+        """从客户端在该规则下的令牌桶中取出一个令牌，令牌不足时抛出RateLimitExceeded"""
+        if rule.rate <= 0:
+            return
+        wait = self.backend.acquire(f"{rule.name}:{client}", rule.rate, rule.capacity)
+        if wait > 0:
+            raise RateLimitExceeded(rule, wait, "rate")
+
+    async def admit(self, rule: RateLimitRule) -> Optional[asyncio.Semaphore]:
+        """
+        等待该规则的并发名额
+
+        Returns:
+            Optional[asyncio.Semaphore]: 取得的名额，请求处理完后需要release；规则不限制并发时返回None
+        """
+        if not rule.max_concurrency:
+            return None
+        semaphore = self._semaphores.get(rule.name)
+        if semaphore is None:
+            semaphore = self._semaphores.setdefault(rule.name, asyncio.Semaphore(rule.max_concurrency))
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=rule.queue_timeout)
+        except asyncio.TimeoutError:
+            raise RateLimitExceeded(rule, rule.queue_timeout, "concurrency")
+        return semaphore
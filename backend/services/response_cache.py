@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+import hashlib
+import threading
+
+class ResponseCache:
+    """
+    进程内的响应缓存，保存已序列化的响应体
+    缓存项记录生成时的数据版本（见change_feed.entity_version），版本变化后自动失效，容量超出时按LRU淘汰
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        初始化响应缓存
+
+        Args:
+            max_entries: 最多缓存的响应数
+        """
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, bytes]]" = OrderedDict()
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, version: Hashable, body: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+def make_etag(*parts: Hashable) -> str:
+    """根据数据版本和查询参数生成强ETag"""
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    return f'"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断If-None-Match请求头是否命中当前ETag（按弱比较）"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(
+        (candidate[2:] if candidate.startswith("W/") else candidate) == etag
+        for candidate in candidates
+    )
@@ -0,0 +1,331 @@
+from typing import Any, Dict, List, Optional
+import html
+import re
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# 全文检索服务
+# 使用SQLite FTS5虚拟表 search_index 对学校、导师、申请备注、邮件和文档提取出的文本建立索引，
+# 由数据库触发器保持同步，因此任何写入路径（包括批量SQL）都会更新索引。
+#
+# 每条索引记录的rowid = 实体id * 8 + 类型编码，删除和更新可以直接按rowid定位，
+# 不需要扫描整张虚拟表。记录中还有一列参与分词的用户标记（u<user_id>u），查询用MATCH同时匹配
+# 用户标记和查询词，全文索引直接只返回当前用户的匹配，不需要先取出所有用户的匹配再过滤。
+# 摘要是转义过的HTML，只有高亮标签是标记，用户数据中的尖括号等字符不会被当作HTML。
+
+INDEX_TABLE = "search_index"
+
+# 实体类型编码，决定rowid的低三位，已有的编码不能修改
+ENTITY_TYPES = {
+    "school": 0,
+    "professor": 1,
+    "application": 2,
+    "email": 3,
+    "document": 4,
+}
+_TYPE_SLOTS = 8
+_TYPE_BY_CODE = {code: name for name, code in ENTITY_TYPES.items()}
+
+def _concat(*columns: str) -> str:
+    return " || ' ' || ".join(f"coalesce({{row}}.{column}, '')" for column in columns)
+
+# 每种实体的表名以及写入索引的标题和正文表达式（row为NEW或OLD的占位符）
+_SOURCES = {
+    "school": (
+        "schools",
+        "{row}.name",
+        _concat("department", "program", "location", "notes"),
+    ),
+    "professor": (
+        "professors",
+        "{row}.name",
+        _concat("research_area", "notes"),
+    ),
+    "application": (
+        "applications",
+        "(SELECT name FROM schools WHERE schools.id = {row}.school_id)",
+        "{row}.notes",
+    ),
+    "email": (
+        "emails",
+        "{row}.subject",
+        "{row}.content",
+    ),
+    # 文档的正文是提取出的文本，提取完成时更新文档行会触发重新索引
+    "document": (
+        "documents",
+        "{row}.name",
+        "(SELECT text FROM document_texts WHERE document_texts.content_hash = {row}.content_hash)",
+    ),
+}
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+# 生成摘要时先用控制字符标记高亮位置，转义之后再替换成高亮标签
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+# 短词退回LIKE扫描时标题中出现一次的得分，与bm25中标题和正文的权重一致
+_TITLE_WEIGHT = 10
+
+# trigram分词器按三个字符切分，对中文等没有空格分词的文本同样有效
+_tokenizer = "trigram"
+
+def _rowid(entity_type: str, row: str) -> str:
+    return f"{row}.id * {_TYPE_SLOTS} + {ENTITY_TYPES[entity_type]}"
+
+def _user_key(user_id: str) -> str:
+    # 两端加字母，trigram分词时u42u不会匹配到u142u等其他用户的标记，且至少有三个字符
+    return f"'u' || {user_id} || 'u'"
+
+_TRIGGER_NAMES = [
+    name
+    for table, _, _ in _SOURCES.values()
+    for name in (f"{table}_search_ai", f"{table}_search_au", f"{table}_search_ad")
+] + ["schools_search_application_title"]
+
+def _trigger_statements() -> List[str]:
+    statements = []
+    for entity_type, (table, title, body) in _SOURCES.items():
+        values = "{rowid}, {title}, {body}, {user_key}"
+        new_values = values.format(
+            rowid=_rowid(entity_type, "NEW"),
+            title=title.format(row="NEW"),
+            body=body.format(row="NEW"),
+            user_key=_user_key("NEW.user_id"),
+        )
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {INDEX_TABLE}(rowid, title, body, user_key) VALUES ({new_values}); END"
+        )
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE ON {table} BEGIN "
+            f"DELETE FROM {INDEX_TABLE} WHERE rowid = {_rowid(entity_type, 'OLD')}; "
+            f"INSERT INTO {INDEX_TABLE}(rowid, title, body, user_key) VALUES ({new_values}); END"
+        )
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM {INDEX_TABLE} WHERE rowid = {_rowid(entity_type, 'OLD')}; END"
+        )
+    # 学校改名时同步更新其申请记录的标题
+    statements.append(
+        f"CREATE TRIGGER IF NOT EXISTS schools_search_application_title AFTER UPDATE OF name ON schools BEGIN "
+        f"UPDATE {INDEX_TABLE} SET title = NEW.name WHERE rowid IN "
+        f"(SELECT id * {_TYPE_SLOTS} + {ENTITY_TYPES['application']} FROM applications WHERE school_id = NEW.id); END"
+    )
+    return statements
+
+def _rebuild_statements() -> List[str]:
+    statements = [f"DELETE FROM {INDEX_TABLE}"]
+    for entity_type, (table, title, body) in _SOURCES.items():
+        statements.append(
+            f"INSERT INTO {INDEX_TABLE}(rowid, title, body, user_key) "
+            f"SELECT {_rowid(entity_type, table)}, {title.format(row=table)}, {body.format(row=table)}, "
+            f"{_user_key(f'{table}.user_id')} FROM {table}"
+        )
+    return statements
+
+def ensure_search_index(engine: Engine) -> bool:
+    """
+    创建全文检索索引及同步触发器，索引首次创建时从现有数据回填
+
+    Args:
+        engine: 数据库引擎，需要在业务表创建之后调用
+
+    Returns:
+        bool: 当前数据库是否支持全文检索
+    """
+    global _tokenizer
+    if engine.dialect.name != "sqlite":
+        return False
+
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": INDEX_TABLE},
+        ).first()
+        if exists:
+            sql = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE name = :name"), {"name": INDEX_TABLE}
+            ).scalar()
+            _tokenizer = "trigram" if "trigram" in sql else "unicode61"
+            has_documents = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'documents_search_ai'")
+            ).first()
+            if "user_key" not in sql or not has_documents:
+                # 之前的索引没有用户标记列（没有用户列或者用户列不参与分词），索引文档之前的rowid编码不同，
+                # 连同触发器一起删除后重建
+                for name in _TRIGGER_NAMES:
+                    conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+                conn.execute(text(f"DROP TABLE {INDEX_TABLE}"))
+                exists = None
+        if not exists:
+            try:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {INDEX_TABLE} "
+                    f"USING fts5(title, body, user_key, tokenize='trigram')"
+                ))
+                _tokenizer = "trigram"
+            except Exception:
+                # SQLite 3.34之前没有trigram分词器，退回到unicode61
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {INDEX_TABLE} "
+                    f"USING fts5(title, body, user_key, tokenize='unicode61')"
+                ))
+                _tokenizer = "unicode61"
+        for statement in _trigger_statements():
+            conn.execute(text(statement))
+        if not exists:
+            for statement in _rebuild_statements():
+                conn.execute(text(statement))
+    return True
+
+def rebuild_search_index(db: Session) -> None:
+    """从业务表重新生成全部索引记录"""
+    for statement in _rebuild_statements():
+        db.execute(text(statement))
+    db.commit()
+
+def _split_terms(query: str) -> List[str]:
+    return [term for term in re.split(r"\s+", query.strip()) if term]
+
+def _user_match(user_id: int) -> str:
+    return f'{{user_key}} : "u{int(user_id)}u"'
+
+def _fts_query(user_id: int, terms: List[str]) -> str:
+    # 每个词作为短语加引号，避免用户输入被解析成FTS5查询语法；查询词只匹配标题和正文
+    phrases = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    return f"{_user_match(user_id)} AND {{title body}} : ({phrases})"
+
+def _type_filter(types: Optional[List[str]]) -> str:
+    if not types:
+        return ""
+    codes = sorted({ENTITY_TYPES[t] for t in types if t in ENTITY_TYPES})
+    if not codes:
+        return " AND 0"
+    return f" AND (rowid % {_TYPE_SLOTS}) IN ({', '.join(str(code) for code in codes)})"
+
+def _highlight(fragment: str) -> str:
+    return html.escape(fragment).replace(_MARK_START, HIGHLIGHT_START).replace(_MARK_END, HIGHLIGHT_END)
+
+def _make_snippet(value: Optional[str], terms: List[str], width: int = 32) -> str:
+    if not value:
+        return ""
+    lowered = value.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [p for p in positions if p >= 0]
+    start = max(min(positions) - width // 2, 0) if positions else 0
+    end = min(start + width * 2, len(value))
+    fragment = value[start:end]
+    for term in terms:
+        fragment = re.sub(
+            re.escape(term),
+            lambda m: f"{_MARK_START}{m.group(0)}{_MARK_END}",
+            fragment,
+            flags=re.IGNORECASE,
+        )
+    return ("…" if start > 0 else "") + _highlight(fragment) + ("…" if end < len(value) else "")
+
+def _fts_snippet(row: Any, terms: List[str]) -> str:
+    # 用户标记列也参与匹配，不能让FTS5自动选择摘要的列；优先正文中有高亮的摘要
+    for snippet in (row.body_snippet, row.title_snippet):
+        if snippet and _MARK_START in snippet:
+            return _highlight(snippet)
+    return _highlight(row.body_snippet) if row.body_snippet else _make_snippet(row.title, terms)
+
+def _occurrences(column: str, param: str) -> str:
+    # 词在列中出现的次数：删去所有出现后减少的长度除以词长
+    value = f"lower(coalesce({column}, ''))"
+    return f"((length({value}) - length(replace({value}, lower(:{param}), ''))) / length(:{param}))"
+
+def search(
+    db: Session,
+    user_id: int,
+    query: str,
+    types: Optional[List[str]] = None,
+    skip: int = 0,
+    limit: int = 20,
+) -> List[Dict[str, Any]]:
+    """
+    在用户自己的数据中全文检索
+
+    Args:
+        db: 数据库会话
+        user_id: 用户id
+        query: 查询字符串，多个词之间以空格分隔，结果需要包含全部词
+        types: 限定的实体类型 (school, professor, application, email, document)
+        skip: 跳过的结果数
+        limit: 返回的最大结果数
+
+    Returns:
+        List[Dict[str, Any]]: 按相关度排序的结果，包含类型、id、标题、高亮摘要和得分
+    """
+    terms = _split_terms(query)
+    if not terms:
+        return []
+
+    type_filter = _type_filter(types)
+    if _tokenizer == "trigram" and any(len(term) < 3 for term in terms):
+        # trigram无法匹配少于三个字符的词（如两个字的中文词），改用LIKE扫描。
+        # 得分为各词在标题和正文中出现的次数（标题加权），同分时正文中越早出现越靠前
+        conditions = " AND ".join(
+            f"(title LIKE :t{i} ESCAPE '\\' OR body LIKE :t{i} ESCAPE '\\')" for i in range(len(terms))
+        )
+        score = " + ".join(
+            f"{_TITLE_WEIGHT} * {_occurrences('title', f'r{i}')} + {_occurrences('body', f'r{i}')}"
+            for i in range(len(terms))
+        )
+        position = "instr(lower(coalesce(body, '')), lower(:r0))"
+        params = {}
+        for i, term in enumerate(terms):
+            params[f"t{i}"] = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            params[f"r{i}"] = term
+        rows = db.execute(
+            text(
+                f"SELECT rowid, title, body, CAST({score} AS REAL) AS score FROM {INDEX_TABLE} "
+                f"WHERE {INDEX_TABLE} MATCH :user AND {conditions}{type_filter} "
+                f"ORDER BY score DESC, {position} = 0, {position}, rowid DESC LIMIT :limit OFFSET :skip"
+            ),
+            {**params, "user": _user_match(user_id), "limit": limit, "skip": skip},
+        ).all()
+        return [
+            {
+                "type": _TYPE_BY_CODE[row.rowid % _TYPE_SLOTS],
+                "id": row.rowid // _TYPE_SLOTS,
+                "title": row.title,
+                "snippet": _make_snippet(row.body, terms) or _make_snippet(row.title, terms),
+                "score": row.score,
+            }
+            for row in rows
+        ]
+
+    rows = db.execute(
+        text(
+            f"SELECT rowid, title, "
+            f"snippet({INDEX_TABLE}, 0, :start, :end, '…', 64) AS title_snippet, "
+            f"snippet({INDEX_TABLE}, 1, :start, :end, '…', 64) AS body_snippet, "
+            f"bm25({INDEX_TABLE}, 10.0, 1.0, 0.0) AS rank "
+            f"FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH :query{type_filter} "
+            f"ORDER BY rank LIMIT :limit OFFSET :skip"
+        ),
+        {
+            "query": _fts_query(user_id, terms),
+            "start": _MARK_START,
+            "end": _MARK_END,
+            "limit": limit,
+            "skip": skip,
+        },
+    ).all()
+    return [
+        {
+            "type": _TYPE_BY_CODE[row.rowid % _TYPE_SLOTS],
+            "id": row.rowid // _TYPE_SLOTS,
+            "title": row.title,
+            "snippet": _fts_snippet(row, terms),
+            "score": -row.rank,
+        }
+        for row in rows
+    ]
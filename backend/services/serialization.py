@@ -0,0 +1,56 @@
+from typing import Iterable, List, Optional, Sequence, Type
+
+import orjson
+from pydantic import BaseModel
+from sqlalchemy import Column
+from sqlalchemy.engine import Row
+
+# 列表接口的快速序列化路径
+# 数据库中的数据已经是可信的，列表接口直接查询Core行（不构造ORM对象），
+# 按响应模型的字段顺序选取列，再用orjson编码，省去Pydantic的逐行校验和二次序列化。
+# 客户端可以只请求部分字段（fields查询参数），未请求的列不会被查询。
+
+def schema_columns(model: type, schema: Type[BaseModel]) -> List[Column]:
+    """
+    按响应模型的字段顺序返回ORM模型对应的表列
+
+    Args:
+        model: SQLAlchemy ORM模型
+        schema: Pydantic响应模型，字段名需要与表列名一致
+
+    Returns:
+        List[Column]: 表列列表
+    """
+    table = model.__table__
+    return [table.c[name] for name in schema.model_fields]
+
+def pick_columns(columns: Sequence[Column], fields: Optional[Iterable[str]] = None) -> List[Column]:
+    """
+    从columns中选取fields指定的列，保持columns中的顺序；id列总是包含在内
+
+    Args:
+        columns: 全部可选的列，通常为schema_columns的结果
+        fields: 字段名，为空时返回全部列
+
+    Returns:
+        List[Column]: 选取的列
+
+    Raises:
+        ValueError: fields中有不存在的字段
+    """
+    if not fields:
+        return list(columns)
+    wanted = set(fields)
+    unknown = wanted - {column.name for column in columns}
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    wanted.add("id")
+    return [column for column in columns if column.name in wanted]
+
+def dump_rows(rows: Sequence[Row]) -> bytes:
+    """将Core行编码为JSON数组"""
+    if not rows:
+        return b"[]"
+    # 所有行的字段相同，只取一次字段名；Row._asdict()逐行构造映射的开销较大
+    keys = rows[0]._fields
+    return orjson.dumps([dict(zip(keys, row)) for row in rows])
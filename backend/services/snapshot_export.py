@@ -0,0 +1,342 @@
+"""
+分析快照导出
+
+把models中的每张表导出为Parquet文件，分析查询在列式副本上进行，不再直接读取生产数据库。
+
+用法（在项目根目录下）:
+    python -m backend.services.snapshot_export --output snapshot
+    python -m backend.services.snapshot_export --output snapshot --full   # 丢弃已有分片，重新完整导出
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from datetime import date, datetime
+import argparse
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import Table, distinct, func, select, tuple_
+from sqlalchemy.engine import Engine
+
+from ..models import models
+from . import change_feed
+
+# 导出方式
+# - 记录在change_log中的表（学校、导师、申请、邮件等）增量导出：以change_log的id为水位线，
+#   只重新读取水位线之后有变更的记录，写入新的分片；已删除的记录写入_deleted为真的墓碑行。
+# - change_log本身只追加，按id水位线追加导出。
+# - 其余的表（汇总计数、任务状态等）没有变更记录，每次完整导出并替换旧的分片。
+# 每个分片都带有_version列（导出时change_log的最大id）。同一id出现在多个分片中时以_version最大的为准，
+# 例如在DuckDB中:
+#   SELECT * FROM (
+#       SELECT *, row_number() OVER (PARTITION BY id ORDER BY _version DESC) AS _rank
+#       FROM read_parquet('snapshot/applications/*.parquet')
+#   ) WHERE _rank = 1 AND NOT _deleted
+#
+# 读取按主键分批（keyset分页），每批使用一个独立的短事务，不长时间占用连接，也不会阻塞SQLite的WAL检查点。
+# 批与批之间的写入可能让一行在本次导出中反映水位线之后的数据，这些变更的版本大于本次的水位线，
+# 下次导出会再次导出该行，合并后的结果与数据库一致。
+# 导出进度保存在输出目录的manifest.json中，分片先写入临时文件再重命名，中断的导出不会留下不完整的分片。
+
+MANIFEST = "manifest.json"
+VERSION_COLUMN = "_version"
+DELETED_COLUMN = "_deleted"
+
+# 表名 -> change_feed中的实体类型
+TRACKED_TABLES = {model.__tablename__: entity for entity, (model, _) in change_feed.ENTITIES.items()}
+APPEND_ONLY_TABLES = {models.ChangeLog.__tablename__}
+
+# 凭据类的列不导出
+EXCLUDED_COLUMNS = {
+    "users": {"hashed_password"},
+    "email_accounts": {"password_encrypted"},
+    "devices": {"token"},
+}
+
+def _load_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("导出Parquet快照需要安装pyarrow")
+    return pyarrow, pyarrow.parquet
+
+def _arrow_type(pa, column) -> Any:
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return pa.string()
+    return {
+        bool: pa.bool_(),
+        int: pa.int64(),
+        float: pa.float64(),
+        datetime: pa.timestamp("us"),
+        date: pa.date32(),
+        bytes: pa.binary(),
+    }.get(python_type, pa.string())
+
+class _PartWriter:
+    """把一张表的若干批行写入一个Parquet分片，每批一个行组"""
+
+    def __init__(self, pa, pq, path: str, columns: Sequence, version: int, compression: str):
+        self.pa = pa
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.names = [column.name for column in columns]
+        self.version = version
+        self.schema = pa.schema(
+            [pa.field(column.name, _arrow_type(pa, column)) for column in columns]
+            + [pa.field(VERSION_COLUMN, pa.int64()), pa.field(DELETED_COLUMN, pa.bool_())]
+        )
+        self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression=compression)
+        self.rows = 0
+
+    def write(self, rows: Sequence[Sequence[Any]], deleted: bool = False) -> None:
+        if not rows:
+            return
+        arrays = {name: list(values) for name, values in zip(self.names, zip(*rows))}
+        arrays[VERSION_COLUMN] = [self.version] * len(rows)
+        arrays[DELETED_COLUMN] = [deleted] * len(rows)
+        self.writer.write_table(self.pa.Table.from_pydict(arrays, schema=self.schema))
+        self.rows += len(rows)
+
+    def close(self) -> int:
+        """完成分片并返回行数；没有写入任何行时删除分片"""
+        self.writer.close()
+        if self.rows:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+        return self.rows
+
+    def abort(self) -> None:
+        self.writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+class SnapshotExporter:
+    """
+    分析快照导出器
+    """
+
+    def __init__(self, engine: Engine, output_dir: str, batch_size: int = 10000, compression: str = "zstd"):
+        """
+        初始化快照导出器
+
+        Args:
+            engine: 数据库引擎
+            output_dir: 输出目录，每张表一个子目录
+            batch_size: 每批读取的行数，也是Parquet行组的大小
+            compression: Parquet压缩算法
+        """
+        self.engine = engine
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.compression = compression
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.output_dir, MANIFEST)
+
+    def load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path(), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"tables": {}}
+
+    def _save_manifest(self, manifest: Dict[str, Any]) -> None:
+        tmp_path = self._manifest_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._manifest_path())
+
+    def _columns(self, table: Table) -> List:
+        excluded = EXCLUDED_COLUMNS.get(table.name, set())
+        return [column for column in table.columns if column.name not in excluded]
+
+    def _scan(self, table: Table, columns: Sequence, after: Optional[Tuple] = None) -> Iterator[List[Tuple]]:
+        # 按主键分批读取，每批一个短事务
+        key = list(table.primary_key.columns)
+        key_expr = key[0] if len(key) == 1 else tuple_(*key)
+        # 主键另外加标签选取，避免与columns中的同名列合并
+        stmt = (
+            select(*columns, *(column.label(f"_key_{i}") for i, column in enumerate(key)))
+            .order_by(*key)
+            .limit(self.batch_size)
+        )
+        width = len(columns)
+        while True:
+            query = stmt if after is None else stmt.where(key_expr > (after[0] if len(key) == 1 else tuple_(*after)))
+            with self.engine.connect() as conn:
+                rows = conn.execute(query).all()
+            if not rows:
+                return
+            yield [tuple(row[:width]) for row in rows]
+            if len(rows) < self.batch_size:
+                return
+            after = tuple(rows[-1][width:])
+
+    def _changed_ids(self, entity: str, since: int, until: int) -> Iterator[List[int]]:
+        # 水位线之后有变更的实体id，按id分批
+        log = models.ChangeLog
+        stmt = (
+            select(distinct(log.entity_id))
+            .where(log.entity == entity, log.id > since, log.id <= until)
+            .order_by(log.entity_id)
+            .limit(self.batch_size)
+        )
+        last = None
+        while True:
+            query = stmt if last is None else stmt.where(log.entity_id > last)
+            with self.engine.connect() as conn:
+                ids = list(conn.execute(query).scalars())
+            if not ids:
+                return
+            yield ids
+            if len(ids) < self.batch_size:
+                return
+            last = ids[-1]
+
+    def _part_path(self, table: Table, name: str) -> str:
+        directory = os.path.join(self.output_dir, table.name)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    def _export_full(self, pa, pq, table: Table, version: int) -> Tuple[str, int]:
+        columns = self._columns(table)
+        name = f"full-{version:012d}.parquet"
+        writer = _PartWriter(pa, pq, self._part_path(table, name), columns, version, self.compression)
+        try:
+            for rows in self._scan(table, columns):
+                writer.write(rows)
+        except BaseException:
+            writer.abort()
+            raise
+        return name, writer.close()
+
+    def _export_changes(self, pa, pq, table: Table, entity: str, since: int, version: int) -> Tuple[str, int]:
+        columns = self._columns(table)
+        id_column = table.c.id
+        name = f"delta-{since:012d}-{version:012d}.parquet"
+        writer = _PartWriter(pa, pq, self._part_path(table, name), columns, version, self.compression)
+        id_index = [column.name for column in columns].index("id")
+        try:
+            for ids in self._changed_ids(entity, since, version):
+                with self.engine.connect() as conn:
+                    rows = [tuple(row) for row in conn.execute(select(*columns).where(id_column.in_(ids)))]
+                writer.write(rows)
+                found = {row[id_index] for row in rows}
+                # 变更后已经不存在的记录写为墓碑行，只有id有值
+                tombstones = [
+                    tuple(entity_id if i == id_index else None for i in range(len(columns)))
+                    for entity_id in ids if entity_id not in found
+                ]
+                writer.write(tombstones, deleted=True)
+        except BaseException:
+            writer.abort()
+            raise
+        return name, writer.close()
+
+    def _export_appended(self, pa, pq, table: Table, since: int, version: int) -> Tuple[str, int, int]:
+        columns = self._columns(table)
+        name = f"append-{since:012d}-{version:012d}.parquet"
+        writer = _PartWriter(pa, pq, self._part_path(table, name), columns, version, self.compression)
+        id_index = [column.name for column in columns].index("id")
+        last = since
+        try:
+            for rows in self._scan(table, columns, after=(since,)):
+                rows = [row for row in rows if row[id_index] <= version]
+                writer.write(rows)
+                if rows:
+                    last = rows[-1][id_index]
+                if len(rows) < self.batch_size:
+                    break
+        except BaseException:
+            writer.abort()
+            raise
+        return name, writer.close(), last
+
+    def _remove_parts(self, table_name: str, files: Sequence[str]) -> None:
+        for name in files:
+            path = os.path.join(self.output_dir, table_name, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def export(self, full: bool = False, tables: Optional[Sequence[str]] = None, progress: Optional[Callable[[str, int], None]] = None) -> Dict[str, Any]:
+        """
+        导出一次快照，已经导出过的表只导出上次之后的变更
+
+        Args:
+            full: 丢弃已有分片，所有表重新完整导出
+            tables: 只导出这些表，默认全部
+            progress: 每导出完一张表调用一次，参数为表名和本次导出的行数
+
+        Returns:
+            Dict[str, Any]: 更新后的manifest，tables中记录每张表的水位线和分片文件
+        """
+        pa, pq = _load_pyarrow()
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest = self.load_manifest()
+        with self.engine.connect() as conn:
+            version = conn.execute(select(func.max(models.ChangeLog.id))).scalar() or 0
+
+        for table in models.Base.metadata.sorted_tables:
+            if tables and table.name not in tables:
+                continue
+            state = manifest["tables"].get(table.name)
+            if full and state:
+                self._remove_parts(table.name, state["files"])
+                state = None
+            exported = 0
+            if table.name in APPEND_ONLY_TABLES:
+                since = state["watermark"] if state else 0
+                name, exported, last = self._export_appended(pa, pq, table, since, version)
+                state = state or {"files": []}
+                state["watermark"] = last
+            elif table.name in TRACKED_TABLES and state is not None:
+                if version > state["watermark"]:
+                    name, exported = self._export_changes(pa, pq, table, TRACKED_TABLES[table.name], state["watermark"], version)
+                    state["watermark"] = version
+            else:
+                # 首次导出或没有变更记录的表：完整导出后替换旧分片
+                name, exported = self._export_full(pa, pq, table, version)
+                if state:
+                    # 版本没有变化时新分片与旧分片同名
+                    self._remove_parts(table.name, [old for old in state["files"] if old != name])
+                state = {"files": [], "watermark": version}
+            if exported:
+                state["files"].append(name)
+            state["rows"] = state.get("rows", 0) + exported
+            manifest["tables"][table.name] = state
+            # 每张表完成后保存进度，中断后重新运行只需导出剩下的表
+            manifest["version"] = version
+            self._save_manifest(manifest)
+            if progress:
+                progress(table.name, exported)
+
+        manifest["exported_at"] = datetime.utcnow().isoformat()
+        self._save_manifest(manifest)
+        return manifest
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="导出Parquet分析快照")
+    parser.add_argument("--output", required=True, help="输出目录")
+    parser.add_argument("--database-url", default=None, help="数据库连接URL，默认使用DATABASE_URL")
+    parser.add_argument("--full", action="store_true", help="丢弃已有分片，重新完整导出")
+    parser.add_argument("--table", action="append", dest="tables", help="只导出指定的表，可重复")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    from ..database.database import SQLALCHEMY_DATABASE_URL, create_db_engine
+    engine = create_db_engine(args.database_url or SQLALCHEMY_DATABASE_URL)
+    exporter = SnapshotExporter(engine, args.output, batch_size=args.batch_size)
+    start = time.perf_counter()
+    manifest = exporter.export(
+        full=args.full,
+        tables=args.tables,
+        progress=lambda name, rows: print(f"{name}: {rows}行", file=sys.stderr),
+    )
+    print(f"快照版本{manifest['version']}，耗时{time.perf_counter() - start:.1f}秒", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+from typing import Optional, Tuple
+import os
+import re
+import zipfile
+from xml.etree import ElementTree
+
+# 文档文本提取
+# 本模块中的函数在提取服务的工作进程中执行，只依赖标准库（PDF需要可选的pypdf），
+# 工作进程导入本模块时不会加载数据库等其他依赖。
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".md")
+
+# 提取出的文本最多保留的字符数
+MAX_CHARS = 1_000_000
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_APP_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}"
+
+class UnsupportedDocument(ValueError):
+    """文件格式不支持提取文本"""
+
+def is_supported(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS
+
+def _normalize(text: str) -> str:
+    # 合并多余的空白行，去掉PDF提取常见的行尾空格
+    text = re.sub(r"[ \t]+\n", "\n", text.replace("\r\n", "\n").replace("\x00", ""))
+    return re.sub(r"\n{3,}", "\n\n", text).strip()[:MAX_CHARS]
+
+def _extract_pdf(path: str) -> Tuple[str, Optional[int]]:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("提取PDF文本需要安装pypdf")
+    reader = PdfReader(path)
+    pages = []
+    size = 0
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        pages.append(text)
+        size += len(text)
+        if size >= MAX_CHARS:
+            break
+    return "\n\n".join(pages), len(reader.pages)
+
+def _extract_docx(path: str) -> Tuple[str, Optional[int]]:
+    with zipfile.ZipFile(path) as archive:
+        root = ElementTree.fromstring(archive.read("word/document.xml"))
+        page_count = None
+        if "docProps/app.xml" in archive.namelist():
+            pages = ElementTree.fromstring(archive.read("docProps/app.xml")).find(f"{_APP_NS}Pages")
+            if pages is not None and (pages.text or "").isdigit():
+                page_count = int(pages.text)
+    paragraphs = []
+    for paragraph in root.iter(f"{_WORD_NS}p"):
+        parts = []
+        for node in paragraph.iter():
+            if node.tag == f"{_WORD_NS}t":
+                parts.append(node.text or "")
+            elif node.tag == f"{_WORD_NS}tab":
+                parts.append("\t")
+            elif node.tag in (f"{_WORD_NS}br", f"{_WORD_NS}cr"):
+                parts.append("\n")
+        paragraphs.append("".join(parts))
+    return "\n".join(paragraphs), page_count
+
+def _extract_plain(path: str) -> Tuple[str, Optional[int]]:
+    with open(path, "rb") as f:
+        data = f.read(MAX_CHARS * 4)
+    for encoding in ("utf-8-sig", "gb18030"):
+        try:
+            return data.decode(encoding), None
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace"), None
+
+def extract_text(path: str) -> Tuple[str, Optional[int]]:
+    """
+    提取文档文件中的文本
+
+    Args:
+        path: 文件路径，按扩展名判断格式
+
+    Returns:
+        Tuple[str, Optional[int]]: (文本, 页数)，纯文本文件和未记录页数的DOCX页数为None
+
+    Raises:
+        UnsupportedDocument: 文件格式不支持
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pdf":
+        text, page_count = _extract_pdf(path)
+    elif extension == ".docx":
+        text, page_count = _extract_docx(path)
+    elif extension in (".txt", ".md"):
+        text, page_count = _extract_plain(path)
+    else:
+        raise UnsupportedDocument(f"不支持提取{extension or '无扩展名'}文件的文本")
+    return _normalize(text), page_count
@@ -0,0 +1,48 @@
+from typing import Iterator
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session, sessionmaker
+
+from backend.app.config import Settings
+from backend.app.main import create_app
+from backend.database.database import create_db_engine
+from backend.database.schema import create_schema
+
+PASSWORD = "secret123"
+
+@pytest.fixture
+def settings(tmp_path) -> Settings:
+    """每个测试使用独立的SQLite文件，默认关闭限流"""
+    return Settings(
+        database_url=f"sqlite:///{tmp_path / 'test.db'}",
+        jwt_secret="test-secret",
+        rate_limit_enabled=False,
+    )
+
+@pytest.fixture
+def client(settings) -> Iterator[TestClient]:
+    with TestClient(create_app(settings)) as test_client:
+        yield test_client
+
+@pytest.fixture
+def session_factory(settings) -> Iterator[sessionmaker]:
+    """不经过应用、直接访问测试数据库的会话工厂"""
+    engine = create_db_engine(settings.database_url)
+    create_schema(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+@pytest.fixture
+def db(session_factory) -> Iterator[Session]:
+    with session_factory() as session:
+        yield session
+
+def register(client: TestClient, email: str = "") -> dict:
+    """注册并登录一个用户，返回携带访问令牌的请求头"""
+    email = email or f"{uuid.uuid4().hex[:8]}@example.com"
+    response = client.post("/auth/register", json={"email": email, "password": PASSWORD})
+    assert response.status_code == 201, response.text
+    token = client.post("/auth/token", data={"username": email, "password": PASSWORD}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,29 @@
+import dataclasses
+
+from fastapi.testclient import TestClient
+
+from backend.app.main import create_app
+
+from .conftest import register
+
+def _app(settings, tmp_path, name: str) -> TestClient:
+    return TestClient(create_app(dataclasses.replace(settings, database_url=f"sqlite:///{tmp_path / name}")))
+
+def test_apps_in_one_process_do_not_share_caches(settings, tmp_path):
+    with _app(settings, tmp_path, "a.db") as a, _app(settings, tmp_path, "b.db") as b:
+        # 两个数据库中的用户id、变更日志版本号都相同
+        headers_a = register(a, "same@example.com")
+        headers_b = register(b, "same@example.com")
+        for client, headers, name, area in ((a, headers_a, "Alpha", "robotics"), (b, headers_b, "Beta", "linguistics")):
+            assert client.post("/schools/", json={"name": name}, headers=headers).status_code == 200
+            response = client.post(
+                "/professors/", json={"name": name, "email": f"{name}@uni.edu", "research_area": area}, headers=headers
+            )
+            assert response.status_code == 200
+
+        assert [school["name"] for school in a.get("/schools/", headers=headers_a).json()] == ["Alpha"]
+        assert [school["name"] for school in b.get("/schools/", headers=headers_b).json()] == ["Beta"]
+
+        for client, headers, name, area in ((a, headers_a, "Alpha", "robotics"), (b, headers_b, "Beta", "linguistics")):
+            matches = client.post("/professors/match", json={"profile": area}, headers=headers).json()
+            assert [match["professor"]["name"] for match in matches] == [name]
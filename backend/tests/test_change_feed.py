@@ -0,0 +1,59 @@
+from backend.models import models
+from backend.services import change_feed, crud
+
+from .conftest import register
+
+def _changes(client, headers, since: int) -> dict:
+    response = client.get("/changes", params={"since": since}, headers=headers)
+    assert response.status_code == 200, response.text
+    return {(change["entity"], change["id"]): change for change in response.json()["changes"]}
+
+def _create(client, headers, path: str, payload: dict) -> int:
+    response = client.post(path, json=payload, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+def test_deleting_application_records_detached_emails(client):
+    headers = register(client)
+    school_id = _create(client, headers, "/schools/", {"name": "清华大学"})
+    application_id = _create(client, headers, "/applications/", {"school_id": school_id})
+    email_id = _create(client, headers, "/emails/", {
+        "application_id": application_id, "subject": "申请", "content": "您好",
+        "sender": "me@example.com", "receiver": "prof@example.com",
+    })
+    cursor = client.get("/changes/cursor", headers=headers).json()["cursor"]
+
+    assert client.delete(f"/applications/{application_id}", headers=headers).status_code == 200
+
+    changes = _changes(client, headers, cursor)
+    assert changes[("application", application_id)]["op"] == change_feed.DELETE
+    email = changes[("email", email_id)]
+    assert email["op"] == change_feed.UPDATE
+    assert email["data"]["application_id"] is None
+
+def test_deleting_school_records_detached_applications(client):
+    headers = register(client)
+    school_id = _create(client, headers, "/schools/", {"name": "北京大学"})
+    application_id = _create(client, headers, "/applications/", {"school_id": school_id})
+    cursor = client.get("/changes/cursor", headers=headers).json()["cursor"]
+
+    assert client.delete(f"/schools/{school_id}", headers=headers).status_code == 200
+
+    changes = _changes(client, headers, cursor)
+    assert changes[("school", school_id)]["op"] == change_feed.DELETE
+    application = changes[("application", application_id)]
+    assert application["op"] == change_feed.UPDATE
+    assert application["data"]["school_id"] is None
+
+def test_assigning_unowned_rows_records_changes(db):
+    user = crud.create_user(db, "owner@example.com", "x")
+    school = models.School(name="复旦大学")
+    db.add(school)
+    db.commit()
+
+    assert crud.assign_unowned_rows(db, user.id) == 1
+
+    changes = change_feed.get_changes(db, user.id)["changes"]
+    assert [(change["entity"], change["id"], change["op"]) for change in changes] == [
+        ("school", school.id, change_feed.UPDATE)
+    ]
@@ -0,0 +1,48 @@
+from backend.models import models, schemas
+from backend.services import crud, dashboard_service
+
+def _counters(db, user_id: int) -> dict:
+    rows = db.query(models.SummaryCounter).filter(
+        models.SummaryCounter.user_id == user_id,
+        models.SummaryCounter.metric == dashboard_service.APPLICATION_STATUS,
+    )
+    return {row.key: row.count for row in rows if row.count}
+
+def _school_counts(db) -> dict:
+    return {row.school_id: row.count for row in db.query(models.SchoolApplicationCount) if row.count}
+
+def test_updates_from_a_stale_read_keep_counters_exact(session_factory, db):
+    user = crud.create_user(db, "owner@example.com", "x")
+    school = crud.create_school(db, user.id, schemas.SchoolCreate(name="MIT"))
+    other = crud.create_school(db, user.id, schemas.SchoolCreate(name="CMU"))
+    application = crud.create_application(db, user.id, schemas.ApplicationCreate(school_id=school.id))
+
+    with session_factory() as first, session_factory() as second:
+        # 第二个会话先读到旧状态（保留引用，避免对象被回收后重新加载），第一个会话随后修改并提交
+        stale = crud.get_application(second, user.id, application.id)
+        crud.update_application(first, user.id, application.id, {"status": "已提交", "school_id": other.id})
+        crud.update_application(second, user.id, application.id, {"status": "录取"})
+        assert stale.status == "录取"
+
+    db.expire_all()
+    assert _counters(db, user.id) == {"录取": 1}
+    assert _school_counts(db) == {other.id: 1}
+
+    with session_factory() as first, session_factory() as second:
+        stale = crud.get_application(second, user.id, application.id)
+        crud.update_application(first, user.id, application.id, {"status": "拒绝"})
+        assert stale.status == "录取"
+        assert crud.delete_application(second, user.id, application.id)
+
+    db.expire_all()
+    assert _counters(db, user.id) == {}
+    assert _school_counts(db) == {}
+
+def test_deleting_a_school_drops_its_application_count(db):
+    user = crud.create_user(db, "owner@example.com", "x")
+    school = crud.create_school(db, user.id, schemas.SchoolCreate(name="MIT"))
+    crud.create_application(db, user.id, schemas.ApplicationCreate(school_id=school.id))
+    assert _school_counts(db) == {school.id: 1}
+
+    assert crud.delete_school(db, user.id, school.id)
+    assert db.query(models.SchoolApplicationCount).count() == 0
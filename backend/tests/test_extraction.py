@@ -0,0 +1,37 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from backend.app.main import create_app
+from backend.models import models, schemas
+from backend.services import crud
+
+def _pending_document(db, user_id: int, application_id: int, path: str, content_hash: str) -> int:
+    document = crud.create_document(
+        db, user_id,
+        schemas.DocumentCreate(application_id=application_id, name="CV", type="CV", path=path),
+        content_hash=content_hash, extraction_status="pending",
+    )
+    return document.id
+
+def _statuses(db, document_ids) -> dict:
+    db.expire_all()
+    return {document_id: db.get(models.Document, document_id).extraction_status for document_id in document_ids}
+
+def test_pending_documents_are_resubmitted_at_startup(settings, session_factory, db, tmp_path):
+    user = crud.create_user(db, "owner@example.com", "x")
+    school = crud.create_school(db, user.id, schemas.SchoolCreate(name="MIT"))
+    application = crud.create_application(db, user.id, schemas.ApplicationCreate(school_id=school.id))
+    path = tmp_path / "cv.txt"
+    path.write_text("研究经历", encoding="utf-8")
+    # 上次停止时提取被取消的文档，以及文件已经不存在的文档
+    kept = _pending_document(db, user.id, application.id, str(path), "a" * 64)
+    missing = _pending_document(db, user.id, application.id, str(tmp_path / "gone.txt"), "b" * 64)
+
+    with TestClient(create_app(settings)):
+        deadline = time.monotonic() + 30
+        while "pending" in _statuses(db, [kept, missing]).values() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    assert _statuses(db, [kept, missing]) == {kept: "completed", missing: "failed"}
+    assert db.get(models.DocumentText, "a" * 64).text == "研究经历"
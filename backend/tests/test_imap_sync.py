@@ -0,0 +1,192 @@
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import pytest
+
+from backend.models import models
+from backend.services import crud
+from backend.services.credential_store import CredentialStore
+from backend.services.imap_sync import HEADER_FIELDS, ImapSyncService
+
+class FakeImap:
+    """
+    进程内的IMAP4替身，实现同步用到的select、response和UID SEARCH/FETCH，
+    记录每次FETCH的UID以便检查只拉取了需要的邮件
+    """
+
+    _MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+    def __init__(self, uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.messages: Dict[int, Tuple[datetime, bytes]] = {}
+        self.next_uid = 1
+        self.fetched: List[List[int]] = []
+        self._untagged: Dict[str, list] = {}
+
+    def deliver(self, received: datetime, message_id: str, in_reply_to: str = "", sender: str = "Prof Wang <wang@uni.edu>") -> int:
+        lines = [f"Message-ID: {message_id}", f"From: {sender}", "Subject: Re: 申请", f"Date: {received:%a, %d %b %Y %H:%M:%S} +0000"]
+        if in_reply_to:
+            lines.append(f"In-Reply-To: {in_reply_to}")
+        uid = self.next_uid
+        self.next_uid += 1
+        self.messages[uid] = (received, ("\r\n".join(lines) + "\r\n\r\n").encode())
+        return uid
+
+    def select(self, mailbox: str, readonly: bool = False):
+        self._untagged = {
+            "UIDVALIDITY": [str(self.uidvalidity).encode()],
+            "UIDNEXT": [str(self.next_uid).encode()],
+        }
+        return "OK", [str(len(self.messages)).encode()]
+
+    def response(self, code: str):
+        return code, self._untagged.pop(code, [None])
+
+    def uid(self, command: str, *args: str):
+        if command == "SEARCH":
+            return "OK", [" ".join(map(str, self._search(*args))).encode()]
+        if command == "FETCH":
+            assert HEADER_FIELDS in args[1]
+            uids = [int(uid) for uid in args[0].split(",")]
+            self.fetched.append(uids)
+            data = []
+            for seq, uid in enumerate(uids, 1):
+                header = self.messages[uid][1]
+                data.append((f"{seq} (UID {uid} BODY[HEADER.FIELDS ({HEADER_FIELDS})] {{{len(header)}}}".encode(), header))
+                data.append(b")")
+            return "OK", data
+        return "BAD", [b"unsupported"]
+
+    def _search(self, *criteria: str) -> List[int]:
+        uids = sorted(self.messages)
+        if criteria == ("*",):
+            return uids[-1:]
+        if criteria[0] == "UID":
+            start = int(criteria[1].split(":")[0])
+            # 与真实服务器一样，n大于最大UID时n:*仍返回最后一封
+            return [uid for uid in uids if uid >= start] or uids[-1:]
+        if criteria[0] == "SINCE":
+            day, month, year = criteria[1].split("-")
+            since = datetime(int(year), self._MONTHS.index(month) + 1, int(day))
+            return [uid for uid in uids if self.messages[uid][0] >= since]
+        raise AssertionError(f"unexpected search {criteria}")
+
+@pytest.fixture
+def account(db) -> models.EmailAccount:
+    user = crud.create_user(db, "student@example.com", "x")
+    account = models.EmailAccount(
+        user_id=user.id, username="student@example.com", smtp_server="smtp.example.com", smtp_port=465,
+        imap_server="imap.example.com", imap_port=993, password_encrypted="x",
+    )
+    db.add(account)
+    db.commit()
+    return account
+
+def _sent_email(db, account: models.EmailAccount, message_id: str, sent_at: datetime) -> models.Email:
+    email = models.Email(
+        user_id=account.user_id, subject="申请", sender=account.username, receiver="wang@uni.edu",
+        sent_at=sent_at, is_sent=True, message_id=message_id,
+    )
+    db.add(email)
+    db.commit()
+    return email
+
+def _service(session_factory, batch_size: int = 200) -> ImapSyncService:
+    return ImapSyncService(session_factory, CredentialStore(), batch_size=batch_size, interval=0)
+
+def _replies(db, account: models.EmailAccount) -> List[str]:
+    return [reply.message_id for reply in crud.get_email_replies(db, account.user_id)]
+
+def _notifications(db, account: models.EmailAccount) -> int:
+    return db.query(models.Notification).filter(models.Notification.user_id == account.user_id).count()
+
+def test_first_sync_only_fetches_mail_after_earliest_unreplied(db, session_factory, account):
+    _sent_email(db, account, "<m1@example.com>", datetime(2026, 3, 10, 9))
+    server = FakeImap()
+    server.deliver(datetime(2026, 3, 1), "<old@uni.edu>", in_reply_to="<other@example.com>")
+    reply_uid = server.deliver(datetime(2026, 3, 12), "<r1@uni.edu>", in_reply_to="<m1@example.com>")
+    server.deliver(datetime(2026, 3, 13), "<news@uni.edu>")
+
+    result = _service(session_factory).sync(db, account, server)
+
+    assert server.fetched == [[reply_uid, reply_uid + 1]]
+    assert (result.fetched, result.replies, result.uidvalidity, result.last_uid) == (2, 1, 1, 3)
+    assert _replies(db, account) == ["<r1@uni.edu>"]
+    assert _notifications(db, account) == 1
+    state = crud.get_mailbox_state(db, account.id, "INBOX")
+    assert (state.uidvalidity, state.last_uid) == (1, 3)
+
+def test_incremental_sync_only_fetches_new_uids(db, session_factory, account):
+    _sent_email(db, account, "<m1@example.com>", datetime(2026, 3, 10))
+    _sent_email(db, account, "<m2@example.com>", datetime(2026, 3, 11))
+    server = FakeImap()
+    server.deliver(datetime(2026, 3, 12), "<r1@uni.edu>", in_reply_to="<m1@example.com>")
+    service = _service(session_factory)
+    service.sync(db, account, server)
+
+    server.fetched.clear()
+    new_uid = server.deliver(datetime(2026, 3, 14), "<r2@uni.edu>", in_reply_to="<m2@example.com>")
+    result = service.sync(db, account, server)
+    assert server.fetched == [[new_uid]]
+    assert (result.replies, result.last_uid) == (1, new_uid)
+    assert sorted(_replies(db, account)) == ["<r1@uni.edu>", "<r2@uni.edu>"]
+
+    # 没有新邮件时n:*返回的最后一封不会被重新拉取
+    server.fetched.clear()
+    result = service.sync(db, account, server)
+    assert server.fetched == []
+    assert (result.fetched, result.replies, result.last_uid) == (0, 0, new_uid)
+
+def test_incremental_sync_commits_progress_per_batch(db, session_factory, account):
+    _sent_email(db, account, "<m1@example.com>", datetime(2026, 3, 10))
+    server = FakeImap()
+    service = _service(session_factory, batch_size=2)
+    service.sync(db, account, server)
+
+    for day in range(5):
+        server.deliver(datetime(2026, 3, 11 + day), f"<r{day}@uni.edu>", in_reply_to="<m1@example.com>")
+    result = service.sync(db, account, server)
+    assert server.fetched == [[1, 2], [3, 4], [5]]
+    assert (result.fetched, result.replies, result.last_uid) == (5, 5, 5)
+
+def test_uidvalidity_change_resyncs_without_duplicate_replies(db, session_factory, account):
+    _sent_email(db, account, "<m1@example.com>", datetime(2026, 3, 10))
+    _sent_email(db, account, "<m2@example.com>", datetime(2026, 3, 15))
+    server = FakeImap(uidvalidity=1)
+    server.deliver(datetime(2026, 3, 12), "<r1@uni.edu>", in_reply_to="<m1@example.com>")
+    service = _service(session_factory)
+    service.sync(db, account, server)
+
+    # 邮箱被重建：UID重新编号，已处理的回复以新的UID出现
+    rebuilt = FakeImap(uidvalidity=7)
+    rebuilt.deliver(datetime(2026, 3, 12), "<r1@uni.edu>", in_reply_to="<m1@example.com>")
+    rebuilt.deliver(datetime(2026, 3, 16), "<r2@uni.edu>", in_reply_to="<m2@example.com>")
+    result = service.sync(db, account, rebuilt)
+
+    # 只查找最早一封未回复邮件（m2）之后收到的邮件
+    assert rebuilt.fetched == [[2]]
+    assert (result.uidvalidity, result.replies, result.last_uid) == (7, 1, 2)
+    assert sorted(_replies(db, account)) == ["<r1@uni.edu>", "<r2@uni.edu>"]
+    state = crud.get_mailbox_state(db, account.id, "INBOX")
+    assert (state.uidvalidity, state.last_uid) == (7, 2)
+
+def test_duplicate_replies_are_saved_and_notified_once(db, session_factory, account):
+    _sent_email(db, account, "<m1@example.com>", datetime(2026, 3, 10))
+    # 未回复的m2使重新同步时仍会拉取r1
+    _sent_email(db, account, "<m2@example.com>", datetime(2026, 3, 11))
+    server = FakeImap()
+    # 同一封回复出现两次（例如被复制到收件箱）
+    server.deliver(datetime(2026, 3, 12), "<r1@uni.edu>", in_reply_to="<m1@example.com>")
+    server.deliver(datetime(2026, 3, 12), "<r1@uni.edu>", in_reply_to="<m1@example.com>")
+    service = _service(session_factory)
+    result = service.sync(db, account, server)
+    assert result.replies == 1
+
+    # 丢失同步进度后重新同步也不会再次保存或通知
+    db.delete(crud.get_mailbox_state(db, account.id, "INBOX"))
+    db.commit()
+    server.deliver(datetime(2026, 3, 13), "<r1@uni.edu>", in_reply_to="<m1@example.com>")
+    result = service.sync(db, account, server)
+    assert (result.fetched, result.replies) == (3, 0)
+    assert _replies(db, account) == ["<r1@uni.edu>"]
+    assert _notifications(db, account) == 1
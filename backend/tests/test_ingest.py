@@ -0,0 +1,106 @@
+from datetime import datetime
+import os
+import threading
+
+from backend.models import models, schemas
+from backend.services import crud
+from backend.services.ingest_service import IngestService
+
+class _GatedIngestService(IngestService):
+    """第一批写入前停下，等测试放行"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def _process_chunk(self, job, chunk):
+        if not self.started.is_set():
+            self.started.set()
+            assert self.gate.wait(10)
+        super()._process_chunk(job, chunk)
+
+def _csv(tmp_path, name: str, rows: int) -> str:
+    path = tmp_path / name
+    path.write_text("name,location\n" + "".join(f"School {name} {i},City\n" for i in range(rows)), encoding="utf-8")
+    return str(path)
+
+def test_shutdown_finishes_current_chunk_and_fails_unfinished_jobs(session_factory, db, tmp_path):
+    user = crud.create_user(db, "owner@example.com", "x")
+    service = _GatedIngestService(session_factory, chunk_size=2)
+    running = service.submit(user.id, "schools", "a.csv", _csv(tmp_path, "a", 5))
+    queued = service.submit(user.id, "schools", "b.csv", _csv(tmp_path, "b", 3))
+    assert service.started.wait(10)
+
+    stopper = threading.Thread(target=service.shutdown)
+    stopper.start()
+    # 停止标志设置之后再放行第一批，任务在这一批之后中断
+    while not service._stopping.is_set():
+        stopper.join(0.01)
+    service.gate.set()
+    stopper.join(10)
+    assert not stopper.is_alive()
+
+    first = service.get(user.id, running.id)
+    assert (first["status"], first["rows_processed"], first["inserted"]) == ("failed", 2, 2)
+    assert "中断" in first["detail"] and first["finished_at"] is not None
+    second = service.get(user.id, queued.id)
+    assert (second["status"], second["rows_processed"]) == ("failed", 0)
+    assert "未执行" in second["detail"]
+
+    assert db.query(models.School).count() == 2
+    assert not os.path.exists(running.path) and not os.path.exists(queued.path)
+
+def test_jobs_complete_normally_before_shutdown(session_factory, db, tmp_path):
+    user = crud.create_user(db, "owner@example.com", "x")
+    service = IngestService(session_factory, chunk_size=2)
+    job = service.submit(user.id, "schools", "a.csv", _csv(tmp_path, "a", 5))
+    service._executor.submit(lambda: None).result(10)
+    service.shutdown()
+
+    record = service.get(user.id, job.id)
+    assert (record["status"], record["rows_processed"], record["inserted"]) == ("completed", 5, 5)
+
+def _import(session_factory, user_id: int, kind: str, path: str) -> dict:
+    service = IngestService(session_factory, chunk_size=10)
+    job = service.submit(user_id, kind, os.path.basename(path), path)
+    service.shutdown()
+    return service.get(user_id, job.id)
+
+def test_partial_sheet_keeps_columns_it_does_not_provide(session_factory, db, tmp_path):
+    user = crud.create_user(db, "owner@example.com", "x")
+    mit = crud.create_school(db, user.id, schemas.SchoolCreate(
+        name="MIT", department="EECS", location="Cambridge", website="https://mit.edu", notes="保底",
+    ))
+    path = tmp_path / "deadlines.csv"
+    path.write_text(
+        "name,department,location,application_deadline\n"
+        "MIT,EECS,,2026-12-01T00:00:00\n"
+        "Stanford,CS,Palo Alto,\n",
+        encoding="utf-8",
+    )
+
+    record = _import(session_factory, user.id, "schools", str(path))
+    assert (record["status"], record["inserted"], record["updated"]) == ("completed", 1, 1)
+
+    db.expire_all()
+    school = db.get(models.School, mit.id)
+    assert (school.location, school.website, school.notes) == ("Cambridge", "https://mit.edu", "保底")
+    assert school.application_deadline == datetime(2026, 12, 1)
+    stanford = db.query(models.School).filter(models.School.name == "Stanford").one()
+    assert (stanford.location, stanford.application_deadline) == ("Palo Alto", None)
+
+def test_partial_professor_sheet_keeps_other_columns(session_factory, db, tmp_path):
+    user = crud.create_user(db, "owner@example.com", "x")
+    professor = crud.create_professor(db, user.id, schemas.ProfessorCreate(
+        name="Wang", email="wang@uni.edu", research_area="机器人", notes="已联系",
+    ))
+    path = tmp_path / "professors.csv"
+    path.write_text("name,email,website\nWang,wang@uni.edu,https://wang.uni.edu\n", encoding="utf-8")
+
+    record = _import(session_factory, user.id, "professors", str(path))
+    assert (record["status"], record["updated"]) == ("completed", 1)
+
+    db.expire_all()
+    professor = db.get(models.Professor, professor.id)
+    assert (professor.research_area, professor.notes, professor.website) == ("机器人", "已联系", "https://wang.uni.edu")
@@ -0,0 +1,35 @@
+from .conftest import register
+
+def _get(client, headers, **extra):
+    return client.get("/schools/", headers={**headers, **extra})
+
+def _revalidate(client, headers, accept_encoding: str) -> tuple:
+    first = _get(client, headers, **{"Accept-Encoding": accept_encoding})
+    assert first.status_code == 200, first.text
+    second = _get(client, headers, **{"Accept-Encoding": accept_encoding, "If-None-Match": first.headers["etag"]})
+    assert second.status_code == 304
+    return first, second
+
+def test_uncompressed_responses_vary_on_accept_encoding(client):
+    headers = register(client)
+    client.post("/schools/", json={"name": "MIT"}, headers=headers)
+
+    # 接受gzip但响应体小于压缩阈值时不压缩，ETag形式仍按Accept-Encoding决定
+    for accept_encoding, weak in (("identity", False), ("gzip", True)):
+        first, second = _revalidate(client, headers, accept_encoding)
+        assert "content-encoding" not in first.headers
+        assert first.headers["etag"].startswith("W/") == weak
+        assert second.headers["etag"] == first.headers["etag"]
+        for response in (first, second):
+            assert "Accept-Encoding" in response.headers["vary"]
+
+def test_not_modified_repeats_the_compressed_etag(client):
+    headers = register(client)
+    for i in range(30):
+        client.post("/schools/", json={"name": f"School {i}", "notes": "x" * 50}, headers=headers)
+
+    first, second = _revalidate(client, headers, "gzip")
+    assert first.headers["content-encoding"] == "gzip"
+    assert first.headers["etag"].startswith("W/")
+    assert second.headers["etag"] == first.headers["etag"]
+    assert "Accept-Encoding" in second.headers["vary"]
@@ -0,0 +1,4 @@
+def test_metrics_route_is_registered_on_new_apps(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
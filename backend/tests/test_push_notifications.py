@@ -0,0 +1,145 @@
+import asyncio
+import threading
+from typing import Dict, List
+
+import pytest
+
+from backend.models import models, schemas
+from backend.services import crud
+from backend.services.notification_service import LocalPushProvider, MobileNotificationService
+
+class _TrackingProvider(LocalPushProvider):
+    """记录每批大小、同时在途的批次数和调用所在线程的模拟推送服务"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batch_sizes: List[int] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_batch(self, tokens: List[str], title: str, message: str) -> Dict[str, str]:
+        self.batch_sizes.append(len(tokens))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await super().send_batch(tokens, title, message)
+        finally:
+            self.in_flight -= 1
+
+def _user(db, email: str) -> int:
+    return crud.create_user(db, email=email, hashed_password="x").id
+
+def _devices(db, user_id: int, prefix: str, count: int) -> List[str]:
+    tokens = [f"{prefix}-{i}" for i in range(count)]
+    for token in tokens:
+        crud.register_device(db, user_id, schemas.DeviceCreate(token=token, type="ios"))
+    return tokens
+
+def _broadcast(service: MobileNotificationService, db, user_id: int, **kwargs):
+    return asyncio.run(service.broadcast(user_id, title="t", message="m", db=db, **kwargs))
+
+def test_tokens_are_split_into_provider_sized_batches(db):
+    user_id = _user(db, "a@example.com")
+    _devices(db, user_id, "a", 25)
+    provider = _TrackingProvider(max_batch_size=10)
+    result = _broadcast(MobileNotificationService(provider=provider), db, user_id)
+    assert sorted(provider.batch_sizes) == [5, 10, 10]
+    assert result["sent_to"] == 25
+    assert result["success"]
+
+def test_in_flight_batches_are_bounded(db):
+    user_id = _user(db, "a@example.com")
+    _devices(db, user_id, "a", 40)
+    provider = _TrackingProvider(max_batch_size=4, latency=0.01)
+    result = _broadcast(MobileNotificationService(provider=provider, max_concurrency=3), db, user_id)
+    assert len(provider.batch_sizes) == 10
+    assert provider.max_in_flight == 3
+    assert result["sent_to"] == 40
+
+def test_invalid_tokens_are_pruned(db):
+    user_id = _user(db, "a@example.com")
+    tokens = _devices(db, user_id, "a", 6)
+    provider = LocalPushProvider(max_batch_size=4, invalid_tokens={tokens[1], tokens[4]})
+    result = _broadcast(MobileNotificationService(provider=provider), db, user_id)
+    assert result["sent_to"] == 4
+    assert result["pruned"] == 2
+    assert set(result["failures"]) == {tokens[1], tokens[4]}
+    remaining = {device.token for device in crud.get_devices(db, user_id)}
+    assert remaining == set(tokens) - {tokens[1], tokens[4]}
+
+def test_failures_are_sampled_and_pruned_per_batch(db, monkeypatch):
+    user_id = _user(db, "a@example.com")
+    tokens = _devices(db, user_id, "a", 30)
+    prune_sizes = []
+    delete_devices_by_tokens = crud.delete_devices_by_tokens
+
+    def tracked(db, user_id, tokens):
+        prune_sizes.append(len(tokens))
+        return delete_devices_by_tokens(db, user_id, tokens)
+
+    monkeypatch.setattr(crud, "delete_devices_by_tokens", tracked)
+    provider = LocalPushProvider(max_batch_size=4, invalid_tokens=set(tokens[2:]))
+    service = MobileNotificationService(provider=provider, max_concurrency=2, max_failure_samples=5)
+    result = _broadcast(service, db, user_id)
+
+    assert (result["sent_to"], result["failed"], result["pruned"]) == (2, 28, 28)
+    assert not result["success"]
+    assert len(result["failures"]) == 5 and set(result["failures"]) <= set(tokens[2:])
+    # 失效令牌在发送过程中分多次删除，每次不超过在途批次的令牌数
+    assert len(prune_sizes) > 1 and max(prune_sizes) <= 2 * 4
+    assert sum(prune_sizes) == 28
+    assert {device.token for device in crud.get_devices(db, user_id)} == set(tokens[:2])
+
+def test_only_tokens_owned_by_the_user_are_used(db):
+    alice = _user(db, "a@example.com")
+    bob = _user(db, "b@example.com")
+    alice_tokens = _devices(db, alice, "a", 3)
+    bob_tokens = _devices(db, bob, "b", 2)
+    # bob的令牌即使被提供方报告失效，也不能因为alice的请求被删除
+    provider = _TrackingProvider(max_batch_size=10, invalid_tokens=set(bob_tokens))
+    result = _broadcast(
+        MobileNotificationService(provider=provider), db, alice,
+        device_tokens=alice_tokens[:2] + bob_tokens + ["unknown"],
+    )
+    assert provider.batch_sizes == [2]
+    assert result["sent_to"] == 2
+    assert result["pruned"] == 0
+    assert db.query(models.Device).filter(models.Device.user_id == bob).count() == 2
+
+@pytest.mark.parametrize("explicit_tokens", [False, True])
+def test_database_calls_run_off_the_event_loop(db, monkeypatch, explicit_tokens):
+    user_id = _user(db, "a@example.com")
+    tokens = _devices(db, user_id, "a", 5)
+    threads = set()
+
+    def tracked(func):
+        def wrapper(*args, **kwargs):
+            threads.add(threading.get_ident())
+            return func(*args, **kwargs)
+        return wrapper
+
+    def tracked_iter(func):
+        # 生成器的查询在每次next时执行
+        def wrapper(*args, **kwargs):
+            for batch in func(*args, **kwargs):
+                threads.add(threading.get_ident())
+                yield batch
+        return wrapper
+
+    monkeypatch.setattr(crud, "iter_device_tokens", tracked_iter(crud.iter_device_tokens))
+    for name in ("get_owned_device_tokens", "delete_devices_by_tokens"):
+        monkeypatch.setattr(crud, name, tracked(getattr(crud, name)))
+
+    loop_thread = None
+
+    async def run():
+        nonlocal loop_thread
+        loop_thread = threading.get_ident()
+        provider = LocalPushProvider(max_batch_size=2, invalid_tokens={tokens[0]})
+        return await MobileNotificationService(provider=provider).broadcast(
+            user_id, "t", "m", device_tokens=tokens if explicit_tokens else None, db=db
+        )
+
+    result = asyncio.run(run())
+    assert result["pruned"] == 1
+    assert threads and loop_thread not in threads
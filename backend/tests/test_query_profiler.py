@@ -0,0 +1,34 @@
+import dataclasses
+import json
+
+from fastapi.testclient import TestClient
+
+from backend.app.main import create_app
+from backend.services import crud
+
+from .conftest import register
+
+def test_profile_report_is_written_to_the_profile_log(settings, tmp_path):
+    log = tmp_path / "profile.log"
+    settings = dataclasses.replace(settings, query_profiler_token="profile-me", query_profile_log=str(log))
+    with TestClient(create_app(settings)) as client:
+        headers = register(client)
+        response = client.get("/schools/", headers={**headers, "X-Query-Profile": "profile-me"})
+    assert response.status_code == 200
+    assert int(response.headers["X-Query-Count"]) > 0
+
+    [line] = log.read_text(encoding="utf-8").splitlines()
+    report = json.loads(line.split(" ", 2)[2])
+    assert report["request"] == "GET /schools/"
+    assert report["query_count"] == int(response.headers["X-Query-Count"])
+
+def test_slow_query_log_omits_parameters(settings, tmp_path, db):
+    log = tmp_path / "slow.log"
+    settings = dataclasses.replace(settings, slow_query_ms=0.0, slow_query_log=str(log))
+    with TestClient(create_app(settings)) as client:
+        register(client, "slow@example.com")
+
+    hashed = crud.get_user_by_email(db, "slow@example.com").hashed_password
+    content = log.read_text(encoding="utf-8")
+    assert "INSERT INTO users" in content
+    assert hashed not in content and '"parameters"' not in content
@@ -0,0 +1,49 @@
+import dataclasses
+import uuid
+
+from fastapi.testclient import TestClient
+
+from backend.app.main import create_app
+from .conftest import register
+
+def _limited_client(settings) -> TestClient:
+    return TestClient(create_app(dataclasses.replace(settings, rate_limit_enabled=True)))
+
+def test_login_attempts_are_limited_per_ip(settings):
+    with _limited_client(settings) as client:
+        codes = [
+            client.post("/auth/token", data={"username": "a@example.com", "password": "wrong"}).status_code
+            for _ in range(15)
+        ]
+    assert codes[:10] == [401] * 10
+    assert codes[10:] == [429] * 5
+
+def test_random_bearer_tokens_do_not_get_new_buckets(settings):
+    with _limited_client(settings) as client:
+        codes = [
+            client.post(
+                "/auth/token",
+                data={"username": "a@example.com", "password": "wrong"},
+                headers={"Authorization": f"Bearer {uuid.uuid4()}"},
+            ).status_code
+            for _ in range(30)
+        ]
+    assert 429 in codes
+    assert codes.count(401) == 10
+
+def test_unverified_tokens_share_the_ip_bucket_on_other_routes(settings):
+    with _limited_client(settings) as client:
+        codes = [
+            client.get("/schools/", headers={"Authorization": f"Bearer {uuid.uuid4()}"}).status_code
+            for _ in range(150)
+        ]
+    # 默认规则的突发容量为100
+    assert codes.count(429) >= 40
+
+def test_verified_users_get_their_own_bucket(settings):
+    with _limited_client(settings) as client:
+        alice = register(client)
+        for _ in range(150):
+            client.get("/", headers={"Authorization": f"Bearer {uuid.uuid4()}"})
+        # 同一IP的匿名桶已经耗尽，已登录用户按用户id计数，不受影响
+        assert client.get("/schools/", headers=alice).status_code == 200
@@ -0,0 +1,76 @@
+from sqlalchemy import text
+
+from backend.models import schemas
+from backend.services import crud, search_service
+
+from .conftest import register
+
+def _school(client, headers, name: str, notes: str) -> int:
+    response = client.post("/schools/", json={"name": name, "notes": notes}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+def _search(client, headers, query: str) -> list:
+    response = client.get("/search/local", params={"q": query}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_short_terms_are_ranked(client):
+    headers = register(client)
+    body_once = _school(client, headers, "Tech University", "an ai lab")
+    title_match = _school(client, headers, "AI Institute", "AI and more AI")
+    body_thrice = _school(client, headers, "Other College", "ai, ai and ai")
+
+    results = _search(client, headers, "ai")
+    assert [result["id"] for result in results] == [title_match, body_thrice, body_once]
+    assert [result["score"] for result in results] == [12.0, 3.0, 1.0]
+
+def test_short_terms_rank_earlier_matches_first_on_ties(client):
+    headers = register(client)
+    late = _school(client, headers, "Late", "graduate school of 计算机")
+    early = _school(client, headers, "Early", "计算机 graduate school")
+
+    assert [result["id"] for result in _search(client, headers, "计算")] == [early, late]
+
+def test_snippets_escape_user_text(client):
+    headers = register(client)
+    _school(client, headers, "Unsafe", "<script>alert(1)</script> robotics & <b>vision</b>")
+
+    for query in ("robotics", "ro"):
+        [result] = _search(client, headers, query)
+        snippet = result["snippet"]
+        assert "<script>" not in snippet and "<b>" not in snippet
+        assert "&lt;b&gt;" in snippet and "&amp;" in snippet
+        assert "<mark>ro" in snippet
+
+def test_results_are_limited_to_the_current_user(client):
+    alice = register(client)
+    bob = register(client)
+    alice_school = _school(client, alice, "Robotics Institute", "ai robotics")
+    _school(client, bob, "Robotics Institute", "ai robotics")
+
+    for query in ("robotics", "ai"):
+        assert [result["id"] for result in _search(client, alice, query)] == [alice_school]
+
+def test_queries_do_not_match_the_user_key(client):
+    headers = register(client)
+    _school(client, headers, "Robotics Institute", "notes")
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+
+    assert _search(client, headers, f"u{user_id}u") == []
+
+def test_index_without_user_key_is_rebuilt(session_factory, db):
+    user = crud.create_user(db, "owner@example.com", "x")
+    school = crud.create_school(db, user.id, schemas.SchoolCreate(name="Robotics Institute"))
+    engine = session_factory.kw["bind"]
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {search_service.INDEX_TABLE}"))
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {search_service.INDEX_TABLE} "
+            f"USING fts5(title, body, user_id UNINDEXED, tokenize='trigram')"
+        ))
+
+    assert search_service.ensure_search_index(engine)
+
+    [result] = search_service.search(db, user.id, "robotics")
+    assert (result["type"], result["id"]) == ("school", school.id)